@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     audio_buffer
+   说明：          长音频的磁盘缓冲和分窗转录
+
+   解码后的 float32 波形每小时约 230MB，交给 whisper.transcribe 后还要整段计算梅尔频谱，
+   多个任务同时转录多小时的录音时内存随时长成倍增长。长音频因此：
+   - 由 ffmpeg 直接解码为磁盘上的16位 PCM 文件，用 numpy.memmap 映射，不整段读入内存；
+   - 转录时按窗口（默认10分钟）取出一段换算为 float32 交给模型，窗口边界落在附近最安静的位置，
+     避免把一个字切成两半。
+   这样每个任务常驻的音频数据只有一个窗口，与录音长度无关。
+
+   超过多长的音频使用磁盘缓冲通过环境变量 VIDEO_NOTE_LONG_AUDIO_MINUTES 配置，默认 20 分钟。
+"""
+
+import os
+from typing import Iterator, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+DEFAULT_LONG_AUDIO_MINUTES = 20
+# 长音频每次交给模型的窗口长度
+WINDOW_SECONDS = 10 * 60
+# 在窗口末尾这么长的范围内寻找最安静的位置作为切分点
+CUT_SEARCH_SECONDS = 5
+# 计算音量时每帧的长度
+FRAME_SECONDS = 0.02
+
+
+def long_audio_seconds() -> float:
+    """超过这个时长的音频解码到磁盘文件"""
+    try:
+        minutes = float(os.getenv('VIDEO_NOTE_LONG_AUDIO_MINUTES', DEFAULT_LONG_AUDIO_MINUTES))
+    except ValueError:
+        minutes = DEFAULT_LONG_AUDIO_MINUTES
+    return max(0.0, minutes) * 60
+
+
+def use_disk_buffer(duration: float) -> bool:
+    """是否把音频解码到磁盘文件；时长未知时按长音频处理"""
+    return duration <= 0 or duration >= long_audio_seconds()
+
+
+def open_pcm(path: str) -> np.ndarray:
+    """以只读方式映射16位单声道 PCM 文件"""
+    return np.memmap(path, dtype=np.int16, mode='r')
+
+
+def release(audio: np.ndarray) -> None:
+    """关闭长音频的文件映射，之后不能再访问这段音频
+
+    Windows 上仍在映射中的文件无法删除；只删除引用不一定能及时释放（异常的回溯中可能还引用着），
+    因此清理临时目录前显式关闭。内存中的波形不需要处理。
+
+    关闭后 audio 及其切片仍指向已解除映射的内存，再访问会使进程崩溃，
+    调用方必须随即丢弃对它们的引用。
+    """
+    mapping = getattr(audio, '_mmap', None)
+    if mapping is not None:
+        mapping.close()
+
+
+def to_float(samples: np.ndarray) -> np.ndarray:
+    """把一段采样换算为 whisper 使用的 float32 波形，16位 PCM 的换算与 whisper.load_audio 相同"""
+    if samples.dtype == np.int16:
+        return samples.astype(np.float32) / 32768.0
+    return np.asarray(samples, dtype=np.float32)
+
+
+def _quiet_cut(audio: np.ndarray, target: int, search: int) -> int:
+    """在 [target - search, target) 内找音量最低的一帧，返回该帧的起点"""
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    start = max(0, target - search)
+    count = (target - start) // frame
+    if count <= 1:
+        return target
+    frames = to_float(audio[start:start + count * frame]).reshape(count, frame)
+    energy = np.einsum('ij,ij->i', frames, frames)
+    return start + int(np.argmin(energy)) * frame
+
+
+def iter_windows(audio: np.ndarray, window_seconds: float = WINDOW_SECONDS,
+                 search_seconds: float = CUT_SEARCH_SECONDS) -> Iterator[Tuple[int, int]]:
+    """把音频切成不超过 window_seconds 的窗口，返回各窗口的 (起始采样, 结束采样)"""
+    total = len(audio)
+    window = int(window_seconds * SAMPLE_RATE)
+    search = int(search_seconds * SAMPLE_RATE)
+    start = 0
+    while start < total:
+        end = total if total - start <= window else _quiet_cut(audio, start + window, search)
+        if end <= start:
+            end = min(total, start + window)
+        yield start, end
+        start = end
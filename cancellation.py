@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     cancellation
+   说明：          协作式任务取消
+
+   调用方持有 CancellationToken，调用 cancel() 请求取消；处理流程在各阶段的检查点调用
+   raise_if_cancelled()，并通过 register() 登记取消时需要立即执行的动作
+   （结束 ffmpeg 子进程、关闭进行中的 HTTP 连接等），使正在阻塞的操作尽快返回。
+"""
+
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+
+class JobCancelled(BaseException):
+    """任务已被取消
+
+    继承自 BaseException 而不是 Exception：处理流程中有大量兜底的 except Exception，
+    取消信号不能被这些分支当作普通错误吞掉。
+    """
+
+
+class CancellationToken:
+    """取消令牌，可在多个线程之间共享"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已请求取消"""
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """请求取消，并依次执行已登记的回调；重复调用没有额外效果"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        """已请求取消时抛出 JobCancelled"""
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待最多 timeout 秒，期间被取消则提前返回 True，可用来代替 time.sleep"""
+        return self._event.wait(timeout)
+
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """登记取消时执行的回调，返回用于注销的函数；已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def unregister() -> None:
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return unregister
+        try:
+            callback()
+        except Exception:
+            pass
+        return lambda: None
+
+
+@contextmanager
+def on_cancel(token: CancellationToken, callback: Callable[[], None]):
+    """在 with 块内登记取消回调，离开时自动注销"""
+    unregister = token.register(callback)
+    try:
+        yield
+    finally:
+        unregister()
+
+
+@contextmanager
+def acquire_lock(lock, token: CancellationToken, poll_interval: float = 0.2):
+    """获取锁，等待期间被取消则抛出 JobCancelled"""
+    while not lock.acquire(timeout=poll_interval):
+        token.raise_if_cancelled()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def run_process(cmd: List[str], token: CancellationToken, timeout: Optional[float] = None,
+                **kwargs) -> subprocess.CompletedProcess:
+    """运行子进程并收集输出，取消时立即结束子进程并抛出 JobCancelled
+
+    参数与 subprocess.run(capture_output=True) 相同，额外的关键字参数透传给 Popen。
+    """
+    token.raise_if_cancelled()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+    with on_cancel(token, process.kill):
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+    token.raise_if_cancelled()
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
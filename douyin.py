@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     douyin
+   说明：          抖音备用下载：从分享页的内嵌数据中提取视频信息和播放地址
+
+   yt-dlp 下载抖音视频经常因为 cookie 失效而失败，这时改用移动端分享页：
+   页面中 window._ROUTER_DATA（分享页）或 RENDER_DATA（网页版）脚本内嵌了视频的
+   标题、作者、时长和播放地址。页面按流式读取，读到这段数据即停止，不下载、不解析整页 DOM。
+"""
+
+import json
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+import httpx
+
+from video_urls import canonical_url, video_key
+
+DOUYIN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_2_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.0.3 Mobile/15E148 Safari/604.1',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.5',
+    'Referer': 'https://www.douyin.com/',
+}
+
+SHARE_PAGE_URL = 'https://www.iesdouyin.com/share/video/{}/'
+
+# 内嵌数据的起始标记，以及数据是否经过 URL 编码
+_DATA_MARKERS = [
+    ('window._ROUTER_DATA = ', False),
+    ('<script id="RENDER_DATA" type="application/json">', True),
+]
+# 读到这么多页面内容仍没有找到数据就放弃
+MAX_PAGE_CHARS = 4 * 1024 * 1024
+
+
+class DouyinVideo:
+    """从页面数据中提取的视频信息"""
+
+    def __init__(self, aweme_id: str, title: str, author: str, duration: float, play_urls: List[str]):
+        self.aweme_id = aweme_id
+        self.title = title
+        self.author = author
+        self.duration = duration
+        self.play_urls = play_urls
+
+
+def create_client() -> httpx.Client:
+    """创建抖音下载使用的连接池，可在多个任务、多个线程之间共享"""
+    return httpx.Client(
+        headers=DOUYIN_HEADERS,
+        follow_redirects=True,
+        verify=False,
+        timeout=httpx.Timeout(30, connect=10),
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+    )
+
+
+def read_page_data(client: httpx.Client, url: str) -> Optional[Dict]:
+    """流式读取页面，找到内嵌的 JSON 数据后立即停止读取并返回解析结果"""
+    buffer = ''
+    chars_read = 0
+    with client.stream('GET', url) as response:
+        response.raise_for_status()
+        start = marker = None
+        for text in response.iter_text():
+            chars_read += len(text)
+            if chars_read > MAX_PAGE_CHARS:
+                return None
+            scan_from = max(0, len(buffer) - 64)
+            buffer += text
+            if start is None:
+                for candidate, encoded in _DATA_MARKERS:
+                    index = buffer.find(candidate, scan_from)
+                    if index >= 0:
+                        start, marker = index + len(candidate), (candidate, encoded)
+                        break
+                else:
+                    # 只保留末尾一小段，用于匹配跨块的起始标记
+                    buffer = buffer[-64:]
+                    continue
+            end = buffer.find('</script>', start)
+            if end < 0:
+                continue
+            payload = buffer[start:end].strip().rstrip(';')
+            if marker[1]:
+                payload = unquote(payload)
+            try:
+                return json.loads(payload)
+            except ValueError:
+                return None
+    return None
+
+
+def find_aweme(data) -> Optional[Dict]:
+    """在页面数据中查找视频条目：同时带有 desc 和 video 字段的对象"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get('video'), dict) and 'desc' in node:
+                return node
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return None
+
+
+def _play_urls(video: Dict) -> List[str]:
+    """提取播放地址，分享页的带水印地址（playwm）换成无水印地址"""
+    urls = []
+    play_addr = video.get('play_addr') or video.get('playAddr') or {}
+    if isinstance(play_addr, dict):
+        urls.extend(play_addr.get('url_list') or [])
+    elif isinstance(play_addr, list):
+        urls.extend(item.get('src') for item in play_addr if isinstance(item, dict) and item.get('src'))
+    if video.get('playApi'):
+        urls.append(video['playApi'])
+    result = []
+    for url in urls:
+        url = url.replace('/playwm/', '/play/')
+        if url.startswith('//'):
+            url = 'https:' + url
+        if url not in result:
+            result.append(url)
+    return result
+
+
+def _parse_aweme(aweme: Dict, aweme_id: str) -> Optional[DouyinVideo]:
+    video = aweme['video']
+    play_urls = _play_urls(video)
+    if not play_urls:
+        return None
+    author = aweme.get('author') or aweme.get('authorInfo') or {}
+    # 页面数据中的时长单位为毫秒
+    duration = (video.get('duration') or aweme.get('duration') or 0) / 1000
+    return DouyinVideo(
+        aweme_id=str(aweme.get('aweme_id') or aweme.get('awemeId') or aweme_id),
+        title=aweme.get('desc') or f'抖音视频 {aweme_id}',
+        author=author.get('nickname') or '未知作者',
+        duration=duration,
+        play_urls=play_urls,
+    )
+
+
+def resolve_aweme_id(client: httpx.Client, url: str) -> str:
+    """获取视频 ID，短链接请求一次跟随跳转后再解析"""
+    key = video_key(url)
+    if key is None:
+        with client.stream('GET', url) as response:
+            key = video_key(str(response.url))
+    if key is None or key[0] != 'douyin':
+        raise ValueError(f"不支持的抖音链接: {url}")
+    return key[1]
+
+
+def fetch_video(client: httpx.Client, url: str) -> DouyinVideo:
+    """获取抖音视频的信息和播放地址，先尝试移动端分享页，再尝试网页版"""
+    aweme_id = resolve_aweme_id(client, url)
+    for page_url in (SHARE_PAGE_URL.format(aweme_id), canonical_url(('douyin', aweme_id, 1))):
+        data = read_page_data(client, page_url)
+        aweme = find_aweme(data) if data else None
+        video = _parse_aweme(aweme, aweme_id) if aweme else None
+        if video is not None:
+            return video
+    raise ValueError("未在页面数据中找到视频地址")
+
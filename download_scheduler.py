@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     download_scheduler
+   说明：          按平台限制并发下载数，并在多个 cookie 之间轮换
+
+   同时处理多个任务时，对同一平台的并发下载过多、或者全部使用同一个账号的 cookie，
+   很容易触发限流甚至封号。这里：
+   - 限制每个平台同时进行的下载数。并行处理时每个任务在独立的 worker 进程中运行，
+     因此下载名额除了进程内的信号量，还用 cookie 目录下的一组锁文件（见 file_locks.py）实现，
+     同一台机器上的所有进程合计不超过上限；
+   - 每个平台可以配置多个 cookie 文件，按失败率和使用量挑选，被限流或在多个不同视频上
+     鉴权失败的 cookie 暂停使用一段时间；平台最后一个可用的 cookie 不会被暂停。
+     使用统计只在进程内累计，条件相同的 cookie 随机挑选，各 worker 进程不会都从第一个开始用。
+
+   cookie 文件放在 cookies 目录下：
+       cookies/bilibili_cookies.txt        （原有的单个 cookie 文件）
+       cookies/bilibili_cookies_2.txt      （同一平台的更多 cookie 文件）
+       cookies/bilibili/*.txt              （也可以放在以平台命名的子目录中）
+   并发上限通过环境变量 VIDEO_NOTE_PLATFORM_LIMITS 配置，如 "youtube=3,bilibili=2,douyin=1"。
+"""
+
+import glob
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+from cancellation import CancellationToken, acquire_lock
+from file_locks import lock_any
+from retry import ERROR_AUTH, ERROR_RATE_LIMIT, classify_error
+
+DEFAULT_PLATFORM_LIMITS = {'youtube': 3, 'bilibili': 2, 'douyin': 2}
+DEFAULT_LIMIT = 2
+
+# 出错后 cookie 暂停使用的时长（秒）
+COOKIE_COOLDOWNS = {
+    ERROR_AUTH: 30 * 60,
+    ERROR_RATE_LIMIT: 5 * 60,
+}
+# 各平台下载名额的锁文件放在 cookie 目录的这个子目录中
+SLOT_DIR_NAME = '.download_slots'
+# 鉴权错误常常只与单个视频有关（年龄确认、会员专享等），
+# 连续在这么多个不同的视频上鉴权失败才认为 cookie 本身失效
+AUTH_FAILURE_VIDEOS = 2
+
+
+def platform_limits() -> Dict[str, int]:
+    """读取各平台的并发下载上限"""
+    limits = dict(DEFAULT_PLATFORM_LIMITS)
+    for item in os.getenv('VIDEO_NOTE_PLATFORM_LIMITS', '').split(','):
+        platform, _, value = item.partition('=')
+        if platform.strip() and value.strip().isdigit():
+            limits[platform.strip()] = max(1, int(value))
+    return limits
+
+
+def discover_cookie_files(cookie_dir: str, platform: str) -> List[str]:
+    """查找平台的所有 cookie 文件"""
+    files = sorted(glob.glob(os.path.join(cookie_dir, f'{platform}_cookies*.txt')))
+    files += sorted(glob.glob(os.path.join(cookie_dir, platform, '*.txt')))
+    return files
+
+
+class _CookieStats:
+    def __init__(self, path: str):
+        self.path = path
+        self.uses = 0
+        self.failures = 0
+        self.in_use = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+        # 上次成功以来鉴权失败的视频
+        self.auth_failed_videos: Set[str] = set()
+        # 其余条件相同时按这个随机值挑选
+        self.tie_break = random.random()
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.uses if self.uses else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'path': self.path,
+            'uses': self.uses,
+            'failures': self.failures,
+            'failure_rate': round(self.failure_rate, 3),
+            'in_use': self.in_use,
+            'cooling_down': self.cooldown_until > time.time(),
+            'last_error': self.last_error,
+        }
+
+
+class CookiePool:
+    """一个平台的 cookie 文件池"""
+
+    def __init__(self, platform: str, files: List[str]):
+        self.platform = platform
+        self._lock = threading.Lock()
+        self._cookies = [_CookieStats(path) for path in files]
+
+    def __len__(self) -> int:
+        return len(self._cookies)
+
+    def _available(self) -> List[_CookieStats]:
+        now = time.time()
+        return [cookie for cookie in self._cookies
+                if cookie.cooldown_until <= now and os.path.exists(cookie.path)]
+
+    def _pick(self) -> Optional[_CookieStats]:
+        """挑选未在冷却中、失败率最低、当前和累计使用最少的 cookie，条件相同时随机挑选"""
+        available = self._available()
+        if not available:
+            return None
+        return min(available, key=lambda cookie: (cookie.failure_rate, cookie.in_use, cookie.uses, cookie.tie_break))
+
+    def _record_failure(self, cookie: _CookieStats, category: str, error: Exception, video: Optional[str]) -> None:
+        """记录一次失败，必要时让 cookie 暂停使用；调用时需持有锁"""
+        cookie.failures += 1
+        cookie.last_error = str(error)[:200]
+        if category == ERROR_AUTH:
+            cookie.auth_failed_videos.add(video or '')
+            if len(cookie.auth_failed_videos) < AUTH_FAILURE_VIDEOS:
+                return
+        # 没有其他可用的 cookie 时不暂停，不带 cookie 下载通常只会更糟
+        if not any(other is not cookie for other in self._available()):
+            return
+        cookie.cooldown_until = time.time() + COOKIE_COOLDOWNS[category]
+        cookie.auth_failed_videos.clear()
+
+    @contextmanager
+    def use(self, video: Optional[str] = None) -> Iterator[Optional[str]]:
+        """借用一个 cookie 文件，with 块内抛出的异常记为该 cookie 的一次失败
+
+        没有可用的 cookie（未配置或都在冷却中）时返回 None，即不带 cookie 下载。
+        只有鉴权失败和限流计入失败率，视频不存在、网络错误等与 cookie 无关。
+        video 为下载的视频（链接），用于区分鉴权失败是否发生在不同的视频上。
+        """
+        with self._lock:
+            cookie = self._pick()
+            if cookie is not None:
+                cookie.in_use += 1
+                cookie.uses += 1
+        try:
+            yield cookie.path if cookie else None
+        except Exception as e:
+            if cookie is not None:
+                category = classify_error(e)
+                if category in COOKIE_COOLDOWNS:
+                    with self._lock:
+                        self._record_failure(cookie, category, e, video)
+            raise
+        else:
+            if cookie is not None:
+                with self._lock:
+                    cookie.auth_failed_videos.clear()
+        finally:
+            if cookie is not None:
+                with self._lock:
+                    cookie.in_use -= 1
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [cookie.to_dict() for cookie in self._cookies]
+
+
+class PlatformScheduler:
+    """按平台限制同时进行的下载数，并管理各平台的 cookie 池
+
+    shared 为 True（默认）时下载名额在使用同一 cookie 目录的所有进程之间共享，否则只限制本进程。
+    """
+
+    def __init__(self, cookie_dir: str, limits: Optional[Dict[str, int]] = None, shared: bool = True):
+        self.cookie_dir = cookie_dir
+        self.limits = limits if limits is not None else platform_limits()
+        self.slot_dir = os.path.join(cookie_dir, SLOT_DIR_NAME) if shared else None
+        if self.slot_dir is not None:
+            os.makedirs(self.slot_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._pools: Dict[str, CookiePool] = {}
+
+    def _semaphore(self, platform: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if platform not in self._semaphores:
+                self._semaphores[platform] = threading.BoundedSemaphore(self.limit(platform))
+            return self._semaphores[platform]
+
+    def cookie_pool(self, platform: str) -> CookiePool:
+        """平台的 cookie 池，首次使用时扫描 cookie 目录"""
+        with self._lock:
+            if platform not in self._pools:
+                self._pools[platform] = CookiePool(platform, discover_cookie_files(self.cookie_dir, platform))
+            return self._pools[platform]
+
+    def limit(self, platform: str) -> int:
+        return self.limits.get(platform, DEFAULT_LIMIT)
+
+    @contextmanager
+    def slot(self, platform: str, token: CancellationToken) -> Iterator[None]:
+        """占用平台的一个下载名额，等待期间可以取消"""
+        with acquire_lock(self._semaphore(platform), token):
+            if self.slot_dir is None:
+                yield
+                return
+            # 第 i 个名额对应一个锁文件，持有任意一个即占用了一个名额
+            paths = [os.path.join(self.slot_dir, f'{platform}-{index}.lock') for index in range(self.limit(platform))]
+            with lock_any(paths, token):
+                yield
+
+    def stats(self) -> Dict[str, List[Dict]]:
+        """各平台 cookie 的使用统计"""
+        with self._lock:
+            pools = dict(self._pools)
+        return {platform: pool.stats() for platform, pool in pools.items()}
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     downloads
+   说明：          多连接、可续传的视频下载
+
+   - yt-dlp 下载 DASH/HLS 时并发下载多个分片，并把未完成的 .part 文件放在下载缓存中；
+   - 直链 MP4（抖音备用下载等）按 HTTP Range 拆成多段，用多个连接同时下载；
+   - 未完成的下载保留在缓存目录，连同分段进度一起记录，中断后重新下载时从断点继续，
+     而不是随任务临时目录一起删除、从零开始；
+   - 同一视频的缓存条目同时只由一个下载使用（文件锁，见 file_locks.py，跨进程有效），
+     重复提交的任务不会写同一个 .part 文件，也不会删掉别人正在下载的条目。
+
+   连接数通过环境变量 VIDEO_NOTE_DOWNLOAD_CONNECTIONS 配置，默认 4。
+"""
+
+import contextvars
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from cancellation import CancellationToken
+from file_locks import POLL_INTERVAL, lock_file
+from video_urls import video_key
+
+DEFAULT_CONNECTIONS = 4
+# 每段至少 4MB，小文件不值得拆分
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+# 分段进度每写入这么多数据保存一次
+STATE_SAVE_INTERVAL = 8 * 1024 * 1024
+# 超过这个时间没有再访问的缓存条目会被清理
+CACHE_MAX_AGE = 7 * 24 * 3600
+
+
+def download_connections() -> int:
+    """每个下载使用的连接数（分片并发数）"""
+    try:
+        return max(1, int(os.getenv('VIDEO_NOTE_DOWNLOAD_CONNECTIONS', DEFAULT_CONNECTIONS)))
+    except ValueError:
+        return DEFAULT_CONNECTIONS
+
+
+def aria2c_available() -> bool:
+    """是否安装了 aria2c，yt-dlp 可以用它多连接下载直链格式"""
+    return shutil.which('aria2c') is not None
+
+
+class DownloadCache:
+    """未完成下载的缓存目录，每个视频一个子目录
+
+    子目录名由视频的 (平台, ID, 分P) 决定，同一视频的不同链接写法共用断点。
+    使用条目（下载、discard）前先用 lock() 独占它；锁文件放在子目录旁边，删除条目时不受影响。
+    """
+
+    def __init__(self, root: str, max_age: float = CACHE_MAX_AGE):
+        self.root = root
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _entry_name(url: str) -> str:
+        key = video_key(url)
+        if key is not None:
+            return f"{key[0]}-{key[1]}-p{key[2]}"
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+    def lock(self, url: str, token: Optional[CancellationToken] = None,
+             poll_interval: float = POLL_INTERVAL):
+        """在 with 块内独占视频的缓存条目，其他任务（包括其他进程）使用同一条目时等待
+
+        等待期间被取消则抛出 JobCancelled。
+        """
+        path = os.path.join(self.root, self._entry_name(url) + '.lock')
+        # 更新访问时间，避免正在等待的锁文件被 prune 当作过期条目删除
+        if os.path.exists(path):
+            os.utime(path)
+        return lock_file(path, token, poll_interval)
+
+    def entry_dir(self, url: str) -> str:
+        """返回视频对应的缓存子目录，不存在时创建"""
+        path = os.path.join(self.root, self._entry_name(url))
+        os.makedirs(path, exist_ok=True)
+        # 更新访问时间，避免正在使用的条目被清理
+        os.utime(path)
+        return path
+
+    def discard(self, url: str) -> None:
+        """下载完成后删除视频的缓存子目录"""
+        shutil.rmtree(self.entry_dir(url), ignore_errors=True)
+
+    def prune(self) -> None:
+        """删除长时间未访问的缓存条目"""
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+            except OSError:
+                continue
+
+
+class _Segment:
+    """一个下载分段，end 为闭区间的结束位置"""
+
+    def __init__(self, start: int, end: int, done: int = 0):
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.start + 1 - self.done
+
+
+class RangeDownload:
+    """把一个 URL 下载到本地文件，服务器支持 Range 时分段并发下载并支持续传
+
+    下载过程中数据写入 path + '.part'，分段进度保存在 path + '.part.json'，
+    完成后重命名为 path。续传时要求文件大小和 ETag 与上次一致，否则从头开始。
+    """
+
+    def __init__(self, client: httpx.Client, url: str, path: str,
+                 token: Optional[CancellationToken] = None, connections: Optional[int] = None,
+                 headers: Optional[Dict[str, str]] = None,
+                 on_progress: Optional[Callable[[int, Optional[int]], None]] = None):
+        self.client = client
+        self.url = url
+        self.path = path
+        self.part_path = path + '.part'
+        self.state_path = path + '.part.json'
+        self.token = token or CancellationToken()
+        self.connections = connections or download_connections()
+        self.headers = dict(headers or {})
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._size: Optional[int] = None
+        self._etag: Optional[str] = None
+        self._unsaved = 0
+
+    def run(self) -> str:
+        """执行下载，返回文件路径；失败时抛出 httpx.HTTPError 等异常，已下载的部分保留"""
+        self.token.raise_if_cancelled()
+        if os.path.exists(self.path):
+            return self.path
+        if not self._probe():
+            self._download_single()
+        else:
+            self._load_state()
+            self._preallocate()
+            try:
+                pending = [segment for segment in self._segments if segment.remaining > 0]
+                if pending:
+                    with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='range-download') as executor:
+                        # 每个分段在调用方上下文的副本中运行，进度回调能找到所属任务
+                        futures = [executor.submit(contextvars.copy_context().run, self._download_segment, segment)
+                                   for segment in pending]
+                        for future in futures:
+                            future.result()
+            finally:
+                self._save_state()
+            # .part 文件预先分配了完整大小，只能根据分段进度判断是否下载完整
+            if self._downloaded() != self._size:
+                raise IOError(f"下载不完整: {self._downloaded()} / {self._size} 字节")
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return self.path
+
+    def _probe(self) -> bool:
+        """请求第一个字节，判断服务器是否支持 Range 并获取文件大小和 ETag"""
+        headers = dict(self.headers, Range='bytes=0-0')
+        with self.client.stream('GET', self.url, headers=headers) as response:
+            response.raise_for_status()
+            self._etag = response.headers.get('etag')
+            content_range = response.headers.get('content-range', '')
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                if total.isdigit() and int(total) > 0:
+                    self._size = int(total)
+                    return True
+            length = response.headers.get('content-length')
+            self._size = int(length) if length and length.isdigit() else None
+            return False
+
+    def _load_state(self) -> None:
+        """读取上次的分段进度，文件已变化或没有记录时重新分段"""
+        if os.path.exists(self.state_path) and os.path.exists(self.part_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('size') == self._size and state.get('etag') == self._etag:
+                    self._segments = [_Segment(*segment) for segment in state['segments']]
+                    return
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        count = max(1, min(self.connections, math.ceil(self._size / MIN_SEGMENT_SIZE)))
+        step = math.ceil(self._size / count)
+        self._segments = [_Segment(start, min(start + step, self._size) - 1)
+                          for start in range(0, self._size, step)]
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+    def _preallocate(self) -> None:
+        with open(self.part_path, 'ab') as f:
+            f.truncate(self._size)
+
+    def _save_state(self) -> None:
+        with self._lock:
+            state = {
+                'url': self.url,
+                'size': self._size,
+                'etag': self._etag,
+                'segments': [[segment.start, segment.end, segment.done] for segment in self._segments],
+            }
+            self._unsaved = 0
+            partial_path = self.state_path + '.tmp'
+            with open(partial_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(partial_path, self.state_path)
+
+    def _downloaded(self) -> int:
+        return sum(segment.done for segment in self._segments)
+
+    def _download_segment(self, segment: _Segment) -> None:
+        headers = dict(self.headers, Range=f"bytes={segment.start + segment.done}-{segment.end}")
+        with self.client.stream('GET', self.url, headers=headers) as response:
+            if response.status_code != 206:
+                raise httpx.HTTPStatusError(f"分段下载失败: HTTP {response.status_code}",
+                                            request=response.request, response=response)
+            # 不经过缓冲直接写入，保存的分段进度不会超过实际写入的数据
+            with open(self.part_path, 'r+b', buffering=0) as f:
+                f.seek(segment.start + segment.done)
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    self.token.raise_if_cancelled()
+                    chunk = chunk[:segment.remaining]
+                    f.write(chunk)
+                    with self._lock:
+                        segment.done += len(chunk)
+                        self._unsaved += len(chunk)
+                        save = self._unsaved >= STATE_SAVE_INTERVAL
+                    if save:
+                        self._save_state()
+                    if self.on_progress is not None:
+                        self.on_progress(self._downloaded(), self._size)
+                    if segment.remaining <= 0:
+                        break
+        if segment.remaining > 0:
+            raise httpx.ReadError(f"分段下载中断: 还差 {segment.remaining} 字节")
+
+    def _download_single(self) -> None:
+        """服务器不支持 Range 时单连接下载，无法续传"""
+        done = 0
+        with self.client.stream('GET', self.url, headers=self.headers) as response:
+            response.raise_for_status()
+            with open(self.part_path, 'wb') as f:
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    self.token.raise_if_cancelled()
+                    f.write(chunk)
+                    done += len(chunk)
+                    if self.on_progress is not None:
+                        self.on_progress(done, self._size)
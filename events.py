@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     events
+   说明：          处理进度事件总线
+
+   VideoNoteGenerator 在处理过程中发布带类型的进度事件，GUI、命令行等调用方
+   通过订阅事件总线获取日志、进度和流式生成的文本，不再依赖截获 print 输出。
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# 事件类型
+EVENT_LOG = 'log'            # 普通日志
+EVENT_PROGRESS = 'progress'  # 进度更新
+EVENT_TOKEN = 'token'        # 流式生成的文本
+EVENT_TOKEN_RESET = 'token_reset'  # 丢弃此前推送的流式文本（改用其他方式重新生成）
+EVENT_RESULT = 'result'      # 任务结束
+
+# 处理阶段
+STAGE_JOB = 'job'
+STAGE_DOWNLOAD = 'download'
+STAGE_TRANSCRIBE = 'transcribe'
+STAGE_ORGANIZE = 'organize'
+STAGE_XIAOHONGSHU = 'xiaohongshu'
+STAGE_IMAGES = 'images'
+
+# 日志级别
+LEVEL_INFO = 'info'
+LEVEL_SUCCESS = 'success'
+LEVEL_WARNING = 'warning'
+LEVEL_ERROR = 'error'
+
+
+class ProgressEvent:
+    """一条处理进度事件"""
+
+    __slots__ = ('job_id', 'kind', 'stage', 'message', 'level', 'percent',
+                 'bytes_done', 'bytes_total', 'eta', 'payload', 'timestamp')
+
+    def __init__(self, job_id: str, kind: str, stage: str, message: str = '', level: str = LEVEL_INFO,
+                 percent: Optional[float] = None, bytes_done: Optional[int] = None,
+                 bytes_total: Optional[int] = None, eta: Optional[float] = None, payload=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.stage = stage
+        self.message = message
+        self.level = level
+        self.percent = percent
+        self.bytes_done = bytes_done
+        self.bytes_total = bytes_total
+        self.eta = eta
+        self.payload = payload
+        self.timestamp = time.time()
+
+    def to_dict(self) -> Dict:
+        """导出为可序列化的字典"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ProgressEvent':
+        """从 to_dict 的结果还原事件"""
+        event = cls(data['job_id'], data['kind'], data['stage'])
+        for field in cls.__slots__:
+            if field in data:
+                setattr(event, field, data[field])
+        return event
+
+
+class EventBus:
+    """线程安全的事件总线，发布者所在线程直接回调所有订阅者"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[ProgressEvent], None]] = []
+
+    def subscribe(self, callback: Callable[[ProgressEvent], None]) -> Callable[[], None]:
+        """订阅事件，返回用于取消订阅的函数"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def publish(self, event: ProgressEvent) -> None:
+        """发布事件，单个订阅者出错不会影响其他订阅者和发布者"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                pass
+
+
+class EventBuffer:
+    """缓存事件，供界面线程定时批量取出
+
+    订阅回调只做一次加锁追加，发布者线程几乎没有额外开销；
+    界面线程按固定间隔调用 drain，一次处理一批事件。
+    """
+
+    def __init__(self, job_id: Optional[str] = None):
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._events = deque()
+
+    def __call__(self, event: ProgressEvent) -> None:
+        if self.job_id is not None and event.job_id != self.job_id:
+            return
+        with self._lock:
+            self._events.append(event)
+
+    def drain(self) -> List[ProgressEvent]:
+        """取出当前缓存的全部事件，并把相邻的流式文本合并为一条"""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+
+        merged: List[ProgressEvent] = []
+        for event in events:
+            previous = merged[-1] if merged else None
+            if event.kind != EVENT_TOKEN:
+                merged.append(event)
+            elif (previous is not None and previous.kind == EVENT_TOKEN
+                    and previous.job_id == event.job_id):
+                previous.payload += event.payload
+            else:
+                # 复制一份再合并，事件对象可能同时被其他订阅者持有
+                merged.append(ProgressEvent(event.job_id, EVENT_TOKEN, event.stage, payload=event.payload))
+        return merged
+
+
+# 各阶段在总进度中所占的权重，大致对应一般视频中各阶段的耗时比例
+STAGE_WEIGHTS = {
+    STAGE_DOWNLOAD: 0.2,
+    STAGE_TRANSCRIBE: 0.5,
+    STAGE_ORGANIZE: 0.2,
+    STAGE_XIAOHONGSHU: 0.1,
+}
+
+# 阶段的中文名称，用于界面和命令行显示
+STAGE_NAMES = {
+    STAGE_JOB: '准备',
+    STAGE_DOWNLOAD: '下载',
+    STAGE_TRANSCRIBE: '转录',
+    STAGE_ORGANIZE: '整理',
+    STAGE_XIAOHONGSHU: '小红书',
+    STAGE_IMAGES: '配图',
+}
+
+
+class ProgressTracker:
+    """把各阶段的进度按权重汇总为总进度，并估算剩余时间"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, min_interval: float = 0.2):
+        self.weights = dict(weights or STAGE_WEIGHTS)
+        self.fractions = {stage: 0.0 for stage in self.weights}
+        self.min_interval = min_interval
+        self._started = time.monotonic()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, stage: str) -> None:
+        """进入某个阶段，排在它之前的阶段一律视为已完成"""
+        if stage not in self.weights:
+            return
+        with self._lock:
+            for name in self.weights:
+                if name == stage:
+                    break
+                self.fractions[name] = 1.0
+
+    def update(self, stage: str, fraction: float) -> None:
+        """更新某个阶段的完成比例（0-1），进度只增不减"""
+        if stage not in self.weights:
+            return
+        fraction = min(max(fraction, 0.0), 1.0)
+        with self._lock:
+            self.fractions[stage] = max(self.fractions[stage], fraction)
+
+    def finish(self) -> None:
+        """所有阶段都已完成"""
+        with self._lock:
+            for stage in self.fractions:
+                self.fractions[stage] = 1.0
+
+    def should_report(self, force: bool = False) -> bool:
+        """限制进度事件的发布频率"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self.min_interval:
+                return False
+            self._last_report = now
+            return True
+
+    @property
+    def percent(self) -> float:
+        """总进度百分比"""
+        with self._lock:
+            total = sum(self.weights.values()) or 1.0
+            done = sum(self.weights[stage] * self.fractions[stage] for stage in self.weights)
+        return done / total * 100
+
+    @property
+    def eta(self) -> Optional[float]:
+        """按已用时间和总进度估算的剩余秒数，进度太少时无法估算返回 None"""
+        percent = self.percent
+        if percent < 1:
+            return None
+        elapsed = time.monotonic() - self._started
+        return elapsed * (100 - percent) / percent
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """把秒数格式化为 1时2分3秒 的形式"""
+    if seconds is None:
+        return '未知'
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}时{minutes}分{seconds}秒"
+    if minutes:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
+
+
+def format_bytes(size: Optional[float]) -> str:
+    """把字节数格式化为 1.5MB 的形式"""
+    if size is None:
+        return '未知'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{int(size)}B"
+        size /= 1024
+
+
+def describe_progress(event: ProgressEvent) -> str:
+    """生成一行进度描述，如：转录 45% · 总进度 38% · 剩余 3分20秒 · 2.1x"""
+    payload = event.payload or {}
+    parts = [STAGE_NAMES.get(event.stage, event.stage)]
+    if payload.get('stage_percent') is not None:
+        parts[0] += f" {payload['stage_percent']:.0f}%"
+    if event.percent is not None:
+        parts.append(f"总进度 {event.percent:.0f}%")
+    if event.eta is not None:
+        parts.append(f"剩余 {format_duration(event.eta)}")
+    if payload.get('speed'):
+        parts.append(payload['speed'])
+    return ' · '.join(parts)
+
+
+class ConsoleProgressPrinter:
+    """命令行进度输出：阶段切换或进度每增加 step 个百分点打印一行"""
+
+    def __init__(self, step: float = 5.0, stream=None):
+        self.step = step
+        self.stream = stream
+        self._last: Dict[str, tuple] = {}
+
+    def __call__(self, event: ProgressEvent) -> None:
+        if event.kind != EVENT_PROGRESS or event.percent is None:
+            return
+        bucket = (event.stage, int(event.percent // self.step))
+        if self._last.get(event.job_id) == bucket:
+            return
+        self._last[event.job_id] = bucket
+        print(f"⏳ [{event.job_id}] {describe_progress(event)}", file=self.stream or sys.stderr)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     file_locks
+   说明：          跨进程的文件锁
+
+   并行处理时每个任务在独立的 worker 进程中运行（批量处理的 -j、任务队列的 worker），
+   进程内的锁和信号量管不到其他进程。需要多个进程共同遵守的限制（同一视频的下载缓存、
+   各平台的并发下载数）用锁文件实现：
+   - POSIX 上用 flock，Windows 上用 msvcrt.locking；
+   - 锁属于打开的文件，进程崩溃退出时由系统释放，不会留下需要清理的失效锁；
+   - 同一进程内分别打开的锁文件之间同样互斥。
+
+   锁文件只在同一台机器上可靠，不要放在网络文件系统上。
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from cancellation import CancellationToken
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# 等待锁时检查取消的间隔
+POLL_INTERVAL = 0.5
+
+
+def try_lock(fd: int) -> bool:
+    """以不阻塞的方式获取文件的独占锁，已被占用时返回 False"""
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def unlock(fd: int) -> None:
+    if os.name == 'nt':
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _try_lock_any(paths: List[str]) -> Optional[Tuple[int, str]]:
+    for path in paths:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR)
+        if try_lock(fd):
+            return fd, path
+        os.close(fd)
+    return None
+
+
+@contextmanager
+def lock_any(paths: List[str], token: Optional[CancellationToken] = None,
+             poll_interval: float = POLL_INTERVAL) -> Iterator[str]:
+    """在 with 块内持有 paths 中任意一个锁文件，返回持有的路径
+
+    全部被占用时等待，等待期间被取消则抛出 JobCancelled。锁文件不存在时创建。
+    """
+    token = token or CancellationToken()
+    held = _try_lock_any(paths)
+    while held is None:
+        token.raise_if_cancelled()
+        token.wait(poll_interval)
+        held = _try_lock_any(paths)
+    fd, path = held
+    try:
+        token.raise_if_cancelled()
+        yield path
+    finally:
+        try:
+            unlock(fd)
+        finally:
+            os.close(fd)
+
+
+def lock_file(path: str, token: Optional[CancellationToken] = None,
+              poll_interval: float = POLL_INTERVAL):
+    """在 with 块内独占一个锁文件，见 lock_any"""
+    return lock_any([path], token, poll_interval)
@@ -1,6 +1,9 @@
 import sys
 import os
 import re
+import json
+import uuid
+from collections import deque
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -9,10 +12,16 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QTextEdit, QFileDialog, QProgressBar, QComboBox,
                              QFrame, QScrollArea, QGridLayout, QGroupBox,
-                             QSizePolicy, QDialog)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSize
-from PyQt6.QtGui import QPixmap
-from video_note_generator import VideoNoteGenerator
+                             QSizePolicy, QDialog, QCheckBox, QSpinBox, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QAbstractItemView)
+from PyQt6.QtCore import Qt, QProcess, QThread, QThreadPool, QRunnable, QObject, QTimer, pyqtSignal, QSize
+from PyQt6.QtGui import QImage, QPixmap, QTextCursor
+from cancellation import CancellationToken
+from worker import WORKER_SCRIPT
+from video_note_generator import VideoNoteGenerator, extract_urls_from_text, image_cache_name, note_data_path
+from video_urls import dedupe_sources
+from events import (EVENT_LOG, EVENT_PROGRESS, EVENT_RESULT, EVENT_TOKEN, EVENT_TOKEN_RESET, LEVEL_ERROR,
+                    LEVEL_SUCCESS, LEVEL_WARNING, EventBuffer, EventBus, ProgressEvent, describe_progress)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)  # 禁用SSL警告
 
@@ -35,6 +44,18 @@ BUTTON_STYLE = """
     }
 """
 
+# 图片缓存目录：原图按URL的稳定哈希命名，缩略图单独存放，重启后仍可复用
+IMAGE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_images")
+THUMBNAIL_DIR = os.path.join(IMAGE_CACHE_DIR, "thumbnails")
+THUMBNAIL_SIZE = 170
+
+# 日志级别对应的前缀图标
+LEVEL_ICONS = {
+    LEVEL_SUCCESS: '✅ ',
+    LEVEL_WARNING: '⚠️ ',
+    LEVEL_ERROR: '❌ ',
+}
+
 
 class CyberpunkLine(QFrame):
     def __init__(self):
@@ -44,149 +65,376 @@ class CyberpunkLine(QFrame):
         self.setFixedHeight(2)
 
 
-class ImageDownloader(QThread):
-    downloaded = pyqtSignal(str, str)
-    error = pyqtSignal(str)
+class ImageDownloadSignals(QObject):
+    finished = pyqtSignal(str, str)  # 图片URL、本地路径
+    failed = pyqtSignal(str, str)  # 图片URL、错误信息
+
+
+class ImageDownloadTask(QRunnable):
+    """在线程池中下载单张图片，使用下载管理器共享的会话"""
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, session: requests.Session, save_dir: str):
         super().__init__()
         self.url = url
-        self.save_dir = os.path.join(os.path.dirname(__file__), "temp_images")
-        os.makedirs(self.save_dir, exist_ok=True)
+        self.session = session
+        self.save_dir = save_dir
+        self.signals = ImageDownloadSignals()
 
     def run(self):
+        # 按URL的稳定哈希生成文件名，之前下载过的图片直接复用
+        filename = os.path.join(self.save_dir, image_cache_name(self.url))
+        partial_filename = filename + '.part'
         try:
-            # 生成文件名
-            filename = os.path.join(self.save_dir, f"image_{hash(self.url)}.jpg")
-
-            # 配置重试策略
-            retry_strategy = Retry(
-                total=3,  # 总重试次数
-                backoff_factor=1,  # 重试间隔
-                status_forcelist=[500, 502, 503, 504]  # 需要重试的HTTP状态码
-            )
-
-            # 创建会话
-            session = requests.Session()
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-
-            # 设置请求头
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive'
-            }
+            if os.path.exists(filename) and os.path.getsize(filename) > 0:
+                self.signals.finished.emit(self.url, filename)
+                return
 
             # 发送请求
-            response = session.get(
+            response = self.session.get(
                 self.url,
-                headers=headers,
                 verify=False,  # 禁用SSL验证
                 timeout=30,
                 stream=True  # 流式下载
             )
-            response.raise_for_status()
+            with response:
+                response.raise_for_status()
 
-            # 检查内容类型
-            content_type = response.headers.get('content-type', '')
-            if not content_type.startswith('image/'):
-                raise ValueError(f"非图片内容: {content_type}")
+                # 检查内容类型
+                content_type = response.headers.get('content-type', '')
+                if not content_type.startswith('image/'):
+                    raise ValueError(f"非图片内容: {content_type}")
 
-            # 流式写入文件
-            with open(filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+                # 流式写入临时文件，完整下载后再改名，缓存中不会留下半张图片
+                with open(partial_filename, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
 
             # 验证文件
-            if os.path.getsize(filename) == 0:
+            if os.path.getsize(partial_filename) == 0:
                 raise ValueError("下载的文件大小为0")
+            os.replace(partial_filename, filename)
 
-            self.downloaded.emit(filename, self.url)
+            self.signals.finished.emit(self.url, filename)
 
         except requests.exceptions.SSLError as e:
-            error_msg = f"SSL错误: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.error.emit(error_msg)
+            self.signals.failed.emit(self.url, f"SSL错误: {str(e)}")
 
         except requests.exceptions.RequestException as e:
-            error_msg = f"请求错误: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.error.emit(error_msg)
+            self.signals.failed.emit(self.url, f"请求错误: {str(e)}")
 
         except Exception as e:
-            error_msg = f"下载错误: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.error.emit(error_msg)
+            self.signals.failed.emit(self.url, f"下载错误: {str(e)}")
 
         finally:
-            session.close()
+            # 下载中断或失败时删除不完整的文件，之后不会误用
+            if os.path.exists(partial_filename):
+                try:
+                    os.remove(partial_filename)
+                except OSError:
+                    pass
+
+
+class ImageDownloader(QObject):
+    """图片下载管理器
+
+    所有图片在同一个有并发上限的线程池中下载，共用一个带连接池和重试策略的会话；
+    同一URL正在下载时不会重复发起请求，下载完成后只通知一次。
+    """
+    downloaded = pyqtSignal(str, str)  # 本地路径、图片URL
+    error = pyqtSignal(str)
+
+    def __init__(self, max_workers: int = 4, parent=None):
+        super().__init__(parent)
+        self.save_dir = IMAGE_CACHE_DIR
+        os.makedirs(self.save_dir, exist_ok=True)
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        # 正在下载或排队的URL
+        self._pending = set()
+
+        # 配置重试策略
+        retry_strategy = Retry(
+            total=3,  # 总重试次数
+            backoff_factor=1,  # 重试间隔
+            status_forcelist=[500, 502, 503, 504]  # 需要重试的HTTP状态码
+        )
+
+        # 创建共享会话，连接池大小与并发数一致
+        self.session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=max_workers,
+                              pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # 设置请求头
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+
+    def download(self, url: str) -> bool:
+        """开始下载图片，同一URL已在下载中时返回 False"""
+        if url in self._pending:
+            return False
+        self._pending.add(url)
+        task = ImageDownloadTask(url, self.session, self.save_dir)
+        task.signals.finished.connect(self._handle_finished)
+        task.signals.failed.connect(self._handle_failed)
+        self.pool.start(task)
+        return True
+
+    def _handle_finished(self, url: str, filename: str):
+        self._pending.discard(url)
+        self.downloaded.emit(filename, url)
+
+    def _handle_failed(self, url: str, error_message: str):
+        self._pending.discard(url)
+        print(f"Error: {error_message}")
+        self.error.emit(error_message)
+
+    def close(self):
+        """丢弃排队中的下载，等待进行中的下载结束后关闭会话"""
+        self.pool.clear()
+        self.pool.waitForDone(5000)
+        self._pending.clear()
+        self.session.close()
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(int, str, str, QImage)  # 批次、原图路径、图片URL、缩略图
+    failed = pyqtSignal(int, str)  # 批次、原图路径
+
+
+class ThumbnailTask(QRunnable):
+    """在线程池中解码原图并生成缩略图，界面线程只接收缩放后的小图
+
+    缩略图以图片URL的稳定哈希命名保存到 THUMBNAIL_DIR，再次显示同一张图片时
+    直接读取缩略图，不必再解码原图。QImage 可以在非界面线程中使用，QPixmap 不行。
+    """
+
+    def __init__(self, generation: int, image_path: str, url: str, size: int = THUMBNAIL_SIZE):
+        super().__init__()
+        self.generation = generation
+        self.image_path = image_path
+        self.url = url
+        self.size = size
+        self.signals = ThumbnailSignals()
+
+    @staticmethod
+    def thumbnail_path(url: str, size: int = THUMBNAIL_SIZE) -> str:
+        name = os.path.splitext(image_cache_name(url))[0]
+        return os.path.join(THUMBNAIL_DIR, f"{name}_{size}.png")
+
+    def run(self):
+        thumbnail_path = self.thumbnail_path(self.url, self.size)
+        image = QImage(thumbnail_path) if os.path.exists(thumbnail_path) else QImage()
+        if image.isNull():
+            source = QImage(self.image_path)
+            if source.isNull():
+                self.signals.failed.emit(self.generation, self.image_path)
+                return
+            image = source.scaled(
+                self.size, self.size,
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+            os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+            # 先写临时文件再改名，多个任务同时生成同一张缩略图也不会读到半个文件
+            partial_path = f"{thumbnail_path}.{id(self)}.part"
+            if image.save(partial_path, "PNG"):
+                os.replace(partial_path, thumbnail_path)
+        self.signals.loaded.emit(self.generation, self.image_path, self.url, image)
+
+
+class EventBridge(QObject):
+    """把事件总线上的事件按固定间隔批量转发为Qt信号
+
+    事件在工作线程中发布，只追加到缓冲区；界面线程定时取出一批再统一处理，
+    避免每条日志、每段流式文本都单独触发一次界面刷新。
+    """
+    events_ready = pyqtSignal(list)
+
+    def __init__(self, event_bus, job_id: str = None, interval_ms: int = 100, parent=None):
+        super().__init__(parent)
+        self._buffer = EventBuffer(job_id)
+        self._unsubscribe = event_bus.subscribe(self._buffer)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(interval_ms)
+
+    def flush(self):
+        events = self._buffer.drain()
+        if events:
+            self.events_ready.emit(events)
+
+    def close(self):
+        """停止转发，并把剩余事件全部送出"""
+        self._timer.stop()
+        self._unsubscribe()
+        self.flush()
 
 
 class ProcessThread(QThread):
     progress = pyqtSignal(str)  # 用于显示进度日志
-    content_ready = pyqtSignal(str)  # 用于显示API生成的内容
-    finished = pyqtSignal(bool, list)
+    job_finished = pyqtSignal(str, bool, list)  # 任务标识、是否成功、生成的文件
 
-    def __init__(self, generator: VideoNoteGenerator, source: str):
+    def __init__(self, generator: VideoNoteGenerator, source: str, job_id: str):
         super().__init__()
         self.generator = generator
         self.source = source
+        self.job_id = job_id
+        self.cancel_token = CancellationToken()
+
+    def cancel(self):
+        """请求取消任务，处理流程会尽快停止并清理临时文件"""
+        self.cancel_token.cancel()
 
     def run(self):
         try:
-            def print_redirect(msg: str):
-                # 检查是否是API返回的内容
-                if "API返回内容：" in msg:
-                    # 提取API返回的内容部分
-                    content = msg.split("API返回内容：", 1)[1].strip()
-                    self.content_ready.emit(content)
-                    return
-
-                # 处理进度日志
-                if "正在处理视频" in msg:
-                    msg = "📹 " + msg
-                elif "正在转录音频" in msg:
-                    msg = "🎙️ " + msg
-                elif "正在整理长文版本" in msg:
-                    msg = "📝 " + msg
-                elif "正在生成小红书版本" in msg:
-                    msg = "📱 " + msg
-                elif "成功" in msg or "完成" in msg:
-                    msg = "✅ " + msg
-                elif "失败" in msg or "错误" in msg:
-                    msg = "❌ " + msg
-                elif "警告" in msg:
-                    msg = "⚠️ " + msg
-                elif "下载" in msg:
-                    msg = "⬇️ " + msg
-
-                self.progress.emit(str(msg))
-
-            # 保存原始print函数
-            original_print = print
-            import builtins
-            builtins.print = print_redirect
-
-            # 处理视频
-            result_files = self.generator.process_video(self.source)
-
-            # 恢复原始print函数
-            builtins.print = original_print
+            # 处理过程中的日志和流式文本通过事件总线送到界面
+            result_files = self.generator.process_video(
+                self.source, job_id=self.job_id, cancel_token=self.cancel_token
+            )
 
             # 检查处理结果
-            if result_files and len(result_files) == 3:
-                self.finished.emit(True, result_files)
+            if self.cancel_token.cancelled:
+                self.job_finished.emit(self.job_id, False, [])
+            elif result_files and len(result_files) == 3:
+                self.job_finished.emit(self.job_id, True, result_files)
             else:
                 self.progress.emit("⚠️ 未能生成完整的笔记文件")
-                self.finished.emit(False, result_files or [])
+                self.job_finished.emit(self.job_id, False, result_files or [])
 
         except Exception as e:
             self.progress.emit(f"❌ 错误: {str(e)}")
-            self.finished.emit(False, [])
+            self.job_finished.emit(self.job_id, False, [])
+
+
+class WorkerJob:
+    """在 worker 进程中运行的任务，提供与 ProcessThread 相同的 cancel 和 wait 接口"""
+
+    def __init__(self, client: 'WorkerClient', job_id: str):
+        self.client = client
+        self.job_id = job_id
+
+    def cancel(self):
+        self.client.cancel(self.job_id)
+
+    def wait(self, msecs: int = 0) -> bool:
+        # worker 进程在 WorkerClient.close 中统一等待退出
+        return True
+
+
+class WorkerClient(QObject):
+    """通过 QProcess 驱动独立的 worker 进程（见 worker.py）
+
+    worker 发来的事件原样发布到 events 总线，界面照常订阅；
+    worker 意外退出时，其中所有进行中的任务都按失败结束，下次提交任务时自动重启 worker。
+    """
+    job_finished = pyqtSignal(str, bool, list)  # 任务标识、是否成功、生成的文件
+    progress = pyqtSignal(str)  # worker 进程自身的状态日志
+
+    def __init__(self, events: EventBus, parent=None):
+        super().__init__(parent)
+        self.events = events
+        self.process = None
+        self._jobs = set()
+        # 保留最近的标准错误输出，worker 崩溃时显示
+        self._stderr_tail = deque(maxlen=20)
+
+    def _ensure_started(self):
+        if self.process is not None and self.process.state() != QProcess.ProcessState.NotRunning:
+            return
+        self.process = QProcess(self)
+        self.process.readyReadStandardOutput.connect(self._read_output)
+        self.process.readyReadStandardError.connect(self._read_error)
+        self.process.finished.connect(self._handle_process_finished)
+        self.process.start(sys.executable, ['-u', WORKER_SCRIPT])
+        self.progress.emit("🚀 正在启动后台处理进程...")
+
+    def _send(self, message: dict):
+        line = json.dumps(message, ensure_ascii=False) + '\n'
+        self.process.write(line.encode('utf-8'))
+
+    def submit(self, job_id: str, source: str) -> WorkerJob:
+        """提交任务，返回任务句柄"""
+        self._ensure_started()
+        self._jobs.add(job_id)
+        self._send({'type': 'submit', 'job_id': job_id, 'source': source})
+        return WorkerJob(self, job_id)
+
+    def cancel(self, job_id: str):
+        if job_id in self._jobs and self.process is not None:
+            self._send({'type': 'cancel', 'job_id': job_id})
+
+    def _read_output(self):
+        while self.process.canReadLine():
+            line = bytes(self.process.readLine()).decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if message.get('type') == 'ready':
+                self.progress.emit(f"✅ 后台处理进程已就绪 (PID {message.get('pid')})")
+            elif message.get('type') == 'event':
+                event = ProgressEvent.from_dict(message['event'])
+                self.events.publish(event)
+                if event.kind == EVENT_RESULT and event.job_id in self._jobs:
+                    self._jobs.discard(event.job_id)
+                    files = event.payload or []
+                    self.job_finished.emit(event.job_id, len(files) == 3, files)
+
+    def _read_error(self):
+        text = bytes(self.process.readAllStandardError()).decode('utf-8', errors='replace')
+        self._stderr_tail.extend(line for line in text.splitlines() if line.strip())
+
+    def _handle_process_finished(self, exit_code: int, exit_status):
+        if not self._jobs:
+            return
+        self.progress.emit(f"❌ 后台处理进程意外退出 (退出码 {exit_code})")
+        if self._stderr_tail:
+            self.progress.emit('\n'.join(self._stderr_tail))
+        jobs, self._jobs = self._jobs, set()
+        for job_id in jobs:
+            self.job_finished.emit(job_id, False, [])
+
+    def close(self):
+        """通知 worker 取消所有任务并退出，超时则强制结束"""
+        if self.process is None or self.process.state() == QProcess.ProcessState.NotRunning:
+            return
+        self._jobs.clear()
+        self._send({'type': 'shutdown'})
+        self.process.closeWriteChannel()
+        if not self.process.waitForFinished(10000):
+            self.process.kill()
+            self.process.waitForFinished(2000)
+
+
+# 任务状态
+JOB_PENDING = '等待中'
+JOB_RUNNING = '处理中'
+JOB_CANCELLING = '取消中'
+JOB_DONE = '已完成'
+JOB_FAILED = '失败'
+JOB_CANCELLED = '已取消'
+
+
+class QueueJob:
+    """任务队列中的一个任务"""
+
+    def __init__(self, source: str):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.source = source
+        self.status = JOB_PENDING
+        self.percent = 0
+        self.files = []
+        self.runner = None  # ProcessThread 或 WorkerJob，任务结束后为 None
 
 
 class MainWindow(QMainWindow):
@@ -198,9 +446,34 @@ class MainWindow(QMainWindow):
 
         # 初始化变量
         self.file_filter = "视频文件 (*.mp4 *.avi *.mov *.mkv *.flv)"
-        self.generator = VideoNoteGenerator()
-        self.process_thread = None
-        self.image_downloaders = []
+
+        # 界面订阅的事件总线：进程内生成器和 worker 进程的事件都转发到这里
+        self.events = EventBus()
+        self.worker_client = WorkerClient(self.events, parent=self)
+        self.worker_client.progress.connect(self.update_progress)
+        self.worker_client.job_finished.connect(self.job_finished)
+
+        # 使用 worker 进程时界面进程不加载 Whisper 模型，生成器在需要时再创建
+        self.generator = None
+        if not use_worker_by_default():
+            self._get_generator()
+        # 图片下载管理器，所有任务共用
+        self.image_downloader = ImageDownloader(parent=self)
+        self.image_downloader.downloaded.connect(self.handle_image_downloaded)
+        self.image_downloader.error.connect(self.handle_download_error)
+
+        # 缩略图在线程池中生成；切换任务时批次号加一，之前批次的图片不再显示
+        self.thumbnail_pool = QThreadPool(self)
+        self.thumbnail_pool.setMaxThreadCount(2)
+        self.thumbnail_generation = 0
+
+        # 任务队列：所有任务共享同一个生成器或同一个 worker 进程（同一个Whisper模型）
+        self.jobs = []
+        self.focused_job_id = None
+
+        # 所有任务的事件都经由同一个事件桥批量送到界面
+        self.event_bridge = EventBridge(self.events, parent=self)
+        self.event_bridge.events_ready.connect(self.handle_events)
 
         # 设置主窗口部件
         main_widget = QWidget()
@@ -234,7 +507,7 @@ class MainWindow(QMainWindow):
         input_layout.setContentsMargins(0, 0, 0, 0)
 
         self.input_path = QLineEdit()
-        self.input_path.setPlaceholderText("选择视频文件...")
+        self.input_path.setPlaceholderText("选择视频文件，或粘贴一个或多个视频链接，也可以直接拖入文件...")
         self.input_path.setStyleSheet("""
             QLineEdit {
                 padding: 5px;
@@ -251,8 +524,71 @@ class MainWindow(QMainWindow):
         browse_btn.clicked.connect(self.browse_file)
         input_layout.addWidget(browse_btn)
 
+        add_btn = QPushButton("加入队列")
+        add_btn.setStyleSheet(BUTTON_STYLE)
+        add_btn.clicked.connect(self.add_input_to_queue)
+        input_layout.addWidget(add_btn)
+
         self.main_layout.addWidget(input_widget)
 
+        # 添加任务队列区域
+        queue_group = QGroupBox("📋 任务队列")
+        queue_layout = QVBoxLayout(queue_group)
+
+        self.queue_table = QTableWidget(0, 3)
+        self.queue_table.setHorizontalHeaderLabels(["来源", "状态", "进度"])
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.queue_table.verticalHeader().setVisible(False)
+        self.queue_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.queue_table.setFixedHeight(150)
+        self.queue_table.setStyleSheet("""
+            QTableWidget {
+                background-color: #2A2A3E;
+                border: 2px solid #FF1493;
+                border-radius: 5px;
+                color: #00FFFF;
+                gridline-color: #1A1A2E;
+            }
+            QHeaderView::section {
+                background-color: #1A1A2E;
+                color: #FF1493;
+                border: none;
+                padding: 4px;
+            }
+        """)
+        self.queue_table.itemSelectionChanged.connect(self.focus_selected_job)
+        queue_layout.addWidget(self.queue_table)
+
+        queue_controls = QWidget()
+        queue_controls_layout = QHBoxLayout(queue_controls)
+        queue_controls_layout.setContentsMargins(0, 0, 0, 0)
+
+        queue_controls_layout.addWidget(QLabel("并发任务数"))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 4)
+        self.concurrency_spin.setValue(1)
+        self.concurrency_spin.valueChanged.connect(self.dispatch_jobs)
+        queue_controls_layout.addWidget(self.concurrency_spin)
+
+        # 在独立进程中转录和生成，界面不受影响，worker 崩溃也不会关闭窗口
+        self.worker_checkbox = QCheckBox("后台进程处理")
+        self.worker_checkbox.setChecked(use_worker_by_default())
+        queue_controls_layout.addWidget(self.worker_checkbox)
+        queue_controls_layout.addStretch()
+
+        for text, handler in (("取消", self.cancel_selected_jobs),
+                              ("重试", self.retry_selected_jobs),
+                              ("清除已结束", self.clear_finished_jobs)):
+            button = QPushButton(text)
+            button.setStyleSheet(BUTTON_STYLE)
+            button.clicked.connect(handler)
+            queue_controls_layout.addWidget(button)
+
+        queue_layout.addWidget(queue_controls)
+        self.main_layout.addWidget(queue_group)
+        self.setAcceptDrops(True)
+
         # 添加分割线
         self.main_layout.addWidget(CyberpunkLine())
 
@@ -438,57 +774,215 @@ class MainWindow(QMainWindow):
         self.main_layout.addWidget(process_widget)
 
     def start_processing(self):
-        """开始处理"""
-        # 获取输入源
-        source = self.input_path.text().strip()
-        if not source:
+        """把输入框中的来源加入队列并开始处理"""
+        if self.input_path.text().strip():
+            self.add_input_to_queue()
+        if not any(job.status == JOB_PENDING for job in self.jobs):
             self.log_text.append("❌ 请先选择输入源")
             return
+        self.dispatch_jobs()
 
-        # 清空之前的内容
-        self.log_text.clear()
+    def add_input_to_queue(self):
+        """把输入框中的一个或多个来源加入队列"""
+        text = self.input_path.text().strip()
+        if not text:
+            return
+        self.input_path.clear()
+        self.add_sources(split_sources(text))
+
+    def add_sources(self, sources: list):
+        """把来源加入队列，已在队列中且未结束的来源不会重复加入"""
+        active = {job.source for job in self.jobs if job.status in (JOB_PENDING, JOB_RUNNING)}
+        for source in sources:
+            if source in active:
+                continue
+            active.add(source)
+            job = QueueJob(source)
+            self.jobs.append(job)
+            row = self.queue_table.rowCount()
+            self.queue_table.insertRow(row)
+            self.queue_table.setItem(row, 0, QTableWidgetItem(source))
+            self.queue_table.setItem(row, 1, QTableWidgetItem(job.status))
+            self.queue_table.setItem(row, 2, QTableWidgetItem("0%"))
+        self.dispatch_jobs()
+
+    def dispatch_jobs(self):
+        """按并发数启动等待中的任务"""
+        running = sum(1 for job in self.jobs if job.runner is not None)
+        for job in self.jobs:
+            if running >= self.concurrency_spin.value():
+                break
+            if job.status != JOB_PENDING:
+                continue
+            job.status = JOB_RUNNING
+            job.percent = 0
+            if self.worker_checkbox.isChecked():
+                job.runner = self.worker_client.submit(job.job_id, job.source)
+            else:
+                job.runner = ProcessThread(self._get_generator(), job.source, job.job_id)
+                job.runner.progress.connect(self.update_progress)
+                job.runner.job_finished.connect(self.job_finished)
+                job.runner.start()
+            running += 1
+            self._update_job_row(job)
+            focused = self._find_job(self.focused_job_id) if self.focused_job_id else None
+            if focused is None or focused.runner is None:
+                self.focus_job(job)
+
+    def job_finished(self, job_id: str, success: bool, files: list):
+        """任务结束"""
+        job = self._find_job(job_id)
+        if job is None:
+            return
+        # 先把该任务剩余的事件送到界面
+        self.event_bridge.flush()
+        job.runner = None
+        job.files = files
+        if job.status == JOB_CANCELLING:
+            job.status = JOB_CANCELLED
+        else:
+            job.status = JOB_DONE if success else JOB_FAILED
+            if success:
+                job.percent = 100
+        self._update_job_row(job)
+        if job.job_id == self.focused_job_id and job.status != JOB_CANCELLED:
+            self.processing_finished(success, files)
+        self.dispatch_jobs()
+
+    def cancel_selected_jobs(self):
+        """取消选中的任务：等待中的任务直接取消，处理中的任务停止后标记为已取消"""
+        for job in self._selected_jobs():
+            if job.status == JOB_PENDING:
+                job.status = JOB_CANCELLED
+            elif job.status == JOB_RUNNING:
+                job.status = JOB_CANCELLING
+                job.runner.cancel()
+            self._update_job_row(job)
+
+    def retry_selected_jobs(self):
+        """重新处理选中的失败或已取消的任务"""
+        for job in self._selected_jobs():
+            if job.status in (JOB_FAILED, JOB_CANCELLED):
+                job.status = JOB_PENDING
+                job.percent = 0
+                job.files = []
+                self._update_job_row(job)
+        self.dispatch_jobs()
+
+    def clear_finished_jobs(self):
+        """从队列中移除已结束的任务"""
+        for row in reversed(range(len(self.jobs))):
+            if self.jobs[row].status in (JOB_DONE, JOB_FAILED, JOB_CANCELLED):
+                if self.jobs[row].job_id == self.focused_job_id:
+                    self.focused_job_id = None
+                del self.jobs[row]
+                self.queue_table.removeRow(row)
+
+    def focus_selected_job(self):
+        """在右侧显示选中任务的内容"""
+        jobs = self._selected_jobs()
+        if jobs:
+            self.focus_job(jobs[0])
+
+    def focus_job(self, job: QueueJob):
+        """切换右侧内容区域显示的任务"""
+        if job.job_id == self.focused_job_id:
+            return
+        self.focused_job_id = job.job_id
+        self._clear_result_panes()
+        if job.status == JOB_DONE:
+            self.processing_finished(True, job.files)
+        elif job.runner is not None:
+            # 收到下一条进度事件前显示为忙碌状态
+            self.progress_bar.setMaximum(0)
+            self.progress_bar.setValue(0)
+            self.progress_bar.setFormat("%p%")
+
+    def _clear_result_panes(self):
+        """清空标题、正文、标签和配图区域"""
+        self.thumbnail_generation += 1
         self.title_text.clear()
         self.content_text.clear()
         self.tags_text.clear()
-
-        # 清空配图区域
         while self.extra_images_layout.count():
             item = self.extra_images_layout.takeAt(0)
             if item.widget():
                 item.widget().deleteLater()
 
-        # 禁用运行按钮
-        self.run_btn.setEnabled(False)
-
-        # 设置进度条
-        self.progress_bar.setMaximum(0)
-        self.progress_bar.setValue(0)
-
-        # 开始处理
-        self.process_thread = ProcessThread(self.generator, source)
-        self.process_thread.progress.connect(self.update_progress)
-        self.process_thread.finished.connect(self.processing_finished)
-        self.process_thread.start()
+    def _get_generator(self) -> VideoNoteGenerator:
+        """进程内处理使用的生成器，首次使用时创建并加载 Whisper 模型"""
+        if self.generator is None:
+            self.generator = VideoNoteGenerator()
+            self.generator.events.subscribe(self.events.publish)
+        return self.generator
+
+    def _find_job(self, job_id: str):
+        for job in self.jobs:
+            if job.job_id == job_id:
+                return job
+        return None
+
+    def _selected_jobs(self) -> list:
+        rows = sorted({index.row() for index in self.queue_table.selectedIndexes()})
+        return [self.jobs[row] for row in rows if row < len(self.jobs)]
+
+    def _update_job_row(self, job: QueueJob):
+        """刷新任务在队列表格中的状态和进度"""
+        if job not in self.jobs:
+            return
+        row = self.jobs.index(job)
+        self.queue_table.item(row, 1).setText(job.status)
+        self.queue_table.item(row, 2).setText(f"{job.percent}%")
+
+    def closeEvent(self, event):
+        """关闭窗口时取消所有进行中的任务，等待它们结束子进程、清理临时文件"""
+        running = [job for job in self.jobs if job.runner is not None]
+        for job in running:
+            job.runner.cancel()
+        for job in running:
+            job.runner.wait(10000)
+        self.worker_client.close()
+        self.image_downloader.close()
+        self.thumbnail_pool.waitForDone(2000)
+        super().closeEvent(event)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls() or event.mimeData().hasText():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        """拖入的文件和链接直接加入队列"""
+        mime = event.mimeData()
+        if mime.hasUrls():
+            sources = [url.toLocalFile() if url.isLocalFile() else url.toString() for url in mime.urls()]
+        else:
+            sources = split_sources(mime.text())
+        self.add_sources([source for source in sources if source])
+        event.acceptProposedAction()
 
     def handle_image_downloaded(self, image_path: str, original_url: str):
-        """处理下载完成的图片"""
+        """图片下载完成，在线程池中生成缩略图后再显示"""
+        self.log_text.append(f"\n⏳ 正在处理图片: {original_url}")
+        task = ThumbnailTask(self.thumbnail_generation, image_path, original_url)
+        task.signals.loaded.connect(self.handle_thumbnail_loaded)
+        task.signals.failed.connect(self.handle_thumbnail_failed)
+        self.thumbnail_pool.start(task)
+
+    def handle_thumbnail_failed(self, generation: int, image_path: str):
+        """原图无法解码"""
+        if generation == self.thumbnail_generation:
+            self.log_text.append(f"❌ 无法加载图片: {image_path}")
+
+    def handle_thumbnail_loaded(self, generation: int, image_path: str, original_url: str, thumbnail: QImage):
+        """显示缩略图，点击后预览原图"""
+        if generation != self.thumbnail_generation:
+            # 已切换到其他任务，丢弃之前任务的图片
+            return
         try:
-            self.log_text.append(f"\n⏳ 正在处理图片: {original_url}")
-
-            pixmap = QPixmap(image_path)
-            if pixmap.isNull():
-                self.log_text.append(f"❌ 无法加载图片: {image_path}")
-                return
-
             # 统一的图片显示逻辑
             image_label = QLabel()
             image_label.setFixedSize(180, 180)
-            scaled_pixmap = pixmap.scaled(
-                170, 170,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            image_label.setPixmap(scaled_pixmap)
+            image_label.setPixmap(QPixmap.fromImage(thumbnail))
             image_label.setStyleSheet("""
                 QLabel {
                     background-color: #2A2A3E;
@@ -534,11 +1028,58 @@ class MainWindow(QMainWindow):
         """更新进度"""
         self.log_text.append(msg)
 
+    def handle_events(self, events: list):
+        """批量处理来自事件总线的事件"""
+        log_lines = []
+        latest_progress = None
+        updated_jobs = set()
+        job_numbers = {job.job_id: number for number, job in enumerate(self.jobs, 1)}
+        for event in events:
+            job = self._find_job(event.job_id)
+            if event.kind == EVENT_TOKEN:
+                if event.job_id == self.focused_job_id:
+                    self.append_content_token(event.payload)
+            elif event.kind == EVENT_TOKEN_RESET:
+                if event.job_id == self.focused_job_id:
+                    self.content_text.clear()
+            elif event.kind == EVENT_PROGRESS and event.percent is not None:
+                if job is not None:
+                    job.percent = int(event.percent)
+                    updated_jobs.add(job.job_id)
+                if event.job_id == self.focused_job_id:
+                    latest_progress = event
+            elif event.kind == EVENT_LOG and event.message:
+                icon = LEVEL_ICONS.get(event.level, '')
+                message = event.message
+                if icon and not message.startswith(icon.strip()):
+                    message = icon + message
+                if len(self.jobs) > 1 and event.job_id in job_numbers:
+                    message = f"[#{job_numbers[event.job_id]}] {message}"
+                log_lines.append(message)
+        for job_id in updated_jobs:
+            self._update_job_row(self._find_job(job_id))
+        if log_lines:
+            self.log_text.append('\n'.join(log_lines))
+        # 一批事件中只需显示最新的进度
+        if latest_progress:
+            self.progress_bar.setMaximum(100)
+            self.progress_bar.setValue(int(latest_progress.percent))
+            self.progress_bar.setFormat(describe_progress(latest_progress))
+
+    def append_content_token(self, token: str):
+        """把流式生成的文本追加到内容区域"""
+        cursor = self.content_text.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(token)
+        self.content_text.setTextCursor(cursor)
+        self.content_text.ensureCursorVisible()
+
     def processing_finished(self, success: bool, files: list):
-        """处理完成"""
-        self.run_btn.setEnabled(True)
+        """在右侧显示任务的处理结果"""
         self.progress_bar.setMaximum(100)
         self.progress_bar.setValue(100)
+        if not success:
+            self.progress_bar.setFormat("%p%")
 
         if success and files:
             self.log_text.append("\n✅ 处理完成!")
@@ -547,32 +1088,16 @@ class MainWindow(QMainWindow):
                 with open(xiaohongshu_file, 'r', encoding='utf-8') as f:
                     content = f.read()
 
-                # 1. 修改标题提取逻辑
-                title_match = re.search(r'^##\s*(.*?)(?:\n|$)', content, re.MULTILINE)
-                if title_match:
-                    title = title_match.group(1).strip()
-                    self.title_text.setText(title)
-                    self.log_text.append("\n✅ 提取到标题")
-
-                # 2. 提取正文内容
-                # 去掉标题
-                content_without_title = re.sub(r'^#.*?\n', '', content, 1)
-                # 去掉图片链接
-                content_without_images = re.sub(r'!\[.*?\]\(.*?\)\n?', '', content_without_title)
-                # 去掉标签部分
-                main_content = re.split(r'\n---\n', content_without_images)[0].strip()
-                # 去掉多余的空行
-                main_content = re.sub(r'\n{3,}', '\n\n', main_content)
-                self.content_text.setText(main_content)
-
-                # 3. 提取标签
-                extractor = TagExtractor(content)
-                tags, debug_info = extractor.extract()
-
-                # 输出调试信息
-                self.log_text.append("\n📑 标签提取过程:")
-                for info in debug_info:
-                    self.log_text.append(f"ℹ️ {info}")
+                note_data = self._load_note_data(xiaohongshu_file)
+                if note_data:
+                    # 结构化数据已包含标题、正文和标签，无需再解析 markdown
+                    self.log_text.append("\n✅ 已读取结构化笔记数据")
+                    if note_data.get('title'):
+                        self.title_text.setText(note_data['title'])
+                    self.content_text.setText(note_data.get('content', ''))
+                    tags = note_data.get('tags', [])
+                else:
+                    tags = self._parse_note_markdown(content)
 
                 if tags:
                     # 过滤掉空标签并去重
@@ -586,17 +1111,18 @@ class MainWindow(QMainWindow):
                 else:
                     self.log_text.append("\n⚠️ 所有策略都未能找到有效标签")
 
-                # 4. 提取图片链接并下载
+                # 4. 提取图片链接，生成笔记时已下载到本地的图片直接复用
                 image_links = re.findall(r'!\[.*?\]\((.*?)\)', content)
+                if note_data:
+                    local_files = dict(zip(note_data.get('images', []), note_data.get('image_files', [])))
+                    for url in [url for url in image_links if os.path.exists(local_files.get(url) or '')]:
+                        self.handle_image_downloaded(local_files[url], url)
+                        image_links.remove(url)
                 if image_links:
                     self.log_text.append(f"\n📥 开始下载{len(image_links)}张图片...")
                     for i, url in enumerate(image_links):
                         self.log_text.append(f"\n🔄 正在下载第{i + 1}张图片: {url}")
-                        downloader = ImageDownloader(url)
-                        downloader.downloaded.connect(self.handle_image_downloaded)
-                        downloader.error.connect(self.handle_download_error)
-                        downloader.start()
-                        self.image_downloaders.append(downloader)
+                        self.image_downloader.download(url)
 
             except Exception as e:
                 self.log_text.append(f"\n❌ 处理文件时出错: {str(e)}")
@@ -605,16 +1131,84 @@ class MainWindow(QMainWindow):
         else:
             self.log_text.append("\n❌ 处理失败")
 
+    def _load_note_data(self, xiaohongshu_file: str):
+        """读取笔记对应的结构化数据，不存在或无法读取时返回 None"""
+        data_file = note_data_path(xiaohongshu_file)
+        if not os.path.exists(data_file):
+            return None
+        try:
+            with open(data_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.log_text.append(f"⚠️ 读取结构化笔记数据失败: {str(e)}")
+            return None
+
+    def _parse_note_markdown(self, content: str) -> list:
+        """从 markdown 笔记中解析标题和正文并显示，返回提取到的标签"""
+        # 1. 修改标题提取逻辑
+        title_match = re.search(r'^##\s*(.*?)(?:\n|$)', content, re.MULTILINE)
+        if title_match:
+            title = title_match.group(1).strip()
+            self.title_text.setText(title)
+            self.log_text.append("\n✅ 提取到标题")
+
+        # 2. 提取正文内容
+        # 去掉标题
+        content_without_title = re.sub(r'^#.*?\n', '', content, 1)
+        # 去掉图片链接
+        content_without_images = re.sub(r'!\[.*?\]\(.*?\)\n?', '', content_without_title)
+        # 去掉标签部分
+        main_content = re.split(r'\n---\n', content_without_images)[0].strip()
+        # 去掉多余的空行
+        main_content = re.sub(r'\n{3,}', '\n\n', main_content)
+        self.content_text.setText(main_content)
+
+        # 3. 提取标签
+        extractor = TagExtractor(content)
+        tags, debug_info = extractor.extract()
+
+        # 输出调试信息
+        self.log_text.append("\n📑 标签提取过程:")
+        for info in debug_info:
+            self.log_text.append(f"ℹ️ {info}")
+
+        return tags
+
     def browse_file(self):
-        """浏览文件"""
-        file_path, _ = QFileDialog.getOpenFileName(
+        """浏览文件，选中的文件直接加入队列"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
             "选择视频文件",
             "",
             self.file_filter
         )
-        if file_path:
-            self.input_path.setText(file_path)
+        if file_paths:
+            self.add_sources(file_paths)
+
+
+def use_worker_by_default() -> bool:
+    """环境变量 VIDEO_NOTE_WORKER=1 时默认在独立进程中处理任务"""
+    return os.getenv('VIDEO_NOTE_WORKER', '').lower() in ('1', 'true', 'yes')
+
+
+def split_sources(text: str) -> list:
+    """把输入文本拆分为多个来源：本地文件路径原样保留，其余按视频链接提取并规范化
+
+    这里不解析短链接，避免在界面线程中发起网络请求。
+    """
+    text = text.strip()
+    if os.path.exists(text):
+        return [text]
+    sources = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if os.path.exists(line):
+            sources.append(line)
+        else:
+            sources.extend(extract_urls_from_text(line) or [line])
+    return dedupe_sources(sources)
 
 
 # 赛博朋克风格
@@ -0,0 +1,568 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     job_queue
+   说明：          多机分布式任务队列
+
+   多台机器从同一个共享队列领取任务：领取时获得有时限的租约，处理期间定时续约（心跳）；
+   节点宕机或失联后租约过期，任务自动回到队列由其他节点继续处理。
+   笔记写入所有节点共享的输出目录（例如 NFS、SMB 挂载的目录）。
+
+   队列后端：
+       SQLite  放在共享磁盘上的数据库文件，如 sqlite:////mnt/shared/queue.db 或直接给出 .db 路径
+       Redis   redis://host:6379/0，需要安装 redis 包
+
+   用法：
+       python job_queue.py --queue /mnt/shared/queue.db enqueue urls.txt notes.md
+       python job_queue.py --queue /mnt/shared/queue.db worker --output-dir /mnt/shared/notes
+       python job_queue.py --queue /mnt/shared/queue.db status
+       python job_queue.py --queue /mnt/shared/queue.db results > results.ndjson
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from cancellation import CancellationToken
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_LEASED = 'leased'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# 默认租约时长（秒），心跳间隔为租约时长的三分之一
+DEFAULT_LEASE_SECONDS = 120
+# 任务最多尝试的次数，超过后标记为失败
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def queue_job_id(source: str) -> str:
+    """根据视频源生成稳定的任务标识，重复入队同一视频源不会产生重复任务"""
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+
+class QueuedJob:
+    """从队列中领取到的任务"""
+
+    def __init__(self, job_id: str, source: str, attempts: int):
+        self.job_id = job_id
+        self.source = source
+        self.attempts = attempts
+
+
+class JobQueue(ABC):
+    """任务队列接口，各后端需保证领取、续约和结束操作是原子的
+
+    complete、fail、release 和 heartbeat 都会校验租约仍属于调用的 worker，
+    租约已过期并被其他 worker 领走时返回 False，调用方应放弃当前任务。
+    """
+
+    max_attempts = DEFAULT_MAX_ATTEMPTS
+
+    @abstractmethod
+    def enqueue(self, sources: List[str]) -> int:
+        """加入任务，已在队列中的视频源会被跳过，返回新加入的任务数"""
+
+    @abstractmethod
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        """领取一个任务，同时把租约已过期的任务放回队列；队列为空时返回 None"""
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """续约"""
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        """任务成功，result 为可写入 JSON 的结果"""
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """任务失败，尝试次数未用完时放回队列重试"""
+
+    @abstractmethod
+    def release(self, job_id: str, worker_id: str) -> bool:
+        """放弃租约（如 worker 正常退出），任务放回队列且不计入尝试次数"""
+
+    @abstractmethod
+    def retry_failed(self) -> int:
+        """把失败的任务重新放回队列，返回任务数"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+
+    @abstractmethod
+    def results(self) -> Iterator[Dict]:
+        """已结束（成功或失败）任务的记录"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """基于 SQLite 的任务队列，数据库文件可放在多台机器共享的磁盘上
+
+    领取任务使用 BEGIN IMMEDIATE 事务加写锁，同一时刻只有一个 worker 能领取。
+    共享磁盘上不使用 WAL 模式（WAL 依赖共享内存，跨机器不可用）。
+    """
+
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # isolation_level=None 由代码显式控制事务；timeout 为等待其他进程释放锁的时间
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, sources: List[str]) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            added = 0
+            for source in sources:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (job_id, source, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (queue_job_id(source), source, JOB_QUEUED, now, now)
+                )
+                added += cursor.rowcount
+            conn.execute("COMMIT")
+        return added
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(conn, now)
+                row = conn.execute(
+                    "SELECT job_id, source, attempts FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (JOB_LEASED, worker_id, now + lease_seconds, now, row['job_id'])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return QueuedJob(row['job_id'], row['source'], row['attempts'] + 1)
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        """租约过期的任务：尝试次数用完则标记失败，否则放回队列"""
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+            (JOB_FAILED, '租约过期，已达到最大尝试次数', now, JOB_LEASED, now, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (JOB_QUEUED, now, JOB_LEASED, now)
+        )
+
+    def _update_lease(self, job_id: str, worker_id: str, assignments: str, params: tuple) -> bool:
+        """仅当租约仍属于 worker_id 时更新任务"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ? AND worker = ? AND status = ?",
+                params + (time.time(), job_id, worker_id, JOB_LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        return self._update_lease(job_id, worker_id, "lease_expires = ?", (time.time() + lease_seconds,))
+
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        return self._update_lease(
+            job_id, worker_id, "status = ?, worker = NULL, lease_expires = NULL, result = ?, error = NULL",
+            (JOB_DONE, json.dumps(result, ensure_ascii=False))
+        )
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        return self._update_lease(
+            job_id, worker_id,
+            "status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, lease_expires = NULL, error = ?",
+            (self.max_attempts, JOB_FAILED, JOB_QUEUED, error)
+        )
+
+    def release(self, job_id: str, worker_id: str) -> bool:
+        return self._update_lease(
+            job_id, worker_id, "status = ?, worker = NULL, lease_expires = NULL, attempts = attempts - 1",
+            (JOB_QUEUED,)
+        )
+
+    def retry_failed(self) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, updated_at = ? WHERE status = ?",
+                (JOB_QUEUED, time.time(), JOB_FAILED)
+            )
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        counts = {JOB_QUEUED: 0, JOB_LEASED: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        with self._connect() as conn:
+            for row in conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"):
+                counts[row['status']] = row['count']
+        return counts
+
+    def results(self) -> Iterator[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, source, status, attempts, result, error, updated_at FROM jobs "
+                "WHERE status IN (?, ?) ORDER BY updated_at", (JOB_DONE, JOB_FAILED)
+            ).fetchall()
+        for row in rows:
+            record = dict(row)
+            record['result'] = json.loads(record['result']) if record['result'] else None
+            yield record
+
+
+# Redis 后端的原子操作脚本
+# ARGV: 前缀, 任务标识, 视频源, 当前时间；任务已存在时返回0
+# 以任务哈希是否存在判断，jobs 集合中有记录但哈希缺失的任务会被重新加入
+_REDIS_ENQUEUE_SCRIPT = """
+local key = ARGV[1] .. ':job:' .. ARGV[2]
+if redis.call('EXISTS', key) == 1 then return 0 end
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('HSET', key, 'source', ARGV[3], 'status', 'queued', 'attempts', 0,
+           'created_at', ARGV[4], 'updated_at', ARGV[4])
+redis.call('RPUSH', KEYS[1], ARGV[2])
+return 1
+"""
+
+_REDIS_LEASE_SCRIPT = """
+local id = redis.call('LPOP', KEYS[1])
+if not id then return nil end
+local key = ARGV[1] .. ':job:' .. id
+redis.call('HSET', key, 'status', 'leased', 'worker', ARGV[2], 'lease_expires', ARGV[3])
+local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('ZADD', KEYS[2], ARGV[3], id)
+return {id, redis.call('HGET', key, 'source'), attempts}
+"""
+
+_REDIS_REQUEUE_EXPIRED_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = ARGV[1] .. ':job:' .. id
+    if tonumber(redis.call('HGET', key, 'attempts') or 0) >= tonumber(ARGV[3]) then
+        redis.call('HSET', key, 'status', 'failed', 'error', ARGV[4], 'updated_at', ARGV[2])
+        redis.call('HDEL', key, 'worker', 'lease_expires')
+    else
+        redis.call('HSET', key, 'status', 'queued', 'updated_at', ARGV[2])
+        redis.call('HDEL', key, 'worker', 'lease_expires')
+        redis.call('LPUSH', KEYS[1], id)
+    end
+end
+return #ids
+"""
+
+# ARGV: 前缀, 任务标识, worker, 当前时间, 新状态（为空表示仅续约）, 新的租约到期时间, 结果, 错误, 尝试次数调整, 最大尝试次数
+_REDIS_UPDATE_LEASE_SCRIPT = """
+local key = ARGV[1] .. ':job:' .. ARGV[2]
+if redis.call('HGET', key, 'worker') ~= ARGV[3] or redis.call('HGET', key, 'status') ~= 'leased' then
+    return 0
+end
+if ARGV[5] == '' then
+    redis.call('HSET', key, 'lease_expires', ARGV[6], 'updated_at', ARGV[4])
+    redis.call('ZADD', KEYS[2], ARGV[6], ARGV[2])
+    return 1
+end
+local attempts = redis.call('HINCRBY', key, 'attempts', tonumber(ARGV[9]))
+local status = ARGV[5]
+if status == 'retry' then
+    status = attempts >= tonumber(ARGV[10]) and 'failed' or 'queued'
+end
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HDEL', key, 'worker', 'lease_expires')
+redis.call('HSET', key, 'status', status, 'updated_at', ARGV[4], 'result', ARGV[7], 'error', ARGV[8])
+if status == 'queued' then
+    redis.call('RPUSH', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """基于 Redis 的任务队列，与 SQLiteJobQueue 行为一致
+
+    每个任务保存在 <prefix>:job:<id> 哈希中，等待中的任务标识在 <prefix>:queue 列表中，
+    已领取的任务按租约到期时间保存在 <prefix>:leases 有序集合中；状态变化都由 Lua 脚本原子完成。
+    """
+
+    def __init__(self, url: str, prefix: str = 'video_notes', max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("使用 Redis 队列需要先安装 redis 包: pip install redis")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.queue_key = f"{prefix}:queue"
+        self.leases_key = f"{prefix}:leases"
+        self.jobs_key = f"{prefix}:jobs"
+        self._enqueue = self.client.register_script(_REDIS_ENQUEUE_SCRIPT)
+        self._lease = self.client.register_script(_REDIS_LEASE_SCRIPT)
+        self._requeue_expired = self.client.register_script(_REDIS_REQUEUE_EXPIRED_SCRIPT)
+        self._update_lease = self.client.register_script(_REDIS_UPDATE_LEASE_SCRIPT)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def enqueue(self, sources: List[str]) -> int:
+        added = 0
+        now = time.time()
+        for source in sources:
+            # 检查是否已存在、写入任务和加入队列在同一个脚本中原子完成，中途失败不会留下半个任务
+            added += self._enqueue(keys=[self.queue_key, self.jobs_key],
+                                   args=[self.prefix, queue_job_id(source), source, now])
+        return added
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        now = time.time()
+        self._requeue_expired(keys=[self.queue_key, self.leases_key],
+                              args=[self.prefix, now, self.max_attempts, '租约过期，已达到最大尝试次数'])
+        leased = self._lease(keys=[self.queue_key, self.leases_key],
+                             args=[self.prefix, worker_id, now + lease_seconds])
+        if not leased:
+            return None
+        job_id, source, attempts = leased
+        return QueuedJob(job_id, source, int(attempts))
+
+    def _finish(self, job_id: str, worker_id: str, status: str, lease_expires: float = 0,
+                result: str = '', error: str = '', attempts_delta: int = 0) -> bool:
+        return bool(self._update_lease(
+            keys=[self.queue_key, self.leases_key],
+            args=[self.prefix, job_id, worker_id, time.time(), status, lease_expires,
+                  result, error, attempts_delta, self.max_attempts]
+        ))
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        return self._finish(job_id, worker_id, '', lease_expires=time.time() + lease_seconds)
+
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        return self._finish(job_id, worker_id, JOB_DONE, result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        return self._finish(job_id, worker_id, 'retry', error=error)
+
+    def release(self, job_id: str, worker_id: str) -> bool:
+        return self._finish(job_id, worker_id, JOB_QUEUED, attempts_delta=-1)
+
+    def retry_failed(self) -> int:
+        count = 0
+        for job_id in self.client.smembers(self.jobs_key):
+            key = self._job_key(job_id)
+            if self.client.hget(key, 'status') == JOB_FAILED:
+                self.client.hset(key, mapping={'status': JOB_QUEUED, 'attempts': 0, 'updated_at': time.time()})
+                self.client.rpush(self.queue_key, job_id)
+                count += 1
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        counts = {JOB_QUEUED: 0, JOB_LEASED: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for job_id in self.client.smembers(self.jobs_key):
+            status = self.client.hget(self._job_key(job_id), 'status')
+            if status:
+                counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def results(self) -> Iterator[Dict]:
+        records = []
+        for job_id in self.client.smembers(self.jobs_key):
+            data = self.client.hgetall(self._job_key(job_id))
+            if data.get('status') in (JOB_DONE, JOB_FAILED):
+                records.append({
+                    'job_id': job_id,
+                    'source': data.get('source'),
+                    'status': data['status'],
+                    'attempts': int(data.get('attempts') or 0),
+                    'result': json.loads(data['result']) if data.get('result') else None,
+                    'error': data.get('error') or None,
+                    'updated_at': float(data.get('updated_at') or 0),
+                })
+        yield from sorted(records, key=lambda record: record['updated_at'])
+
+
+def open_queue(spec: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> JobQueue:
+    """根据队列地址打开队列：redis://... 使用 Redis，sqlite:///路径 或文件路径使用 SQLite"""
+    if spec.startswith(('redis://', 'rediss://')):
+        return RedisJobQueue(spec, max_attempts=max_attempts)
+    if spec.startswith('sqlite:///'):
+        spec = spec[len('sqlite:///'):]
+    return SQLiteJobQueue(spec, max_attempts=max_attempts)
+
+
+class QueueWorker:
+    """从共享队列领取任务并处理，处理期间在后台线程中定时续约
+
+    续约失败说明租约已过期并可能被其他节点领走，此时取消当前任务，避免重复写入结果。
+    """
+
+    def __init__(self, queue: JobQueue, generator, worker_id: Optional[str] = None,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, poll_interval: float = 5.0):
+        self.queue = queue
+        self.generator = generator
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.stop_token = CancellationToken()
+
+    def run(self, exit_when_empty: bool = False) -> int:
+        """持续处理任务直到 stop() 被调用；exit_when_empty 时队列中没有任务即退出。返回处理的任务数"""
+        processed = 0
+        while not self.stop_token.cancelled:
+            job = self.queue.lease(self.worker_id, self.lease_seconds)
+            if job is None:
+                if exit_when_empty and self.queue.stats()[JOB_LEASED] == 0:
+                    break
+                self.stop_token.wait(self.poll_interval)
+                continue
+            self._process(job)
+            processed += 1
+        return processed
+
+    def stop(self) -> None:
+        """停止领取新任务，并取消正在处理的任务"""
+        self.stop_token.cancel()
+
+    def _process(self, job: QueuedJob) -> None:
+        print(f"📥 领取任务 {job.job_id}（第{job.attempts}次尝试）: {job.source}", file=sys.stderr)
+        token = CancellationToken()
+        lease_lost = threading.Event()
+        finished = threading.Event()
+
+        def keep_alive() -> None:
+            while not finished.wait(self.lease_seconds / 3):
+                if not self.queue.heartbeat(job.job_id, self.worker_id, self.lease_seconds):
+                    lease_lost.set()
+                    token.cancel()
+                    return
+
+        heartbeat_thread = threading.Thread(target=keep_alive, name=f'lease-{job.job_id}', daemon=True)
+        heartbeat_thread.start()
+        unregister = self.stop_token.register(token.cancel)
+        started = time.time()
+        try:
+            files = self.generator.process_video(job.source, job_id=job.job_id, cancel_token=token)
+        except KeyboardInterrupt:
+            # 按 Ctrl+C 停止 worker，当前任务放回队列
+            self.stop()
+            files = []
+        except Exception as e:
+            files = []
+            print(f"❌ 任务 {job.job_id} 出错: {str(e)}", file=sys.stderr)
+        finally:
+            unregister()
+            finished.set()
+            heartbeat_thread.join()
+
+        if lease_lost.is_set():
+            print(f"⚠️ 任务 {job.job_id} 的租约已失效，放弃结果", file=sys.stderr)
+        elif self.stop_token.cancelled:
+            # worker 被停止，任务放回队列由其他节点处理
+            self.queue.release(job.job_id, self.worker_id)
+            print(f"⏹️ 任务 {job.job_id} 已放回队列", file=sys.stderr)
+        elif files:
+            self.queue.complete(job.job_id, self.worker_id, {
+                'artifacts': files,
+                'worker': self.worker_id,
+                'duration': round(time.time() - started, 2)
+            })
+            print(f"✅ 任务 {job.job_id} 完成", file=sys.stderr)
+        else:
+            self.queue.fail(job.job_id, self.worker_id, '未生成笔记文件')
+            print(f"❌ 任务 {job.job_id} 失败", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='视频笔记分布式任务队列')
+    parser.add_argument('--queue', required=True,
+                        help='队列地址：SQLite 数据库路径（sqlite:///路径）或 redis://host:port/db')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help='每个任务最多尝试次数')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='加入任务')
+    enqueue_parser.add_argument('inputs', nargs='+', help='视频URL、本地视频文件或目录、包含链接的文本或Markdown文件')
+
+    worker_parser = commands.add_parser('worker', help='领取并处理任务')
+    worker_parser.add_argument('--output-dir', required=True, help='所有节点共享的笔记输出目录')
+    worker_parser.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS, help='租约时长（秒）')
+    worker_parser.add_argument('--poll-interval', type=float, default=5.0, help='队列为空时的轮询间隔（秒）')
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help='队列中没有任务时退出')
+
+    commands.add_parser('status', help='查看各状态的任务数')
+    commands.add_parser('results', help='以 NDJSON 输出已结束任务的记录')
+    commands.add_parser('retry-failed', help='把失败的任务放回队列')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue, max_attempts=args.max_attempts)
+
+    if args.command == 'enqueue':
+        from video_note_generator import collect_sources
+        sources = collect_sources(args.inputs)
+        added = queue.enqueue(sources)
+        print(f"📋 加入 {added} 个任务（跳过 {len(sources) - added} 个已在队列中的视频源）")
+    elif args.command == 'status':
+        print(json.dumps(queue.stats(), ensure_ascii=False))
+    elif args.command == 'results':
+        for record in queue.results():
+            print(json.dumps(record, ensure_ascii=False))
+    elif args.command == 'retry-failed':
+        print(f"🔄 {queue.retry_failed()} 个失败任务已放回队列")
+    elif args.command == 'worker':
+        # 处理过程中的 print 输出转到标准错误
+        sys.stdout = sys.stderr
+        from video_note_generator import VideoNoteGenerator, ConsoleProgressPrinter
+        generator = VideoNoteGenerator(output_dir=args.output_dir)
+        generator.events.subscribe(ConsoleProgressPrinter())
+        worker = QueueWorker(queue, generator, lease_seconds=args.lease_seconds,
+                             poll_interval=args.poll_interval)
+        print(f"🚀 worker {worker.worker_id} 已启动")
+        try:
+            processed = worker.run(exit_when_empty=args.exit_when_empty)
+        except KeyboardInterrupt:
+            worker.stop()
+            return 130
+        print(f"✅ 共处理 {processed} 个任务")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
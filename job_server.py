@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     job_server
+   说明：          本地 HTTP 任务服务
+
+   在一个常驻进程中持有 VideoNoteGenerator（Whisper 模型保持加载，API 客户端和
+   线程池复用），通过 HTTP/JSON 接口接收任务，其他系统无需每次启动进程、加载模型。
+
+   接口：
+       GET    /health                          服务状态
+       POST   /jobs                            提交任务，请求体 {"source": "..."} 或 {"sources": [...]}
+       GET    /jobs                            所有任务
+       GET    /jobs/<id>                       任务状态、进度和生成的文件
+       DELETE /jobs/<id>                       取消任务（也可用 POST /jobs/<id>/cancel）
+       GET    /jobs/<id>/events                以 Server-Sent Events 推送进度事件，支持 Last-Event-ID 续传
+       GET    /jobs/<id>/artifacts             生成的文件列表
+       GET    /jobs/<id>/artifacts/<name>      下载生成的文件
+
+   用法：python job_server.py --port 8765
+   服务默认只监听 127.0.0.1，接口没有鉴权，不要直接暴露到公网。
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from cancellation import CancellationToken
+from events import EVENT_LOG, EVENT_PROGRESS, EVENT_RESULT, LEVEL_ERROR, LEVEL_WARNING, ProgressEvent
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# 每个任务保留的事件条数，SSE 断线重连时从中补发
+MAX_EVENT_HISTORY = 5000
+# 内存中保留的已结束任务数，超出后丢弃最早结束的任务
+MAX_FINISHED_JOBS = 200
+# SSE 无新事件时发送心跳的间隔（秒）
+SSE_KEEPALIVE_INTERVAL = 15
+
+ARTIFACT_CONTENT_TYPES = {
+    '.md': 'text/markdown; charset=utf-8',
+    '.json': 'application/json; charset=utf-8',
+}
+
+
+class JobRecord:
+    """一个任务的状态和事件记录"""
+
+    def __init__(self, source: str):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.status = JOB_QUEUED
+        self.stage = None
+        self.percent = 0.0
+        self.eta = None
+        self.files: List[str] = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.token = CancellationToken()
+        self.future = None
+        self._events = deque(maxlen=MAX_EVENT_HISTORY)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def add_event(self, event: ProgressEvent) -> None:
+        """记录一条事件并更新任务状态"""
+        with self._condition:
+            self._sequence += 1
+            self._events.append((self._sequence, event.to_dict()))
+            if event.kind == EVENT_PROGRESS and event.percent is not None:
+                self.stage = event.stage
+                self.percent = event.percent
+                self.eta = event.eta
+            elif event.kind == EVENT_LOG and event.level in (LEVEL_WARNING, LEVEL_ERROR):
+                self.error = event.message
+            elif event.kind == EVENT_RESULT:
+                self.files = list(event.payload or [])
+                if self.files:
+                    self.status = JOB_SUCCEEDED
+                    self.error = None
+                else:
+                    self.status = JOB_CANCELLED if self.token.cancelled else JOB_FAILED
+                self.finished_at = time.time()
+            self._condition.notify_all()
+
+    def mark(self, status: str, error: Optional[str] = None) -> None:
+        """直接设置任务状态（开始运行、排队中被取消等）"""
+        with self._condition:
+            self.status = status
+            if status == JOB_RUNNING:
+                self.started_at = time.time()
+            if status in FINISHED_STATUSES:
+                self.finished_at = time.time()
+            if error:
+                self.error = error
+            self._condition.notify_all()
+
+    def wait_events(self, after: int, timeout: float) -> Tuple[List[Tuple[int, Dict]], bool]:
+        """返回序号大于 after 的事件；暂无新事件时最多等待 timeout 秒
+
+        Returns:
+            Tuple: (事件列表, 任务是否已结束)
+        """
+        with self._condition:
+            if self._sequence <= after and not self.finished:
+                self._condition.wait(timeout)
+            events = [(sequence, data) for sequence, data in self._events if sequence > after]
+            return events, self.finished
+
+    def artifacts(self) -> Dict[str, str]:
+        """可下载的文件：文件名 -> 路径，包括笔记的结构化数据文件"""
+        paths = list(self.files)
+        paths.extend(os.path.splitext(path)[0] + '.json' for path in self.files
+                     if path.endswith('_xiaohongshu.md'))
+        return {os.path.basename(path): path for path in paths if os.path.exists(path)}
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.job_id,
+            'source': self.source,
+            'status': self.status,
+            'stage': self.stage,
+            'percent': round(self.percent, 1),
+            'eta': self.eta,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'artifacts': sorted(self.artifacts()) if self.finished else [],
+        }
+
+
+class JobManager:
+    """在共享的生成器上排队执行任务"""
+
+    def __init__(self, generator, max_jobs: int = 1):
+        self.generator = generator
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='job-server')
+        self._jobs: 'OrderedDict[str, JobRecord]' = OrderedDict()
+        self._lock = threading.Lock()
+        generator.events.subscribe(self._on_event)
+
+    def submit(self, source: str) -> JobRecord:
+        job = JobRecord(source)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+        job.future = self._executor.submit(self._run_job, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[JobRecord]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job: JobRecord) -> None:
+        """取消任务：排队中的任务直接撤销，进行中的任务通过取消令牌尽快停止"""
+        job.token.cancel()
+        if job.future is not None and job.future.cancel():
+            job.mark(JOB_CANCELLED)
+
+    def shutdown(self) -> None:
+        """取消所有任务并等待结束"""
+        for job in self.jobs():
+            if not job.finished:
+                self.cancel(job)
+        self._executor.shutdown(wait=True)
+
+    def _run_job(self, job: JobRecord) -> None:
+        job.mark(JOB_RUNNING)
+        try:
+            # 结束时 process_video 发布的 result 事件会更新任务状态
+            self.generator.process_video(job.source, job_id=job.job_id, cancel_token=job.token)
+        except Exception as e:
+            job.mark(JOB_FAILED, str(e))
+
+    def _on_event(self, event: ProgressEvent) -> None:
+        job = self.get(event.job_id)
+        if job is not None:
+            job.add_event(event)
+
+    def _evict_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 接口，路由见模块说明"""
+
+    server_version = 'VideoNoteJobServer/1.0'
+    manager: JobManager = None
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path == '/health':
+            self._send_json(200, {'status': 'ok', 'jobs': len(self.manager.jobs())})
+        elif path == '/jobs':
+            self._send_json(200, {'jobs': [job.to_dict() for job in self.manager.jobs()]})
+        elif (match := re.fullmatch(r'/jobs/(\w+)', path)):
+            job = self._get_job(match.group(1))
+            if job:
+                self._send_json(200, job.to_dict())
+        elif (match := re.fullmatch(r'/jobs/(\w+)/events', path)):
+            job = self._get_job(match.group(1))
+            if job:
+                self._stream_events(job)
+        elif (match := re.fullmatch(r'/jobs/(\w+)/artifacts', path)):
+            job = self._get_job(match.group(1))
+            if job:
+                self._send_json(200, {'artifacts': sorted(job.artifacts())})
+        elif (match := re.fullmatch(r'/jobs/(\w+)/artifacts/([^/]+)', path)):
+            job = self._get_job(match.group(1))
+            if job:
+                self._send_artifact(job, unquote(match.group(2)))
+        else:
+            self._send_json(404, {'error': '接口不存在'})
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path == '/jobs':
+            self._submit_jobs()
+        elif (match := re.fullmatch(r'/jobs/(\w+)/cancel', path)):
+            self._cancel_job(match.group(1))
+        else:
+            self._send_json(404, {'error': '接口不存在'})
+
+    def do_DELETE(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        match = re.fullmatch(r'/jobs/(\w+)', path)
+        if match:
+            self._cancel_job(match.group(1))
+        else:
+            self._send_json(404, {'error': '接口不存在'})
+
+    def _submit_jobs(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {'error': '请求体不是有效的JSON'})
+            return
+        if not isinstance(body, dict):
+            self._send_json(400, {'error': '请求体必须是JSON对象'})
+            return
+        sources = body.get('sources') or ([body['source']] if body.get('source') else [])
+        if (not isinstance(sources, list) or not sources
+                or not all(isinstance(s, str) and s.strip() for s in sources)):
+            self._send_json(400, {'error': '请提供 source 或 sources'})
+            return
+        jobs = [self.manager.submit(source.strip()) for source in sources]
+        if 'sources' in body:
+            self._send_json(202, {'jobs': [job.to_dict() for job in jobs]})
+        else:
+            self._send_json(202, jobs[0].to_dict())
+
+    def _cancel_job(self, job_id: str):
+        job = self._get_job(job_id)
+        if job:
+            self.manager.cancel(job)
+            self._send_json(202, job.to_dict())
+
+    def _stream_events(self, job: JobRecord):
+        """以 SSE 推送任务事件，任务结束并推送完全部事件后关闭连接"""
+        try:
+            last_id = int(self.headers.get('Last-Event-ID') or 0)
+        except ValueError:
+            last_id = 0
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while True:
+                events, finished = job.wait_events(last_id, SSE_KEEPALIVE_INTERVAL)
+                if not events and not finished:
+                    self.wfile.write(b': keepalive\n\n')
+                for sequence, data in events:
+                    payload = json.dumps(data, ensure_ascii=False)
+                    self.wfile.write(f"id: {sequence}\nevent: {data['kind']}\ndata: {payload}\n\n".encode('utf-8'))
+                    last_id = sequence
+                self.wfile.flush()
+                if finished and not events:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开，可携带 Last-Event-ID 重连
+            pass
+
+    def _send_artifact(self, job: JobRecord, name: str):
+        path = job.artifacts().get(name)
+        if not path:
+            self._send_json(404, {'error': f'文件不存在: {name}'})
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', ARTIFACT_CONTENT_TYPES.get(os.path.splitext(name)[1],
+                                                                    'application/octet-stream'))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _get_job(self, job_id: str) -> Optional[JobRecord]:
+        job = self.manager.get(job_id)
+        if job is None:
+            self._send_json(404, {'error': f'任务不存在: {job_id}'})
+        return job
+
+    def _send_json(self, status: int, data: Dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(generator, host: str = '127.0.0.1', port: int = 8765,
+                  max_jobs: int = 1) -> ThreadingHTTPServer:
+    """创建任务服务，调用 serve_forever() 开始处理请求"""
+    manager = JobManager(generator, max_jobs=max_jobs)
+    handler = type('BoundJobRequestHandler', (JobRequestHandler,), {'manager': manager})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.manager = manager
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='视频笔记本地 HTTP 任务服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--output-dir', default='temp_notes', help='笔记输出目录')
+    parser.add_argument('--max-jobs', type=int, default=1, help='同时处理的任务数')
+    args = parser.parse_args()
+
+    from video_note_generator import VideoNoteGenerator
+    generator = VideoNoteGenerator(output_dir=args.output_dir)
+    server = create_server(generator, args.host, args.port, args.max_jobs)
+    print(f"🚀 任务服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ 正在停止服务，取消进行中的任务...")
+    finally:
+        server.server_close()
+        server.manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
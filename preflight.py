@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     preflight
+   说明：          批量处理前的视频信息预检
+
+   在真正下载之前，并行地用 yt-dlp 的 extract_info(download=False) 获取每个视频的
+   时长、文件大小估计和可用性：
+   - 已删除、私密、地区限制等确定无法下载的链接直接跳过，不再花时间下载和重试；
+   - 按时长从长到短排序后再分配给 worker，长视频先开始，批量整体结束得更早。
+   预检失败但原因不确定（网络波动等）的链接照常处理。
+   预检同样是对平台的请求，与下载一样经过 PlatformScheduler：占用平台的下载名额、
+   在 cookie 池中轮换 cookie，不会用同一个 cookie 同时发出大量请求。
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import yt_dlp
+
+from cancellation import CancellationToken
+from download_scheduler import PlatformScheduler
+from retry import ERROR_PERMANENT, classify_error
+from video_urls import video_key
+
+# 与 VideoNoteGenerator 使用同一个 cookie 目录
+COOKIE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cookies')
+
+PROBE_OK = 'ok'                    # 视频可用
+PROBE_LOCAL = 'local'              # 本地文件，无需预检
+PROBE_UNAVAILABLE = 'unavailable'  # 确定无法下载
+PROBE_UNKNOWN = 'unknown'          # 预检失败，原因不确定
+
+
+class ProbeResult:
+    """一个视频源的预检结果"""
+
+    def __init__(self, source: str, status: str, title: Optional[str] = None,
+                 duration: Optional[float] = None, filesize: Optional[int] = None,
+                 is_live: bool = False, error: Optional[str] = None):
+        self.source = source
+        self.status = status
+        self.title = title
+        self.duration = duration
+        self.filesize = filesize
+        self.is_live = is_live
+        self.error = error
+
+    @property
+    def available(self) -> bool:
+        return self.status != PROBE_UNAVAILABLE
+
+    def to_dict(self) -> Dict:
+        return {
+            'status': self.status,
+            'title': self.title,
+            'duration': self.duration,
+            'filesize': self.filesize,
+            'is_live': self.is_live,
+            'error': self.error,
+        }
+
+
+def _estimate_filesize(info: Dict) -> Optional[int]:
+    """估算将要下载的音频大小：优先用格式自带的大小，其次按码率和时长估算"""
+    formats = info.get('requested_formats') or [info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            # tbr 单位为 kbit/s
+            size = fmt['tbr'] * 125 * info['duration']
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+def probe_source(source: str, cookie_dir: str = COOKIE_DIR, timeout: float = 20,
+                 scheduler: Optional[PlatformScheduler] = None) -> ProbeResult:
+    """预检一个视频源，不下载任何媒体数据；多个预检共用 scheduler 时一起遵守平台的并发上限"""
+    if os.path.exists(source):
+        return ProbeResult(source, PROBE_LOCAL, title=os.path.basename(source),
+                           filesize=os.path.getsize(source))
+
+    options = {
+        'format': 'bestaudio/best',
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+        'skip_download': True,
+        'socket_timeout': timeout,
+    }
+    key = video_key(source)
+    scheduler = scheduler or PlatformScheduler(cookie_dir)
+
+    try:
+        if key is None:
+            info = _extract_info(source, options)
+        else:
+            with scheduler.slot(key[0], CancellationToken()), \
+                    scheduler.cookie_pool(key[0]).use(source) as cookie_file:
+                info = _extract_info(source, dict(options, cookiefile=cookie_file) if cookie_file else options)
+    except Exception as e:
+        # 只有确定是永久错误（与下载重试使用同一套分类）时才跳过
+        status = PROBE_UNAVAILABLE if classify_error(e) == ERROR_PERMANENT else PROBE_UNKNOWN
+        return ProbeResult(source, status, error=str(e))
+    if not info:
+        return ProbeResult(source, PROBE_UNKNOWN, error='无法获取视频信息')
+
+    return ProbeResult(
+        source, PROBE_OK,
+        title=info.get('title'),
+        duration=info.get('duration'),
+        filesize=_estimate_filesize(info),
+        is_live=bool(info.get('is_live')),
+    )
+
+
+def _extract_info(source: str, options: Dict) -> Optional[Dict]:
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.extract_info(source, download=False)
+
+
+def probe_sources(sources: Iterable[str], workers: int = 8, cookie_dir: str = COOKIE_DIR,
+                  on_result: Optional[Callable[[ProbeResult], None]] = None) -> List[ProbeResult]:
+    """并行预检多个视频源，按输入顺序返回结果；on_result 在每个结果就绪时调用
+
+    workers 为预检线程数，同一平台同时进行的预检数仍受平台的下载并发上限限制。
+    """
+    sources = list(sources)
+    results: List[Optional[ProbeResult]] = [None] * len(sources)
+    if not sources:
+        return []
+    scheduler = PlatformScheduler(cookie_dir)
+
+    def probe(index: int) -> None:
+        result = probe_source(sources[index], cookie_dir, scheduler=scheduler)
+        results[index] = result
+        if on_result is not None:
+            on_result(result)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources))),
+                            thread_name_prefix='preflight') as executor:
+        list(executor.map(probe, range(len(sources))))
+    return results
+
+
+def longest_first(results: List[ProbeResult]) -> List[ProbeResult]:
+    """按时长从长到短排序，时长未知的排在最后并保持原有顺序
+
+    本地文件没有时长信息，按文件大小与其他本地文件排序。
+    """
+    known = [r for r in results if r.duration]
+    local = [r for r in results if not r.duration and r.status == PROBE_LOCAL]
+    unknown = [r for r in results if not r.duration and r.status != PROBE_LOCAL]
+    known.sort(key=lambda r: r.duration, reverse=True)
+    local.sort(key=lambda r: r.filesize or 0, reverse=True)
+    return known + local + unknown
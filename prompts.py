@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     prompts
+   说明：          提示词模板注册表与 Token 用量统计
+
+   每个模板由固定不变的 system 提示词和 user 模板组成，变化的内容（转录文本、文章）
+   一律放在 user 消息的最后。这样同一任务的所有请求共享完全相同的前缀，
+   服务商的提示词缓存（prompt caching）可以命中，长转录文本的几十个分段只需为前缀付费一次。
+   修改提示词时请新增版本号，而不是直接改动已有版本，以免缓存前缀和统计口径悄悄变化。
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+
+class PromptTemplate:
+    """一个带版本号的提示词模板"""
+
+    def __init__(self, name: str, version: int, system: str, user: str):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.user = user
+
+    @property
+    def key(self) -> str:
+        """模板标识，如 organize@2"""
+        return f"{self.name}@{self.version}"
+
+    def messages(self, cache_control: bool = False, **kwargs) -> List[Dict]:
+        """生成对话消息
+
+        Args:
+            cache_control: 是否给 system 提示词加上显式缓存标记（Anthropic、Gemini 等需要显式声明的模型）
+            **kwargs: 填充 user 模板的变量
+
+        Returns:
+            List[Dict]: 可直接传给 chat.completions.create 的消息列表
+        """
+        if cache_control:
+            system_content = [{
+                "type": "text",
+                "text": self.system,
+                "cache_control": {"type": "ephemeral"}
+            }]
+        else:
+            system_content = self.system
+        return [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": self.user.format(**kwargs)}
+        ]
+
+
+PROMPT_TEMPLATES: Dict[str, Dict[int, PromptTemplate]] = {}
+
+
+def register_prompt(template: PromptTemplate) -> PromptTemplate:
+    """注册提示词模板，同名同版本的模板不允许重复注册"""
+    versions = PROMPT_TEMPLATES.setdefault(template.name, {})
+    if template.version in versions:
+        raise ValueError(f"提示词模板已存在: {template.key}")
+    versions[template.version] = template
+    return template
+
+
+def get_prompt(name: str, version: Optional[int] = None) -> PromptTemplate:
+    """获取提示词模板，未指定版本时返回最新版本"""
+    versions = PROMPT_TEMPLATES.get(name)
+    if not versions:
+        raise KeyError(f"未知的提示词模板: {name}")
+    if version is None:
+        version = max(versions)
+    if version not in versions:
+        raise KeyError(f"未知的提示词模板版本: {name}@{version}")
+    return versions[version]
+
+
+# 长文整理：每个分段都会发送一次，system 提示词保持精简且固定
+register_prompt(PromptTemplate(
+    name='organize',
+    version=2,
+    system="""你是屡获殊荣的科普作家。请用4C模型（Connection建立联系、Conflict展示冲突、Change强调改变、Catch即时收获）把转录文字改写为博客文章。
+写作：从读者的问题出发逐步深入；用第二人称，语气亲切平实；观点只来自转录文本，没有实例就不编造；复杂逻辑用直观类比；避免重复。
+Markdown：大标题突出主题，最好用疑问句；小标题用简短词语；开篇直接阐明问题；正文用自然段，不用列表；保留原文的数据、示例、图片链接，来源URL用文内链接。""",
+    user="""请根据以下转录文字内容，创作一篇结构清晰、易于理解的博客文章。
+
+转录文字内容：
+
+{content}"""
+))
+
+_XIAOHONGSHU_SYSTEM = """你是小红书爆款文案写手，把输入内容改写成刷屏级笔记。
+标题：二极管标题法（追求快乐：方法+只需N秒+逆天效果；逃避痛苦：不行动+巨大损失+紧迫感）；含1-2个爆款词（宝藏、神器、绝绝子、小白必看、良心推荐等）；20字以内，2-4个emoji，口语化、有悬念。
+正文：共情开场点出痛点并埋下悬念；每段emoji开头，重点加粗，适当空行，步骤清晰；语气热情口语化，插入互动问句和个人经验，可用平台热梗；情感真实，避免过度营销和机器味。
+标签：核心词、关联长尾词、高转化词、热搜词四类，每类1-2个。
+牢记：标题决定打开率，内容决定完播率，互动决定涨粉率！"""
+
+# 小红书笔记：结构化输出（JSON）
+register_prompt(PromptTemplate(
+    name='xiaohongshu_structured',
+    version=2,
+    system=_XIAOHONGSHU_SYSTEM,
+    user="""请把文末的内容转换为爆款小红书笔记，严格按JSON格式返回。
+
+字段说明：
+- title：爆款标题（必须有emoji）
+- image_keywords：1-3个与主题最相关的英文图片搜索关键词
+- tag_groups：core（核心词）、related（关联词）、conversion（转化词）、trending（热搜词）四类标签，每类1-2个，不带#号
+- body：正文（markdown，不含标题和标签，每段emoji装饰，2-3处互动引导，600-800字）
+
+内容如下：
+{content}"""
+))
+
+# 小红书笔记：纯文本输出，结构化输出不可用时使用
+register_prompt(PromptTemplate(
+    name='xiaohongshu_text',
+    version=2,
+    system=_XIAOHONGSHU_SYSTEM,
+    user="""请把文末的内容转换为爆款小红书笔记，按以下格式返回：
+1. 第一行：爆款标题（必须有emoji）
+2. 空一行后是正文（每段emoji装饰，2-3处互动引导，600-800字）
+3. 空一行后是标签列表（四类标签都要有，用#号开头）
+4. 最后一行：配图关键词：1-3个与主题最相关的英文图片搜索关键词，用逗号分隔
+
+内容如下：
+{content}"""
+))
+
+# 配图关键词翻译：仅在模型未返回英文关键词、本地对照表也未命中时使用
+register_prompt(PromptTemplate(
+    name='image_keyword_translation',
+    version=1,
+    system="你是一个翻译助手。请将输入的中文关键词翻译成最相关的1-3个英文关键词，用逗号分隔。直接返回翻译结果，不要加任何解释。例如：\n输入：'保险理财知识'\n输出：insurance,finance,investment",
+    user="{content}"
+))
+
+
+class TokenUsageReport:
+    """统计一个任务中各阶段的 Token 用量，可在多个线程中同时记录"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, int]] = {}
+
+    def record(self, stage: str, usage, prompt_key: str = '') -> None:
+        """记录一次API调用的用量
+
+        Args:
+            stage: 阶段名称，如 organize、xiaohongshu
+            usage: API 返回的 usage 对象，可以为 None
+            prompt_key: 使用的提示词模板标识
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+
+        with self._lock:
+            entry = self.stages.setdefault(stage, {
+                'prompt': prompt_key,
+                'calls': 0,
+                'prompt_tokens': 0,
+                'cached_tokens': 0,
+                'completion_tokens': 0
+            })
+            entry['calls'] += 1
+            entry['prompt_tokens'] += prompt_tokens
+            entry['cached_tokens'] += cached_tokens
+            entry['completion_tokens'] += completion_tokens
+
+    def totals(self) -> Dict[str, int]:
+        """汇总所有阶段的用量"""
+        with self._lock:
+            totals = {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0}
+            for entry in self.stages.values():
+                for field in totals:
+                    totals[field] += entry[field]
+            return totals
+
+    def to_dict(self) -> Dict:
+        """导出为可写入 JSON 的字典"""
+        with self._lock:
+            stages = {stage: dict(entry) for stage, entry in self.stages.items()}
+        return {'stages': stages, 'total': self.totals()}
+
+    def summary(self) -> str:
+        """生成一行用量摘要"""
+        totals = self.totals()
+        return (f"共调用 {totals['calls']} 次，输入 {totals['prompt_tokens']} tokens"
+                f"（缓存命中 {totals['cached_tokens']}），输出 {totals['completion_tokens']} tokens")
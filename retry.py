@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     retry
+   说明：          下载重试策略
+
+   按错误类型决定是否重试、重试几次、等待多久：
+   - 永久错误（视频不存在、已删除、不支持的平台等）不重试，立即失败；
+   - 限流按较长的指数退避等待；
+   - 网络波动快速重试；
+   - cookie/鉴权错误只重试一次（调用方可以在重试前更换 cookie）。
+   等待时间带随机抖动，多个 worker 同时失败时不会在同一时刻一起重试。
+"""
+
+import random
+import re
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from cancellation import CancellationToken, JobCancelled
+
+ERROR_PERMANENT = 'permanent'
+ERROR_RATE_LIMIT = 'rate_limit'
+ERROR_NETWORK = 'network'
+ERROR_AUTH = 'auth'
+ERROR_UNKNOWN = 'unknown'
+
+ERROR_NAMES = {
+    ERROR_PERMANENT: '永久错误',
+    ERROR_RATE_LIMIT: '请求过于频繁',
+    ERROR_NETWORK: '网络错误',
+    ERROR_AUTH: '鉴权错误',
+    ERROR_UNKNOWN: '未知错误',
+}
+
+# HTTP 状态码只在明确的上下文中识别，避免把视频 ID 或链接中的数字当作状态码
+_HTTP_STATUS = re.compile(r'HTTP Error (\d{3})|\bstatus(?: code)?:? ?(\d{3})\b', re.IGNORECASE)
+_HTTP_STATUS_CATEGORIES = {429: ERROR_RATE_LIMIT, 401: ERROR_AUTH, 403: ERROR_AUTH,
+                           404: ERROR_PERMANENT, 410: ERROR_PERMANENT}
+# yt-dlp 错误信息的前缀，如 "ERROR: [youtube] abc4290xYz1: "，其中的视频 ID 不参与匹配
+_MESSAGE_PREFIX = re.compile(r'^(?:ERROR:\s*)?(?:\[[\w:.-]+\]\s*(?:[\w.-]+:\s+)?)?')
+
+# 按顺序匹配错误信息（VideoNoteGenerator._handle_download_error 也按这里的分类提示用户）：
+# SSL -> 网络，unavailable/私密 -> 永久，cookies/登录 -> 鉴权
+# - "temporarily unavailable" 等网络错误先于永久错误匹配，按网络错误重试；
+# - 永久错误先于鉴权匹配：yt-dlp 在私密视频等错误后面也会附上 "Sign in"、"--cookies" 提示
+_ERROR_PATTERNS = [
+    (ERROR_RATE_LIMIT, re.compile(r'\b429\b|too many requests|rate.?limit|频繁', re.IGNORECASE)),
+    (ERROR_NETWORK, re.compile(r'ssl|timed? ?out|connection|reset by peer|temporar|unreachable|'
+                               r'name resolution|name or service not known|incomplete read|'
+                               r'bad gateway|service unavailable|gateway time', re.IGNORECASE)),
+    (ERROR_PERMANENT, re.compile(r'video unavailable|not found|is unavailable|private video|been removed|deleted|'
+                                 r'does not exist|unsupported url|copyright|not available in your country|'
+                                 r'不支持|不存在|已删除', re.IGNORECASE)),
+    (ERROR_AUTH, re.compile(r'cookies?|forbidden|sign in|log ?in|login|confirm your age|'
+                            r'members.only|需要登录', re.IGNORECASE)),
+]
+
+# DownloadError.error_type 到错误类型的对应关系
+_DOWNLOAD_ERROR_TYPES = {
+    'platform_error': ERROR_PERMANENT,
+    'file_error': ERROR_PERMANENT,
+    'info_error': ERROR_NETWORK,
+}
+
+
+def classify_error(error: BaseException) -> str:
+    """判断下载错误的类型
+
+    >>> classify_error(Exception("ERROR: [youtube] abc4290xYz1: Video unavailable. This video has been removed by the uploader"))
+    'permanent'
+    >>> classify_error(Exception("ERROR: [youtube] Xy_403abcde: Video unavailable"))
+    'permanent'
+    >>> classify_error(Exception("ERROR: [youtube] dQw4w9WgXcQ: Private video. Sign in if you've been granted access to this video. Use --cookies-from-browser or --cookies for the authentication."))
+    'permanent'
+    >>> classify_error(Exception("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm your age. This video may be inappropriate for some users. Use --cookies-from-browser or --cookies for the authentication."))
+    'auth'
+    >>> classify_error(Exception("ERROR: [youtube] dQw4w9WgXcQ: Join this channel to get access to members-only content like this video, and other exclusive perks."))
+    'auth'
+    >>> classify_error(Exception("ERROR: unable to download video data: HTTP Error 403: Forbidden"))
+    'auth'
+    >>> classify_error(Exception("ERROR: [BiliBili] BV1xx411c7mD: Unable to download JSON metadata: HTTP Error 429: Too Many Requests"))
+    'rate_limit'
+    >>> classify_error(Exception("ERROR: [youtube] dQw4w9WgXcQ: Unable to download API page: HTTP Error 503: Service Unavailable"))
+    'network'
+    >>> classify_error(Exception("ERROR: [generic] Unable to download webpage: HTTP Error 404: Not Found"))
+    'permanent'
+    >>> classify_error(Exception("ERROR: [douyin] 7234290512345678901: Unable to download webpage: <urlopen error [Errno -3] Temporary failure in name resolution>"))
+    'network'
+    >>> classify_error(Exception("ERROR: Unsupported URL: https://example.com/watch/4291"))
+    'permanent'
+    """
+    error_type = getattr(error, 'error_type', None)
+    if error_type in _DOWNLOAD_ERROR_TYPES:
+        return _DOWNLOAD_ERROR_TYPES[error_type]
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return ERROR_NETWORK
+    message = _MESSAGE_PREFIX.sub('', str(error), count=1)
+    match = _HTTP_STATUS.search(message)
+    if match:
+        status = int(match.group(1) or match.group(2))
+        if status in _HTTP_STATUS_CATEGORIES:
+            return _HTTP_STATUS_CATEGORIES[status]
+        if 500 <= status <= 504:
+            return ERROR_NETWORK
+    for category, pattern in _ERROR_PATTERNS:
+        if pattern.search(message):
+            return category
+    return ERROR_UNKNOWN
+
+
+class RetryRule:
+    """一类错误的重试规则：最多尝试 max_attempts 次，第 n 次重试前等待
+    base_delay * 2^(n-1) 秒（不超过 max_delay），再乘以 [1 - jitter, 1] 之间的随机系数"""
+
+    def __init__(self, max_attempts: int, base_delay: float = 0.0, max_delay: float = 0.0,
+                 jitter: float = 0.5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, retry: int, rng: random.Random) -> float:
+        delay = min(self.base_delay * 2 ** (retry - 1), self.max_delay)
+        return delay * (1 - self.jitter * rng.random())
+
+
+DEFAULT_RULES = {
+    ERROR_PERMANENT: RetryRule(max_attempts=1),
+    ERROR_RATE_LIMIT: RetryRule(max_attempts=4, base_delay=10, max_delay=120),
+    ERROR_NETWORK: RetryRule(max_attempts=4, base_delay=1, max_delay=20),
+    ERROR_AUTH: RetryRule(max_attempts=2, base_delay=2, max_delay=2),
+    ERROR_UNKNOWN: RetryRule(max_attempts=3, base_delay=3, max_delay=15),
+}
+
+T = TypeVar('T')
+
+
+class RetryPolicy:
+    """按错误类型重试一个操作
+
+    用法：
+        policy.call(lambda attempt: download(url), token,
+                    on_retry=lambda error, category, attempt, delay: log(...))
+    """
+
+    def __init__(self, rules: Optional[Dict[str, RetryRule]] = None,
+                 classify: Callable[[BaseException], str] = classify_error,
+                 rng: Optional[random.Random] = None):
+        self.rules = dict(DEFAULT_RULES)
+        if rules:
+            self.rules.update(rules)
+        self.classify = classify
+        self._rng = rng or random.Random()
+
+    def call(self, operation: Callable[[int], T], token: Optional[CancellationToken] = None,
+             on_retry: Optional[Callable[[Exception, str, int, float], None]] = None) -> T:
+        """执行 operation(attempt)，attempt 从 1 开始；不应重试或次数用完时抛出最后一次的异常
+
+        等待期间被取消时抛出 JobCancelled。
+        """
+        attempt = 1
+        while True:
+            try:
+                return operation(attempt)
+            except Exception as e:
+                category = self.classify(e)
+                rule = self.rules.get(category, self.rules[ERROR_UNKNOWN])
+                if attempt >= rule.max_attempts:
+                    raise
+                delay = rule.delay(attempt, self._rng)
+                if on_retry is not None:
+                    on_retry(e, category, attempt, delay)
+                if token is None:
+                    time.sleep(delay)
+                elif token.wait(delay):
+                    raise JobCancelled()
+                attempt += 1
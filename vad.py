@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     vad
+   说明：          转录前的语音检测：去掉静音和低音量片段，只把语音交给 Whisper
+
+   直播回放、讲座等视频常有很长的静音、片头和背景音乐，Whisper 照样逐段解码，
+   还容易在静音处编造出文字。转录前按帧计算音量，以整段音频的本底噪声和较响部分的音量为参照判断语音：
+   - 只去掉足够长的非语音片段，语音前后各保留一小段余量，不会切掉轻声的字头字尾；
+   - 结果是一个 SpeechAudio 视图，按需从原始音频（可以是磁盘上的 memmap）拼接语音片段，
+     不复制整段数据；
+   - 视图记录每个语音片段在原始音频中的位置，转录结果的时间戳可以换算回原视频的时间。
+
+   这里只按音量判断，音量与人声相当的背景音乐会被保留；整段音量起伏不大（没有明显的静音）时不作裁剪。
+   通过环境变量 VIDEO_NOTE_VAD=0 关闭。
+"""
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+from audio_buffer import SAMPLE_RATE, release, to_float
+
+# 计算音量的帧长
+FRAME_SECONDS = 0.03
+# 比本底噪声（音量最低的10%的帧）高出这么多分贝的帧视为语音，
+# 但阈值不超过较响的帧（第90百分位）以下 THRESHOLD_BELOW_LOUD_DB，也不低于 MIN_THRESHOLD_DB
+THRESHOLD_ABOVE_FLOOR_DB = 15.0
+THRESHOLD_BELOW_LOUD_DB = 20.0
+MIN_THRESHOLD_DB = -55.0
+# 本底噪声比较响的帧至少低这么多分贝时才认为录音中有真正的静音；
+# 否则（如全程轻声说话的讲座录音）不作裁剪
+MIN_DYNAMIC_RANGE_DB = 25.0
+# 短于这个长度的响声（咔哒声等）不算语音
+MIN_SPEECH_SECONDS = 0.1
+# 短于这个长度的停顿保留，不切碎连续的说话
+MIN_SILENCE_SECONDS = 1.0
+# 语音片段前后保留的余量
+PAD_SECONDS = 0.3
+# 每次读入这么长的音频计算音量，memmap 不会被整段读入内存
+BLOCK_SECONDS = 60
+
+
+def vad_enabled() -> bool:
+    """是否在转录前去掉非语音片段"""
+    return os.getenv('VIDEO_NOTE_VAD', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def frame_levels(audio: np.ndarray, frame_seconds: float = FRAME_SECONDS) -> np.ndarray:
+    """逐帧计算音量（dBFS），不足一帧的结尾单独算作一帧"""
+    frame = int(SAMPLE_RATE * frame_seconds)
+    block = frame * int(BLOCK_SECONDS / frame_seconds)
+    levels = []
+    for start in range(0, len(audio), block):
+        samples = to_float(audio[start:start + block])
+        count = len(samples) // frame
+        power = np.mean(samples[:count * frame].reshape(count, frame) ** 2, axis=1)
+        if len(samples) > count * frame:
+            power = np.append(power, np.mean(samples[count * frame:] ** 2))
+        levels.append(10 * np.log10(power + 1e-10))
+    return np.concatenate(levels) if levels else np.zeros(0)
+
+
+def detect_speech(audio: np.ndarray, frame_seconds: float = FRAME_SECONDS) -> List[Tuple[int, int]]:
+    """返回语音片段的 (起始采样, 结束采样) 列表，按时间排列且互不重叠
+
+    找不到明显的静音时整段作为一个语音片段返回。
+    """
+    levels = frame_levels(audio, frame_seconds)
+    if not len(levels):
+        return []
+    floor, loud = (float(value) for value in np.percentile(levels, [10, 90]))
+    if loud - floor < MIN_DYNAMIC_RANGE_DB:
+        return [(0, len(audio))]
+    threshold = max(min(floor + THRESHOLD_ABOVE_FLOOR_DB, loud - THRESHOLD_BELOW_LOUD_DB), MIN_THRESHOLD_DB)
+    voiced = np.concatenate(([0], (levels > threshold).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(voiced))
+
+    frame = int(SAMPLE_RATE * frame_seconds)
+    min_speech = int(MIN_SPEECH_SECONDS / frame_seconds)
+    min_silence = int(MIN_SILENCE_SECONDS / frame_seconds)
+    pad = int(PAD_SECONDS / frame_seconds)
+    regions: List[List[int]] = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        if end - start < min_speech:
+            continue
+        start, end = max(0, start - pad), min(len(levels), end + pad)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    return [(int(start) * frame, min(int(end) * frame, len(audio))) for start, end in regions]
+
+
+class SpeechAudio:
+    """只包含语音片段的音频视图
+
+    像数组一样取长度和切片，切片时从原始音频中拼接对应的语音片段；
+    to_original 把视图中的时间换算为原始音频中的时间。
+    """
+
+    def __init__(self, audio: np.ndarray, regions: List[Tuple[int, int]]):
+        self.audio = audio
+        self.regions = regions
+        self.dtype = audio.dtype
+        self._starts = np.array([start for start, _ in regions], dtype=np.int64)
+        # 每个语音片段在视图中的起点，最后一项为视图总长度
+        self._offsets = np.concatenate(([0], np.cumsum([end - start for start, end in regions]))).astype(np.int64)
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def __getitem__(self, index: slice) -> np.ndarray:
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("SpeechAudio 只支持连续切片")
+        first = int(np.searchsorted(self._offsets, start, side='right')) - 1
+        pieces = []
+        position = start
+        for i in range(max(first, 0), len(self.regions)):
+            if position >= stop:
+                break
+            offset = position - self._offsets[i]
+            length = min(stop, self._offsets[i + 1]) - position
+            source = self._starts[i] + offset
+            pieces.append(self.audio[source:source + length])
+            position += length
+        if not pieces:
+            return self.audio[0:0]
+        return np.concatenate(pieces)
+
+    def close(self) -> None:
+        """关闭原始音频的文件映射（长音频），之后视图为空，不会再访问已关闭的映射"""
+        release(self.audio)
+        self.audio = np.zeros(0, dtype=self.dtype)
+        self.regions = []
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    @property
+    def original_seconds(self) -> float:
+        return len(self.audio) / SAMPLE_RATE
+
+    @property
+    def speech_seconds(self) -> float:
+        return len(self) / SAMPLE_RATE
+
+    def to_original(self, seconds: float, end: bool = False) -> float:
+        """把视图中的时间（秒）换算为原始音频中的时间
+
+        恰好落在两个片段交界处的时间，作为结束时间时取前一片段的末尾，否则取后一片段的开头。
+        """
+        if not self.regions:
+            return seconds
+        sample = min(max(int(round(seconds * SAMPLE_RATE)), 0), len(self))
+        index = int(np.searchsorted(self._offsets, sample, side='left' if end else 'right')) - 1
+        index = min(max(index, 0), len(self.regions) - 1)
+        return float(self._starts[index] + sample - self._offsets[index]) / SAMPLE_RATE
@@ -5,22 +5,47 @@ import time
 import shutil
 import re
 import subprocess
-from typing import Dict, List, Optional, Tuple
+import threading
+import hashlib
+import importlib
+import types
+import uuid
+import contextvars
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import datetime
 from pathlib import Path
 import random
 from itertools import zip_longest
 
+import numpy as np
 import yt_dlp
 import httpx
 from unsplash.api import Api as UnsplashApi
 from unsplash.auth import Auth as UnsplashAuth
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
 import whisper
 import openai
 import argparse
 
+from events import (EVENT_LOG, EVENT_PROGRESS, EVENT_RESULT, EVENT_TOKEN, EVENT_TOKEN_RESET, LEVEL_ERROR,
+                    LEVEL_INFO, LEVEL_SUCCESS, LEVEL_WARNING, STAGE_DOWNLOAD, STAGE_IMAGES, STAGE_JOB, STAGE_ORGANIZE,
+                    STAGE_TRANSCRIBE, STAGE_XIAOHONGSHU, EventBus, ProgressEvent, ProgressTracker,
+                    ConsoleProgressPrinter, format_bytes, format_duration)
+from prompts import TokenUsageReport, get_prompt
+from cancellation import CancellationToken, JobCancelled, acquire_lock, on_cancel, run_process
+from worker import WORKER_SCRIPT
+import audio_buffer
+from vad import SpeechAudio, detect_speech, vad_enabled
+import douyin
+from download_scheduler import DEFAULT_LIMIT, PlatformScheduler, platform_limits
+from downloads import DownloadCache, RangeDownload, aria2c_available, download_connections
+from retry import ERROR_AUTH, ERROR_NAMES, ERROR_PERMANENT, ERROR_RATE_LIMIT, RetryPolicy, classify_error
+from preflight import ProbeResult, longest_first, probe_sources
+from video_urls import ShortLinkResolver, dedupe_sources, iter_urls, video_key
+
 # 加载环境变量
 load_dotenv()
 
@@ -41,11 +66,11 @@ for var, desc in required_env_vars.items():
         missing_env_vars.append(f"  - {var} ({desc})")
 
 if missing_env_vars:
-    print("注意：以下环境变量未设置：")
-    print("\n".join(missing_env_vars))
-    print("\n将使用基本功能继续运行（无AI优化和图片）。")
-    print("如需完整功能，请在 .env 文件中设置相应的 API 密钥。")
-    print("继续处理...\n")
+    print("注意：以下环境变量未设置：", file=sys.stderr)
+    print("\n".join(missing_env_vars), file=sys.stderr)
+    print("\n将使用基本功能继续运行（无AI优化和图片）。", file=sys.stderr)
+    print("如需完整功能，请在 .env 文件中设置相应的 API 密钥。", file=sys.stderr)
+    print("继续处理...\n", file=sys.stderr)
 
 # 配置代理
 http_proxy = os.getenv('HTTP_PROXY')
@@ -81,13 +106,13 @@ AI_MODEL = "google/gemini-pro"  # 使用 Gemini Pro 模型
 # Test OpenRouter connection
 if openrouter_api_key:
     try:
-        print(f"正在测试 OpenRouter API 连接...")
+        print(f"正在测试 OpenRouter API 连接...", file=sys.stderr)
         response = client.models.list()  # 使用更简单的API调用来测试连接
-        print("✅ OpenRouter API 连接测试成功")
+        print("✅ OpenRouter API 连接测试成功", file=sys.stderr)
         openrouter_available = True
     except Exception as e:
-        print(f"⚠️ OpenRouter API 连接测试失败: {str(e)}")
-        print("将继续尝试使用API，但可能会遇到问题")
+        print(f"⚠️ OpenRouter API 连接测试失败: {str(e)}", file=sys.stderr)
+        print("将继续尝试使用API，但可能会遇到问题", file=sys.stderr)
 
 # 检查Unsplash配置
 unsplash_access_key = os.getenv('UNSPLASH_ACCESS_KEY')
@@ -101,9 +126,9 @@ if unsplash_access_key:
             redirect_uri=None
         )
         unsplash_client = UnsplashApi(auth)
-        print("✅ Unsplash API 配置成功")
+        print("✅ Unsplash API 配置成功", file=sys.stderr)
     except Exception as e:
-        print(f"❌ Failed to initialize Unsplash client: {str(e)}")
+        print(f"❌ Failed to initialize Unsplash client: {str(e)}", file=sys.stderr)
 
 # 检查ffmpeg
 ffmpeg_path = None
@@ -111,17 +136,112 @@ try:
     subprocess.run(["/opt/homebrew/bin/ffmpeg", "-version"], 
                     stdout=subprocess.PIPE, 
                     stderr=subprocess.PIPE)
-    print("✅ ffmpeg is available at /opt/homebrew/bin/ffmpeg")
+    print("✅ ffmpeg is available at /opt/homebrew/bin/ffmpeg", file=sys.stderr)
     ffmpeg_path = "/opt/homebrew/bin/ffmpeg"
 except Exception:
     try:
         subprocess.run(["ffmpeg", "-version"],
                         stdout=subprocess.PIPE,
                         stderr=subprocess.PIPE)
-        print("✅ ffmpeg is available (from PATH)")
+        print("✅ ffmpeg is available (from PATH)", file=sys.stderr)
         ffmpeg_path = "ffmpeg"
     except Exception as e:
-        print(f"⚠️ ffmpeg not found: {str(e)}")
+        print(f"⚠️ ffmpeg not found: {str(e)}", file=sys.stderr)
+
+# 当前任务的 Token 用量统计，每个 process_video 调用各自独立
+_current_usage: contextvars.ContextVar = contextvars.ContextVar('current_usage', default=None)
+# 当前任务标识和所处阶段，随事件一起发布
+_current_job: contextvars.ContextVar = contextvars.ContextVar('current_job', default='')
+_current_stage: contextvars.ContextVar = contextvars.ContextVar('current_stage', default=STAGE_JOB)
+# 当前任务的进度汇总，以及 whisper 解码进度的回调
+_current_progress: contextvars.ContextVar = contextvars.ContextVar('current_progress', default=None)
+_transcribe_progress: contextvars.ContextVar = contextvars.ContextVar('transcribe_progress', default=None)
+# 当前任务的取消令牌
+_current_cancel: contextvars.ContextVar = contextvars.ContextVar('current_cancel', default=None)
+
+# whisper 的输入采样率，以及每秒音频对应的梅尔帧数
+WHISPER_SAMPLE_RATE = 16000
+WHISPER_FRAMES_PER_SECOND = 100
+
+# 交给 whisper 的音频：已解码的16kHz单声道波形（长音频为 int16 的 memmap）、只含语音片段的视图，
+# 或由 whisper 自行解码的媒体文件路径
+AudioInput = Union[str, np.ndarray, SpeechAudio]
+# whisper 的中文提示词
+TRANSCRIBE_PROMPT = "以下是一段视频的转录内容。请用流畅的中文输出。"
+
+
+def _format_timestamp(seconds: float) -> str:
+    """把秒数格式化为 01:02:03 的形式"""
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+class _WhisperProgressBar:
+    """包装 whisper 内部使用的 tqdm 进度条，在原有行为之外把解码进度转发给当前任务
+    
+    回调保存在上下文变量中，多个线程同时转录时互不干扰；没有回调时（其他调用方）与原进度条完全相同。
+    """
+
+    def __init__(self, bar):
+        self._bar = bar
+
+    def __enter__(self):
+        self._bar.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._bar.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._bar, name)
+
+    def update(self, n: int = 1) -> None:
+        self._bar.update(n)
+        callback = _transcribe_progress.get()
+        if callback is None:
+            return
+        # whisper 每解码完一段（约30秒音频）更新一次，借此检查任务是否已取消
+        token = _current_cancel.get()
+        if token is not None:
+            token.raise_if_cancelled()
+        total = self._bar.total or 0
+        callback(min(self._bar.n, total), total)
+
+
+_whisper_hook_lock = threading.Lock()
+_whisper_hook_users = 0
+_whisper_original_tqdm = None
+
+
+@contextmanager
+def _whisper_progress_hook() -> Iterator[None]:
+    """转录期间让 whisper.transcribe 的进度条经过 _WhisperProgressBar，结束后恢复原样
+    
+    多个转录同时进行时，第一个开始时替换、最后一个结束时恢复。
+    """
+    global _whisper_hook_users, _whisper_original_tqdm
+    try:
+        whisper_transcribe = importlib.import_module('whisper.transcribe')
+    except ImportError:
+        yield
+        return
+    with _whisper_hook_lock:
+        if _whisper_hook_users == 0:
+            _whisper_original_tqdm = getattr(whisper_transcribe, 'tqdm', None)
+            if _whisper_original_tqdm is not None:
+                original = _whisper_original_tqdm
+                whisper_transcribe.tqdm = types.SimpleNamespace(
+                    tqdm=lambda *args, **kwargs: _WhisperProgressBar(original.tqdm(*args, **kwargs)))
+        _whisper_hook_users += 1
+    try:
+        yield
+    finally:
+        with _whisper_hook_lock:
+            _whisper_hook_users -= 1
+            if _whisper_hook_users == 0 and _whisper_original_tqdm is not None:
+                whisper_transcribe.tqdm = _whisper_original_tqdm
+                _whisper_original_tqdm = None
 
 class DownloadError(Exception):
     """自定义下载错误类"""
@@ -132,24 +252,272 @@ class DownloadError(Exception):
         self.details = details
         super().__init__(self.message)
 
+# 小红书笔记的结构化输出格式
+# 字段顺序有意把 title、image_keywords、tag_groups 放在 body 之前，流式生成时可以尽早拿到
+XIAOHONGSHU_TAG_GROUPS = {
+    'core': '核心关键词',
+    'related': '关联关键词',
+    'conversion': '高转化词',
+    'trending': '热搜词'
+}
+
+XIAOHONGSHU_NOTE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "image_keywords": {"type": "array", "items": {"type": "string"}},
+        "tag_groups": {
+            "type": "object",
+            "properties": {
+                group: {"type": "array", "items": {"type": "string"}}
+                for group in XIAOHONGSHU_TAG_GROUPS
+            },
+            "required": list(XIAOHONGSHU_TAG_GROUPS),
+            "additionalProperties": False
+        },
+        "body": {"type": "string"}
+    },
+    "required": ["title", "image_keywords", "tag_groups", "body"],
+    "additionalProperties": False
+}
+
+
+# 常见主题的中英文图片关键词对照表
+# 模型没有返回英文配图关键词时，优先用它查找，避免再发起一次翻译请求
+IMAGE_KEYWORD_DICTIONARY = {
+    '理财': 'finance',
+    '投资': 'investment',
+    '保险': 'insurance',
+    '基金': 'stock market',
+    '股票': 'stock market',
+    '创业': 'startup',
+    '职场': 'office',
+    '工作': 'workspace',
+    '效率': 'productivity',
+    '学习': 'study',
+    '读书': 'books',
+    '考试': 'exam',
+    '英语': 'english learning',
+    '编程': 'programming',
+    '程序员': 'programmer',
+    '人工智能': 'artificial intelligence',
+    'AI': 'artificial intelligence',
+    '科技': 'technology',
+    '手机': 'smartphone',
+    '电脑': 'laptop',
+    '摄影': 'photography',
+    '旅行': 'travel',
+    '旅游': 'travel',
+    '美食': 'food',
+    '烹饪': 'cooking',
+    '咖啡': 'coffee',
+    '减肥': 'fitness',
+    '健身': 'fitness',
+    '运动': 'sports',
+    '瑜伽': 'yoga',
+    '健康': 'healthy lifestyle',
+    '睡眠': 'sleep',
+    '护肤': 'skincare',
+    '美妆': 'makeup',
+    '穿搭': 'fashion',
+    '家居': 'home interior',
+    '装修': 'interior design',
+    '育儿': 'parenting',
+    '宠物': 'pet',
+    '猫': 'cat',
+    '狗': 'dog',
+    '音乐': 'music',
+    '电影': 'cinema',
+    '设计': 'design',
+    '心理': 'mindfulness',
+    '情感': 'relationship',
+    '自然': 'nature',
+    '汽车': 'car',
+}
+
+
+def keywords_from_dictionary(texts: List[str], limit: int = 3) -> List[str]:
+    """按对照表把中文标题/标签映射为英文图片关键词
+    
+    Args:
+        texts: 标题和标签等中文文本
+        limit: 最多返回的关键词数量
+        
+    Returns:
+        List[str]: 去重后的英文关键词，未命中时为空列表
+    """
+    keywords = []
+    for text in texts:
+        for word, keyword in IMAGE_KEYWORD_DICTIONARY.items():
+            if word in text and keyword not in keywords:
+                keywords.append(keyword)
+                if len(keywords) >= limit:
+                    return keywords
+    return keywords
+
+
+class JsonFieldStreamer:
+    """从流式返回的JSON文本中，实时解码出某个字符串字段的内容
+    
+    用于结构化输出时把正文一边生成一边推送到界面，而不必等完整的JSON返回。
+    """
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field: str):
+        self._key_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ''
+        self._started = False
+        self._finished = False
+
+    def feed(self, chunk: str) -> str:
+        """输入一段新的JSON文本，返回该字段新解码出的内容"""
+        if self._finished:
+            return ''
+        self._buffer += chunk
+        if not self._started:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return ''
+            self._started = True
+            self._buffer = self._buffer[match.end():]
+
+        buf = self._buffer
+        output = []
+        i = 0
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._finished = True
+                i += 1
+                break
+            if ch != '\\':
+                output.append(ch)
+                i += 1
+                continue
+            # 转义序列不完整时等待下一段文本
+            if i + 1 >= len(buf):
+                break
+            escape = buf[i + 1]
+            if escape != 'u':
+                output.append(self._ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # UTF-16 代理对，需要连同低位一起解码
+                if i + 12 > len(buf):
+                    break
+                if buf[i + 6:i + 8] == '\\u':
+                    low = int(buf[i + 8:i + 12], 16)
+                    output.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+            output.append(chr(code))
+            i += 6
+
+        self._buffer = buf[i:]
+        return ''.join(output)
+
+
+def parse_structured_note(raw: str) -> Optional[Dict]:
+    """解析结构化输出返回的JSON笔记
+    
+    Args:
+        raw: 模型返回的文本，允许带有 ```json 代码块包裹
+        
+    Returns:
+        Optional[Dict]: 包含 title、content、tags、tag_groups、image_keywords 的笔记数据，
+        无法解析或缺少正文时返回 None
+    """
+    text = raw.strip()
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    body = str(data.get('body') or '').strip()
+    if not body:
+        return None
+
+    tag_groups = {}
+    raw_groups = data.get('tag_groups')
+    if isinstance(raw_groups, dict):
+        for group, group_tags in raw_groups.items():
+            if isinstance(group_tags, str):
+                group_tags = [group_tags]
+            cleaned = [str(tag).strip().lstrip('#').strip() for tag in group_tags or []]
+            cleaned = [tag for tag in cleaned if tag]
+            if cleaned:
+                tag_groups[group] = cleaned
+    tags = list(dict.fromkeys(tag for group_tags in tag_groups.values() for tag in group_tags))
+
+    keywords = data.get('image_keywords') or []
+    if isinstance(keywords, str):
+        keywords = keywords.split(',')
+    image_keywords = [str(keyword).strip() for keyword in keywords if str(keyword).strip()]
+
+    return {
+        'title': str(data.get('title') or '').strip(),
+        'content': body,
+        'tags': tags,
+        'tag_groups': tag_groups,
+        'image_keywords': image_keywords
+    }
+
+
 class VideoNoteGenerator:
-    def __init__(self, output_dir: str = "temp_notes"):
+    def __init__(self, output_dir: str = "temp_notes", on_token: Optional[Callable[[str], None]] = None,
+                 structured_output: bool = True, on_token_reset: Optional[Callable[[], None]] = None):
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
+
+        # 流式输出回调：每收到一段模型生成的文本就调用一次
+        self.on_token = on_token
+        # 已推送的流式文本作废时调用（如结构化输出解析失败、改用文本模式重新生成）
+        self.on_token_reset = on_token_reset
+        # 处理进度事件总线，GUI 等调用方订阅它获取日志、进度和流式文本
+        self.events = EventBus()
+        # 是否使用JSON结构化输出生成小红书笔记
+        self.structured_output = structured_output
+
+        # 是否给提示词前缀加显式缓存标记（Anthropic、Gemini 等模型需要）
+        self.prompt_cache = os.getenv('OPENROUTER_PROMPT_CACHE', '').lower() in ('1', 'true', 'yes')
+
+        # 配图在后台线程中搜索和下载，与笔记生成、写入并行
+        self.image_dir = os.path.join(self.output_dir, 'images')
+        os.makedirs(self.image_dir, exist_ok=True)
+        self._image_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='note-images')
         
         self.openrouter_available = openrouter_available
         self.unsplash_client = unsplash_client
         self.ffmpeg_path = ffmpeg_path
         
+        # 未完成的下载保留在缓存中，重新处理同一视频时续传（见 downloads.py）
+        self.download_cache = DownloadCache(os.path.join(self.output_dir, 'download_cache'))
+        self.download_cache.prune()
+
+        # 下载失败时按错误类型决定是否重试（见 retry.py）
+        self.retry_policy = RetryPolicy()
+
+        # 多个任务共享同一个Whisper模型，加载和转录时加锁
+        self._whisper_lock = threading.RLock()
+
         # 初始化whisper模型
-        print("正在加载Whisper模型...")
+        self._log("正在加载Whisper模型...")
         self.whisper_model = None
         try:
             self.whisper_model = whisper.load_model("medium")
-            print("✅ Whisper模型加载成功")
+            self._log("✅ Whisper模型加载成功", LEVEL_SUCCESS)
         except Exception as e:
-            print(f"⚠️ Whisper模型加载失败: {str(e)}")
-            print("将在需要时重试加载")
+            self._log(f"⚠️ Whisper模型加载失败: {str(e)}", LEVEL_WARNING)
+            self._log("将在需要时重试加载")
         
         # 日志目录
         self.log_dir = os.path.join(self.output_dir, 'logs')
@@ -159,22 +527,40 @@ class VideoNoteGenerator:
         self.cookie_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cookies')
         os.makedirs(self.cookie_dir, exist_ok=True)
         
-        # 平台cookie文件
-        self.platform_cookies = {
-            'douyin': os.path.join(self.cookie_dir, 'douyin_cookies.txt'),
-            'bilibili': os.path.join(self.cookie_dir, 'bilibili_cookies.txt'),
-            'youtube': os.path.join(self.cookie_dir, 'youtube_cookies.txt')
-        }
+        # 按平台限制并发下载数（同一台机器上的所有进程合计），并在每个平台的多个cookie文件之间轮换（见 download_scheduler.py）
+        self.download_scheduler = PlatformScheduler(self.cookie_dir)
+        self._douyin_client: Optional[httpx.Client] = None
+        self._douyin_client_lock = threading.Lock()
     
+    def _reserve_note_prefix(self) -> str:
+        """生成本次笔记文件名的时间戳前缀，同一秒内的多个任务依次加上 _2、_3 后缀
+        
+        以独占方式创建原始转录文件来占用前缀，多个进程甚至多台机器共用同一输出目录时也不会冲突。
+        """
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        prefix, index = timestamp, 1
+        while True:
+            try:
+                fd = os.open(os.path.join(self.output_dir, f"{prefix}_original.md"),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                index += 1
+                prefix = f"{timestamp}_{index}"
+                continue
+            os.close(fd)
+            return prefix
+
     def _ensure_whisper_model(self) -> None:
         """确保Whisper模型已加载"""
-        if self.whisper_model is None:
+        with self._whisper_lock:
+            if self.whisper_model is not None:
+                return
             try:
-                print("正在加载Whisper模型...")
+                self._log("正在加载Whisper模型...")
                 self.whisper_model = whisper.load_model("medium")
-                print("✅ Whisper模型加载成功")
+                self._log("✅ Whisper模型加载成功", LEVEL_SUCCESS)
             except Exception as e:
-                print(f"⚠️ Whisper模型加载失败: {str(e)}")
+                self._log(f"⚠️ Whisper模型加载失败: {str(e)}", LEVEL_WARNING)
 
     def _determine_platform(self, url: str) -> Optional[str]:
         """
@@ -186,11 +572,14 @@ class VideoNoteGenerator:
         Returns:
             str: 平台名称 ('youtube', 'douyin', 'bilibili') 或 None
         """
+        key = video_key(url)
+        if key is not None:
+            return key[0]
         if 'youtube.com' in url or 'youtu.be' in url:
             return 'youtube'
         elif 'douyin.com' in url:
             return 'douyin'
-        elif 'bilibili.com' in url:
+        elif 'bilibili.com' in url or 'b23.tv' in url:
             return 'bilibili'
         return None
 
@@ -207,174 +596,216 @@ class VideoNoteGenerator:
             str: 用户友好的错误消息
         """
         error_msg = str(error)
+        # 与重试策略使用同一套分类，不会把视频 ID 中的数字当作状态码
+        category = classify_error(error)
         
         if "SSL" in error_msg:
             return "⚠️ SSL证书验证失败，请检查网络连接"
-        elif "cookies" in error_msg.lower():
-            return f"⚠️ {platform}访问被拒绝，可能需要更新cookie或更换IP地址"
-        elif "404" in error_msg:
-            return "⚠️ 视频不存在或已被删除"
-        elif "403" in error_msg:
-            return "⚠️ 访问被拒绝，可能需要登录或更换IP地址"
-        elif "unavailable" in error_msg.lower():
-            return "⚠️ 视频当前不可用，可能是地区限制或版权问题"
+        elif category == ERROR_PERMANENT:
+            return "⚠️ 视频不存在、已删除或当前不可用（私密视频、地区限制或版权问题）"
+        elif category == ERROR_AUTH:
+            return f"⚠️ {platform}访问被拒绝，可能需要登录、更新cookie或更换IP地址"
+        elif category == ERROR_RATE_LIMIT:
+            return f"⚠️ {platform}请求过于频繁，请稍后再试或更换IP地址"
         else:
             return f"⚠️ 下载失败: {error_msg}"
 
-    def _get_platform_options(self, platform: str) -> Dict:
+    def _get_platform_options(self, platform: str, cookie_file: Optional[str] = None) -> Dict:
         """获取平台特定的下载选项"""
-        # 基本选项
-        options = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'outtmpl': '%(title)s.%(ext)s'
-        }
-        
-        if platform in self.platform_cookies and os.path.exists(self.platform_cookies[platform]):
-            options['cookiefile'] = self.platform_cookies[platform]
-            
+        options = {}
+        if cookie_file and os.path.exists(cookie_file):
+            options['cookiefile'] = cookie_file
         return options
 
     def _validate_cookies(self, platform: str) -> bool:
-        """验证cookie是否有效"""
-        if platform not in self.platform_cookies:
-            return False
-        
-        cookie_file = self.platform_cookies[platform]
-        return os.path.exists(cookie_file)
+        """检查平台是否配置了cookie文件"""
+        return len(self.download_scheduler.cookie_pool(platform)) > 0
 
     def _get_alternative_download_method(self, platform: str, url: str) -> Optional[str]:
         """获取备用下载方法"""
         if platform == 'youtube':
             return 'pytube'
         elif platform == 'douyin':
-            return 'requests'
+            return 'httpx'
         elif platform == 'bilibili':
             return 'you-get'
         return None
 
-    def _download_with_alternative_method(self, platform: str, url: str, temp_dir: str, method: str) -> Optional[str]:
-        """使用备用方法下载"""
+    def _log_retry(self, error: Exception, category: str, attempt: int, delay: float) -> None:
+        """RetryPolicy 的重试回调：记录失败原因和等待时间"""
+        self._log(f"⚠️ 下载失败（第{attempt}次，{ERROR_NAMES[category]}）: {str(error)}", LEVEL_WARNING)
+        self._log(f"等待{delay:.1f}秒后重试...")
+
+    def _download_with_alternative_method(self, platform: str, url: str, temp_dir: str,
+                                          method: str) -> Optional[Tuple[AudioInput, Dict[str, str]]]:
+        """使用备用方法下载，失败时按 retry_policy 重试
+        
+        Returns:
+            Optional[Tuple[AudioInput, Dict[str, str]]]: 解码后的音频（或媒体文件路径）和视频信息，失败时返回 None
+        """
         try:
-            if method == 'you-get':
-                cmd = ['you-get', '--no-proxy', '--no-check-certificate', '-o', temp_dir, url]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    # 查找下载的文件
-                    files = [f for f in os.listdir(temp_dir) if f.endswith(('.mp4', '.flv', '.webm'))]
-                    if files:
-                        return os.path.join(temp_dir, files[0])
-                raise Exception(result.stderr)
-                
-            elif method == 'requests':
-                # 使用requests直接下载
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_2_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.0.3 Mobile/15E148 Safari/604.1',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1'
-                }
-                
-                # 首先获取页面内容
-                response = httpx.get(url, headers=headers, verify=False)
-                
-                if response.status_code == 200:
-                    # 尝试从页面中提取视频URL
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    
-                    video_url = None
-                    # 查找video标签
-                    video_tags = soup.find_all('video')
-                    for video in video_tags:
-                        src = video.get('src') or video.get('data-src')
-                        if src:
-                            video_url = src
-                            break
-                    
-                    if not video_url:
-                        # 尝试查找其他可能包含视频URL的元素
-                        import re
-                        video_patterns = [
-                            r'https?://[^"\'\s]+\.(?:mp4|m3u8)[^"\'\s]*',
-                            r'playAddr":"([^"]+)"',
-                            r'play_url":"([^"]+)"'
-                        ]
-                        for pattern in video_patterns:
-                            matches = re.findall(pattern, response.text)
-                            if matches:
-                                video_url = matches[0]
-                                break
-                    
-                    if video_url:
-                        if not video_url.startswith('http'):
-                            video_url = 'https:' + video_url if video_url.startswith('//') else video_url
-                        
-                        # 下载视频
-                        video_response = httpx.get(video_url, headers=headers, stream=True, verify=False)
-                        if video_response.status_code == 200:
-                            file_path = os.path.join(temp_dir, 'video.mp4')
-                            with open(file_path, 'wb') as f:
-                                for chunk in video_response.iter_content(chunk_size=8192):
-                                    if chunk:
-                                        f.write(chunk)
-                            return file_path
-                        
-                    raise Exception(f"无法下载视频: HTTP {video_response.status_code}")
-                raise Exception(f"无法访问页面: HTTP {response.status_code}")
-                
-            elif method == 'pytube':
-                # 禁用SSL验证
-                import ssl
-                ssl._create_default_https_context = ssl._create_unverified_context
-                
-                from pytube import YouTube
-                yt = YouTube(url)
-                # 获取最高质量的MP4格式视频
-                video = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
-                if video:
-                    return video.download(output_path=temp_dir)
-                raise Exception("未找到合适的视频流")
-                
+            def attempt_download(attempt: int) -> Tuple[AudioInput, Dict[str, str]]:
+                with self.download_scheduler.slot(platform, self._cancel_token()):
+                    return self._run_alternative_method(platform, url, temp_dir, method)
+
+            return self.retry_policy.call(attempt_download, self._cancel_token(), self._log_retry)
         except Exception as e:
-            print(f"备用下载方法 {method} 失败: {str(e)}")
+            self._log(f"备用下载方法 {method} 失败: {str(e)}", LEVEL_ERROR)
             return None
 
-    def _download_video(self, url: str, temp_dir: str) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
-        """下载视频并返回音频文件路径和信息"""
+    def _run_alternative_method(self, platform: str, url: str, temp_dir: str,
+                                method: str) -> Tuple[AudioInput, Dict[str, str]]:
+        """执行一次备用方法下载，失败时抛出异常"""
+        if method == 'httpx':
+            return self._download_douyin(url, temp_dir)
+
+        if method == 'you-get':
+            cmd = ['you-get', '--no-proxy', '--no-check-certificate', '-o', temp_dir, url]
+            result = run_process(cmd, self._cancel_token(), text=True)
+            files = [f for f in os.listdir(temp_dir) if f.endswith(('.mp4', '.flv', '.webm'))]
+            if result.returncode != 0 or not files:
+                raise Exception(result.stderr)
+            video_path = os.path.join(temp_dir, files[0])
+            title, uploader, duration = os.path.splitext(files[0])[0], '未知作者', 0
+
+        elif method == 'pytube':
+            # 禁用SSL验证
+            import ssl
+            ssl._create_default_https_context = ssl._create_unverified_context
+            
+            from pytube import YouTube
+            yt = YouTube(url)
+            # 获取最高质量的MP4格式视频
+            video = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+            if not video:
+                raise Exception("未找到合适的视频流")
+            video_path = video.download(output_path=temp_dir)
+            title, uploader, duration = yt.title, yt.author, yt.length or 0
+
+        else:
+            raise DownloadError(f"未知的备用下载方法: {method}", "unknown", "platform_error")
+
+        video_info = {
+            'title': title,
+            'uploader': uploader,
+            'description': '',
+            'duration': int(duration or self._probe_duration(video_path)),
+            'platform': platform
+        }
+        return self._load_audio(video_path, video_info['duration']), video_info
+
+    def _get_douyin_client(self) -> httpx.Client:
+        """抖音备用下载共用的连接池，首次使用时创建"""
+        with self._douyin_client_lock:
+            if self._douyin_client is None:
+                self._douyin_client = douyin.create_client()
+            return self._douyin_client
+
+    def _download_douyin(self, url: str, temp_dir: str) -> Tuple[AudioInput, Dict[str, str]]:
+        """从抖音分享页的内嵌数据获取播放地址，边下载边交给 ffmpeg 解码音频
+        
+        流式解码失败（视频的索引数据在文件末尾等）时改为先完整下载视频再解码。
+        """
+        client = self._get_douyin_client()
+        video = douyin.fetch_video(client, url)
+        video_info = {
+            'title': video.title,
+            'uploader': video.author,
+            'description': video.title,
+            'duration': int(video.duration),
+            'platform': 'douyin'
+        }
+        media_url = video.play_urls[0]
+        self._log(f"✅ 已获取抖音视频地址: {video.title}", LEVEL_SUCCESS)
+
+        if self.ffmpeg_path:
+            with client.stream('GET', media_url) as response:
+                response.raise_for_status()
+                # 取消时关闭连接，阻塞中的读取立即返回
+                with on_cancel(self._cancel_token(), response.close):
+                    audio = self._decode_audio('pipe:0', video.duration,
+                                               input_chunks=response.iter_bytes(256 * 1024),
+                                               pcm_path=self._pcm_path(temp_dir, video.duration))
+            if audio is not None:
+                return audio, video_info
+            self._log("⚠️ 边下载边解码音频失败，改为先下载完整视频", LEVEL_WARNING)
+
+        # 多连接下载到缓存目录，中断后重试时从断点继续
+        video_path = self._download_direct(media_url, url, temp_dir, client)
+        return self._load_audio(video_path, video.duration, progress_start=0.9), video_info
+
+    def _download_direct(self, media_url: str, source_url: str, temp_dir: str, client: httpx.Client) -> str:
+        """多连接下载视频直链，未完成的部分保留在下载缓存中，完成后移入任务临时目录"""
+
+        def on_progress(done: int, total: Optional[int]) -> None:
+            if total:
+                self._report_progress(done / total * 0.9, bytes_done=done, bytes_total=total)
+
+        # 同一视频的其他任务正在使用缓存条目时等它完成，不同时写同一个文件
+        with self.download_cache.lock(source_url, self._cancel_token()):
+            cache_path = os.path.join(self.download_cache.entry_dir(source_url), 'video.mp4')
+            RangeDownload(client, media_url, cache_path, token=self._cancel_token(), on_progress=on_progress).run()
+            file_path = os.path.join(temp_dir, 'video.mp4')
+            shutil.move(cache_path, file_path)
+            self.download_cache.discard(source_url)
+        return file_path
+
+    def _download_video(self, url: str, temp_dir: str) -> Tuple[Optional[AudioInput], Optional[Dict[str, str]]]:
+        """下载视频并返回解码后的音频（ffmpeg 不可用时为音频文件路径）和视频信息"""
         try:
             platform = self._determine_platform(url)
             if not platform:
                 raise DownloadError("不支持的视频平台", "unknown", "platform_error")
 
             # 基本下载选项
+            # 下载中的文件放在缓存目录，下载中断或失败后重试时从断点继续；完成后移入临时目录
             options = {
                 'format': 'bestaudio/best',
-                'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                }],
+                'outtmpl': '%(title)s.%(ext)s',
+                'paths': {'home': temp_dir, 'temp': self.download_cache.entry_dir(url)},
+                'continuedl': True,
+                # DASH/HLS 分片并发下载
+                'concurrent_fragment_downloads': download_connections(),
+                # 保留原始音频流，不再转码为 MP3：下载后由 _decode_audio 一次解码为 Whisper 的输入
                 'quiet': True,
                 'no_warnings': True,
+                # 下载进度汇报给当前任务
+                'progress_hooks': [self._download_progress_hook],
             }
+            if aria2c_available():
+                # 直链格式交给 aria2c 按 Range 多连接下载
+                connections = str(download_connections())
+                options['external_downloader'] = {'http': 'aria2c'}
+                options['external_downloader_args'] = {
+                    'aria2c': ['-x', connections, '-s', connections, '-k', '1M', '--continue=true']
+                }
 
-            # 下载视频
-            for attempt in range(3):  # 最多重试3次
-                try:
-                    with yt_dlp.YoutubeDL(options) as ydl:
-                        print(f"正在尝试下载（第{attempt + 1}次）...")
+            scheduler = self.download_scheduler
+
+            def attempt_download(attempt: int) -> Tuple[str, Dict[str, str]]:
+                # 每次尝试重新挑选cookie：鉴权失败或被限流的cookie会暂停使用，重试时自动换一个
+                # 先独占缓存条目再占下载名额：等待同一视频的其他任务时不占用平台的名额
+                with self.download_cache.lock(url, self._cancel_token()), \
+                        scheduler.slot(platform, self._cancel_token()), \
+                        scheduler.cookie_pool(platform).use(url) as cookie_file:
+                    # 上一个持有者完成后会删除缓存条目，这里重新创建（路径不变）
+                    self.download_cache.entry_dir(url)
+                    attempt_options = dict(options, **self._get_platform_options(platform, cookie_file))
+                    with yt_dlp.YoutubeDL(attempt_options) as ydl:
+                        self._log(f"正在尝试下载（第{attempt}次）...")
                         info = ydl.extract_info(url, download=True)
                         if not info:
                             raise DownloadError("无法获取视频信息", platform, "info_error")
 
                         # 找到下载的音频文件
-                        downloaded_files = [f for f in os.listdir(temp_dir) if f.endswith('.mp3')]
-                        if not downloaded_files:
-                            raise DownloadError("未找到下载的音频文件", platform, "file_error")
-
-                        audio_path = os.path.join(temp_dir, downloaded_files[0])
-                        if not os.path.exists(audio_path):
+                        downloads = info.get('requested_downloads') or [{}]
+                        media_path = downloads[0].get('filepath')
+                        if not media_path:
+                            downloaded_files = [f for f in os.listdir(temp_dir) if not f.endswith('.part')]
+                            if not downloaded_files:
+                                raise DownloadError("未找到下载的音频文件", platform, "file_error")
+                            media_path = os.path.join(temp_dir, downloaded_files[0])
+                        if not os.path.exists(media_path):
                             raise DownloadError("音频文件不存在", platform, "file_error")
 
                         video_info = {
@@ -385,98 +816,161 @@ class VideoNoteGenerator:
                             'platform': platform
                         }
 
-                        print(f"✅ {platform}视频下载成功")
-                        return audio_path, video_info
+                        self.download_cache.discard(url)
+                        self._log(f"✅ {platform}视频下载成功", LEVEL_SUCCESS)
 
-                except Exception as e:
-                    print(f"⚠️ 下载失败（第{attempt + 1}次）: {str(e)}")
-                    if attempt < 2:  # 如果不是最后一次尝试
-                        print("等待5秒后重试...")
-                        time.sleep(5)
-                    else:
-                        raise  # 最后一次失败，抛出异常
+                # 解码不占用平台的下载名额，也不随下载一起重试
+                return media_path, video_info
+
+            # 下载视频，按错误类型决定是否重试以及等待时间
+            media_path, video_info = self.retry_policy.call(attempt_download, self._cancel_token(), self._log_retry)
+            return self._load_audio(media_path, video_info['duration'] or 0, progress_start=0.9), video_info
 
         except Exception as e:
             error_msg = self._handle_download_error(e, platform, url)
-            print(f"⚠️ {error_msg}")
+            self._log(f"⚠️ {error_msg}", LEVEL_WARNING)
+            # 视频本身不可用时备用方法也无济于事，其余情况改用备用方法再试一次
+            method = self._get_alternative_download_method(platform, url)
+            if method and classify_error(e) != ERROR_PERMANENT:
+                self._log(f"🔄 改用备用下载方法: {method}")
+                result = self._download_with_alternative_method(platform, url, temp_dir, method)
+                if result:
+                    return result
             return None, None
 
-    def _transcribe_audio(self, audio_path: str) -> str:
-        """使用Whisper转录音频"""
+    def _transcribe_audio(self, audio: AudioInput) -> Tuple[str, List[Dict]]:
+        """使用Whisper转录音频，audio 为已解码的波形（长音频为磁盘上的 memmap，可能已去掉非语音片段）或媒体文件路径
+        
+        长音频按窗口逐段取出交给模型，内存中只保留当前窗口的波形。
+        
+        Returns:
+            Tuple[str, List[Dict]]: 转录文本，以及带时间戳的分段（start/end 为原视频中的秒数）；失败时为空
+        """
         try:
             self._ensure_whisper_model()
             if not self.whisper_model:
                 raise Exception("Whisper模型未加载")
                 
-            print("正在转录音频（这可能需要几分钟）...")
-            result = self.whisper_model.transcribe(
-                audio_path,
-                language='zh',  # 指定中文
-                task='transcribe',
-                best_of=5,
-                initial_prompt="以下是一段视频的转录内容。请用流畅的中文输出。"  # 添加中文提示
-            )
-            return result["text"].strip()
+            self._log("正在转录音频（这可能需要几分钟）...")
+            if isinstance(audio, str):
+                result = self._transcribe_window(audio, 0, 0, TRANSCRIBE_PROMPT)
+                return result["text"].strip(), self._timed_segments(result, 0.0)
+
+            windows = list(audio_buffer.iter_windows(audio))
+            if len(windows) > 1:
+                self._log(f"🎧 长音频分为 {len(windows)} 段依次转录")
+            total_frames = len(audio) * WHISPER_FRAMES_PER_SECOND // WHISPER_SAMPLE_RATE
+            texts = []
+            segments = []
+            for start, end in windows:
+                # 上一段的结尾作为提示词，让相邻两段的用词和标点保持连贯
+                prompt = TRANSCRIBE_PROMPT + (texts[-1][-100:] if texts else '')
+                frames_before = start * WHISPER_FRAMES_PER_SECOND // WHISPER_SAMPLE_RATE
+                result = self._transcribe_window(audio_buffer.to_float(audio[start:end]),
+                                                 frames_before, total_frames, prompt)
+                text = result["text"].strip()
+                if text:
+                    texts.append(text)
+                segments.extend(self._timed_segments(result, start / WHISPER_SAMPLE_RATE,
+                                                     audio if isinstance(audio, SpeechAudio) else None))
+            return ''.join(texts), segments
             
         except Exception as e:
-            print(f"⚠️ 音频转录失败: {str(e)}")
-            return ""
+            self._log(f"⚠️ 音频转录失败: {str(e)}", LEVEL_WARNING)
+            return "", []
+
+    @staticmethod
+    def _timed_segments(result: Dict, offset: float, speech: Optional[SpeechAudio] = None) -> List[Dict]:
+        """把 whisper 一段转录结果中的分段时间换算为原视频中的时间
+        
+        offset 为这一段在（去掉非语音后的）音频中的起点；去掉过非语音片段时再经 speech 换算回原视频。
+        """
+        segments = []
+        for segment in result.get("segments") or []:
+            text = segment["text"].strip()
+            if not text:
+                continue
+            start, end = offset + segment["start"], offset + segment["end"]
+            if speech is not None:
+                start, end = speech.to_original(start), speech.to_original(end, end=True)
+            segments.append({'start': round(start, 2), 'end': round(end, 2), 'text': text})
+        return segments
+
+    def _transcribe_window(self, audio: AudioInput, frames_before: int, total_frames: int, prompt: str) -> Dict:
+        """转录一段音频，返回 whisper 的结果
+        
+        frames_before/total_frames 为这一段在整段音频中的位置（梅尔帧），用于汇报总进度。
+        """
+        started = time.monotonic()
+
+        def on_frames(done: int, total: int) -> None:
+            # whisper 每秒音频对应100个梅尔帧，据此计算转录速度（相对实时的倍数）
+            elapsed = time.monotonic() - started
+            speed = f"{done / WHISPER_FRAMES_PER_SECOND / elapsed:.1f}x" if elapsed > 0 else None
+            overall_total = total_frames or total
+            fraction = (frames_before + done) / overall_total if overall_total else 0.0
+            self._report_progress(min(fraction, 1.0), speed=speed)
+
+        progress_token = _transcribe_progress.set(on_frames)
+        try:
+            # 同一个模型不能同时解码多段音频（解码时会在模型上挂载缓存钩子），多个任务依次使用
+            with acquire_lock(self._whisper_lock, self._cancel_token()), _whisper_progress_hook():
+                return self.whisper_model.transcribe(
+                    audio,
+                    language='zh',  # 指定中文
+                    task='transcribe',
+                    best_of=5,
+                    initial_prompt=prompt  # 添加中文提示
+                )
+        finally:
+            _transcribe_progress.reset(progress_token)
+
+    @staticmethod
+    def _release_audio(audio: AudioInput) -> None:
+        """关闭长音频的文件映射，之后不能再访问该音频"""
+        if isinstance(audio, SpeechAudio):
+            audio.close()
+        elif isinstance(audio, np.ndarray):
+            audio_buffer.release(audio)
+
+    def _trim_silence(self, audio: AudioInput) -> AudioInput:
+        """去掉音频中的静音和低音量片段，返回只含语音的视图；未检测到可去掉的片段时原样返回"""
+        if isinstance(audio, str) or not vad_enabled():
+            return audio
+        regions = detect_speech(audio)
+        if not regions:
+            # 整段都没有检测到语音时不作处理，交给 whisper 判断
+            return audio
+        speech = SpeechAudio(audio, regions)
+        removed = speech.original_seconds - speech.speech_seconds
+        if removed < 1:
+            return audio
+        self._log(f"🔇 去掉非语音片段 {format_duration(removed)}（占 {removed / speech.original_seconds:.0%}），"
+                  f"只转录其余 {format_duration(speech.speech_seconds)} 的语音")
+        return speech
 
     def _organize_content(self, content: str) -> str:
         """使用AI整理内容"""
         try:
             if not self.openrouter_available:
-                print("⚠️ OpenRouter API 未配置，将返回原始内容")
+                self._log("⚠️ OpenRouter API 未配置，将返回原始内容", LEVEL_WARNING)
                 return content
 
-            # 构建系统提示词
-            system_prompt = """你是一位著名的科普作家和博客作者，著作等身，屡获殊荣，尤其在内容创作领域有深厚的造诣。
-
-请使用 4C 模型（建立联系 Connection、展示冲突 Conflict、强调改变 Change、即时收获 Catch）为转录的文字内容创建结构。
-
-写作要求：
-- 从用户的问题出发，引导读者理解核心概念及其背景
-- 使用第二人称与读者对话，语气亲切平实
-- 确保所有观点和内容基于用户提供的转录文本
-- 如无具体实例，则不编造
-- 涉及复杂逻辑时，使用直观类比
-- 避免内容重复冗余
-- 逻辑递进清晰，从问题开始，逐步深入
-
-Markdown格式要求：
-- 大标题突出主题，吸引眼球，最好使用疑问句
-- 小标题简洁有力，结构清晰，尽量使用单词或短语
-- 直入主题，在第一部分清晰阐述问题和需求
-- 正文使用自然段，避免使用列表形式
-- 内容翔实，避免过度简略，特别注意保留原文中的数据和示例信息
-- 如有来源URL，使用文内链接形式
-- 保留原文中的Markdown格式图片链接"""
-
-            # 构建用户提示词
-            final_prompt = f"""请根据以下转录文字内容，创作一篇结构清晰、易于理解的博客文章。
-
-转录文字内容：
-
-{content}"""
-
-            # 调用API
-            response = client.chat.completions.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": final_prompt}
-                ],
+            # 固定的提示词前缀 + 变化的转录内容，便于服务商缓存前缀
+            prompt = get_prompt('organize')
+            # 以流式请求获取，取消任务时可以立即断开连接，不再为剩余的生成付费
+            organized = self._complete_with_streaming(
+                prompt.messages(cache_control=self.prompt_cache, content=content),
+                on_delta=lambda delta: None,
+                stage='organize',
+                prompt_key=prompt.key,
                 temperature=0.7,
                 max_tokens=4000
             )
-            
-            if response.choices:
-                return response.choices[0].message.content.strip()
-            
-            return content
+            return organized or content
 
         except Exception as e:
-            print(f"⚠️ 内容整理失败: {str(e)}")
+            self._log(f"⚠️ 内容整理失败: {str(e)}", LEVEL_WARNING)
             return content
 
     def split_content(self, text: str, max_chars: int = 2000) -> List[str]:
@@ -569,200 +1063,574 @@ Markdown格式要求：
             return ""
         
         if not self.openrouter_available:
-            print("⚠️ OpenRouter API 不可用，将返回原始内容")
+            self._log("⚠️ OpenRouter API 不可用，将返回原始内容", LEVEL_WARNING)
             return content
         
         content_chunks = self.split_content(content)
         organized_chunks = []
         
-        print(f"内容将分为 {len(content_chunks)} 个部分进行处理...")
+        self._log(f"内容将分为 {len(content_chunks)} 个部分进行处理...")
         
         for i, chunk in enumerate(content_chunks, 1):
-            print(f"正在处理第 {i}/{len(content_chunks)} 部分...")
+            self._check_cancelled()
+            self._log(f"正在处理第 {i}/{len(content_chunks)} 部分...")
             organized_chunk = self._organize_content(chunk)
             organized_chunks.append(organized_chunk)
+            self._report_progress(i / len(content_chunks), force=True)
     
         return "\n\n".join(organized_chunks)
 
-    def convert_to_xiaohongshu(self, content: str) -> Tuple[str, List[str], List[str], List[str]]:
-        """将博客文章转换为小红书风格的笔记，并生成标题和标签"""
+    def stream_chat_completion(self, messages: List[Dict], stage: str = 'chat', prompt_key: str = '',
+                               **kwargs) -> Iterator[str]:
+        """以流式方式调用API，逐段返回模型生成的文本
+        
+        Args:
+            messages: 对话消息列表
+            stage: 用量统计中的阶段名称
+            prompt_key: 用量统计中记录的提示词模板标识
+            **kwargs: 透传给 chat.completions.create 的参数，如 temperature、max_tokens
+            
+        Yields:
+            str: 每次收到的增量文本
+            
+        Raises:
+            JobCancelled: 任务被取消，此时已断开连接
+        """
+        token = self._cancel_token()
+        token.raise_if_cancelled()
+        stream = client.chat.completions.create(
+            model=AI_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+        # 取消时关闭响应，正在阻塞读取的迭代会立即出错返回
+        with on_cancel(token, stream.close):
+            try:
+                for chunk in stream:
+                    # 最后一个分块只携带用量信息
+                    if getattr(chunk, 'usage', None):
+                        self._record_usage(stage, chunk.usage, prompt_key)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            except Exception:
+                token.raise_if_cancelled()
+                raise
+        token.raise_if_cancelled()
+
+    def _record_usage(self, stage: str, usage, prompt_key: str = '') -> None:
+        """把一次API调用的 Token 用量记入当前任务的统计"""
+        report = _current_usage.get()
+        if report is not None and usage is not None:
+            report.record(stage, usage, prompt_key)
+
+    def _cancel_token(self) -> CancellationToken:
+        """当前任务的取消令牌，不在任务中调用时返回一个不会被取消的令牌"""
+        return _current_cancel.get() or CancellationToken()
+
+    def _check_cancelled(self) -> None:
+        """当前任务已被取消时抛出 JobCancelled"""
+        token = _current_cancel.get()
+        if token is not None:
+            token.raise_if_cancelled()
+
+    def _log(self, message: str, level: str = LEVEL_INFO) -> None:
+        """输出日志，并作为事件发布给订阅者"""
+        print(message)
+        self._publish(EVENT_LOG, message=message.strip(), level=level)
+
+    def _publish(self, kind: str, **fields) -> None:
+        """以当前任务和阶段发布一条事件"""
+        self.events.publish(ProgressEvent(_current_job.get(), kind, _current_stage.get(), **fields))
+
+    def _set_stage(self, stage: str) -> None:
+        """切换当前任务所处的阶段"""
+        _current_stage.set(stage)
+        tracker = _current_progress.get()
+        if tracker is not None:
+            tracker.start(stage)
+        self._report_progress(0.0, force=True)
+
+    def _report_progress(self, fraction: float, bytes_done: Optional[int] = None,
+                         bytes_total: Optional[int] = None, speed: Optional[str] = None,
+                         force: bool = False) -> None:
+        """汇报当前阶段的完成比例，按权重换算为总进度后发布进度事件
+        
+        Args:
+            fraction: 当前阶段的完成比例（0-1）
+            bytes_done: 已下载的字节数
+            bytes_total: 总字节数
+            speed: 速度描述，如 2.1MB/s、3.5x
+            force: 忽略发布频率限制
+        """
+        tracker = _current_progress.get()
+        if tracker is None:
+            return
+        stage = _current_stage.get()
+        tracker.update(stage, fraction)
+        if not tracker.should_report(force or fraction >= 1.0):
+            return
+        self._publish(
+            EVENT_PROGRESS,
+            message=stage,
+            percent=tracker.percent,
+            eta=tracker.eta,
+            bytes_done=bytes_done,
+            bytes_total=bytes_total,
+            payload={'stage_percent': min(max(fraction, 0.0), 1.0) * 100, 'speed': speed}
+        )
+
+    def _finish_progress(self) -> None:
+        """任务完成，把总进度推到100%"""
+        tracker = _current_progress.get()
+        if tracker is None:
+            return
+        tracker.finish()
+        self._publish(EVENT_PROGRESS, message=_current_stage.get(), percent=100.0, eta=0.0,
+                      payload={'stage_percent': 100.0, 'speed': None})
+
+    def _download_progress_hook(self, status: Dict) -> None:
+        """yt-dlp 下载进度回调，下载占下载阶段的90%，其余留给音频解码
+        
+        每收到一块数据都会调用，在这里抛出 JobCancelled 即可中止 yt-dlp 的下载。
+        """
+        self._check_cancelled()
+        if status.get('status') == 'finished':
+            self._report_progress(0.9, force=True)
+            return
+        if status.get('status') != 'downloading':
+            return
+        done = status.get('downloaded_bytes') or 0
+        total = status.get('total_bytes') or status.get('total_bytes_estimate')
+        if total:
+            fraction = done / total
+        elif status.get('fragment_count'):
+            fraction = (status.get('fragment_index') or 0) / status['fragment_count']
+        else:
+            return
+        speed = status.get('speed')
+        self._report_progress(
+            fraction * 0.9,
+            bytes_done=done,
+            bytes_total=int(total) if total else None,
+            speed=f"{format_bytes(speed)}/s" if speed else None
+        )
+
+    def _probe_duration(self, media_path: str) -> float:
+        """用 ffprobe 获取媒体时长（秒），失败时返回0"""
+        if not self.ffmpeg_path:
+            return 0.0
+        ffprobe_path = os.path.join(os.path.dirname(self.ffmpeg_path), 'ffprobe')
         try:
-            if not self.openrouter_available:
-                print("⚠️ OpenRouter API 未配置，将返回原始内容")
-                return content, [], [], []
-
-            # 构建系统提示词
-            system_prompt = """你是一位专业的小红书爆款文案写作大师，擅长将普通内容转换为刷屏级爆款笔记。
-请将输入的内容转换为小红书风格的笔记，需要满足以下要求：
-
-1. 标题创作（重要‼️）：
-- 二极管标题法：
-  * 追求快乐：产品/方法 + 只需N秒 + 逆天效果
-  * 逃避痛苦：不采取行动 + 巨大损失 + 紧迫感
-- 爆款关键词（必选1-2个）：
-  * 高转化词：好用到哭、宝藏、神器、压箱底、隐藏干货、高级感
-  * 情感词：绝绝子、破防了、治愈、万万没想到、爆款、永远可以相信
-  * 身份词：小白必看、手残党必备、打工人、普通女生
-  * 程度词：疯狂点赞、超有料、无敌、一百分、良心推荐
-- 标题规则：
-  * 字数：20字以内
-  * emoji：2-4个相关表情
-  * 标点：感叹号、省略号增强表达
-  * 风格：口语化、制造悬念
-
-2. 正文创作：
-- 开篇设置（抓住痛点）：
-  * 共情开场：描述读者痛点
-  * 悬念引导：埋下解决方案的伏笔
-  * 场景还原：具体描述场景
-- 内容结构：
-  * 每段开头用emoji引导
-  * 重点内容加粗突出
-  * 适当空行增加可读性
-  * 步骤说明要清晰
-- 写作风格：
-  * 热情亲切的语气
-  * 大量使用口语化表达
-  * 插入互动性问句
-  * 加入个人经验分享
-- 高级技巧：
-  * 使用平台热梗
-  * 加入流行口头禅
-  * 设置悬念和爆点
-  * 情感共鸣描写
-
-3. 标签优化：
-- 提取4类标签（每类1-2个）：
-  * 核心关键词：主题相关
-  * 关联关键词：长尾词
-  * 高转化词：购买意向强
-  * 热搜词：行业热点
-
-4. 整体要求：
-- 内容体量：根据内容自动调整
-- 结构清晰：善用分点和空行
-- 情感真实：避免过度营销
-- 互动引导：设置互动机会
-- AI友好：避免机器味
-
-注意：创作时要始终记住，标题决定打开率，内容决定完播率，互动决定涨粉率！"""
-
-            # 构建用户提示词
-            user_prompt = f"""请将以下内容转换为爆款小红书笔记。
-
-内容如下：
-{content}
-
-请按照以下格式返回：
-1. 第一行：爆款标题（遵循二极管标题法，必须有emoji）
-2. 空一行
-3. 正文内容（注意结构、风格、技巧的运用，控制在600-800字之间）
-4. 空一行
-5. 标签列表（每类标签都要有，用#号开头）
-
-创作要求：
-1. 标题要让人忍不住点进来看
-2. 内容要有干货，但表达要轻松
-3. 每段都要用emoji装饰
-4. 标签要覆盖核心词、关联词、转化词、热搜词
-5. 设置2-3处互动引导
-6. 通篇要有感情和温度
-7. 正文控制在600-800字之间
-
-"""
-
-            # 调用API
+            result = run_process(
+                [ffprobe_path, '-v', 'error', '-show_entries', 'format=duration',
+                 '-of', 'default=noprint_wrappers=1:nokey=1', media_path],
+                self._cancel_token(), timeout=30, text=True
+            )
+            return float(result.stdout.strip())
+        except (OSError, ValueError, subprocess.SubprocessError):
+            return 0.0
+
+    def _load_audio(self, media_path: str, duration: float = 0.0, progress_start: float = 0.0) -> AudioInput:
+        """解码媒体文件中的音频，ffmpeg 不可用或解码失败时返回文件路径，交给 whisper 自行读取"""
+        pcm_dir = os.path.dirname(os.path.abspath(media_path))
+        audio = self._decode_audio(media_path, duration, progress_start=progress_start,
+                                   pcm_path=self._pcm_path(pcm_dir, duration))
+        return audio if audio is not None else media_path
+
+    @staticmethod
+    def _pcm_path(temp_dir: str, duration: float) -> Optional[str]:
+        """长音频（或时长未知）解码到任务临时目录中的 PCM 文件，短音频直接读入内存"""
+        return os.path.join(temp_dir, 'audio.pcm') if audio_buffer.use_disk_buffer(duration) else None
+
+    def _decode_audio(self, media_path: str, duration: float = 0.0,
+                      input_chunks: Optional[Iterable[bytes]] = None,
+                      progress_start: float = 0.0, pcm_path: Optional[str] = None) -> Optional[np.ndarray]:
+        """用 ffmpeg 把媒体一次解码为 Whisper 使用的16kHz单声道 PCM
+        
+        结果与 whisper.load_audio 相同，交给模型时无需再启动 ffmpeg 解码一遍，
+        也省去了先压缩成 MP3/WAV 文件再读回的过程。
+        
+        Args:
+            media_path: 视频或音频文件路径，从 input_chunks 读取时为 'pipe:0'
+            duration: 媒体时长（秒），为0时无法计算进度比例
+            input_chunks: 媒体数据块，提供时通过标准输入边下载边交给 ffmpeg，不落盘
+            progress_start: 解码开始时下载阶段已完成的比例，解码进度汇报在其后的区间内
+            pcm_path: 提供时 PCM 写入该文件并以 memmap 返回，不读入内存（用于长音频）
+            
+        Returns:
+            Optional[np.ndarray]: 短音频为 float32 波形，写入 pcm_path 时为 int16 的 memmap，
+            ffmpeg 不可用或解码失败时返回 None
+        
+        Raises:
+            从 input_chunks 读取数据出错（下载中断等）时抛出该异常，由调用方决定是否重试
+        """
+        if not self.ffmpeg_path:
+            return None
+        cmd = [
+            self.ffmpeg_path, '-i', media_path,
+            '-vn', '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(WHISPER_SAMPLE_RATE),
+            '-nostats', '-loglevel', 'error', 'pipe:1'
+        ]
+        if input_chunks is None:
+            cmd.insert(1, '-nostdin')
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       stdin=subprocess.DEVNULL if input_chunks is None else subprocess.PIPE)
+        except OSError as e:
+            self._log(f"⚠️ 启动ffmpeg失败: {str(e)}", LEVEL_WARNING)
+            return None
+
+        feed_errors: List[Exception] = []
+        helpers = []
+        if input_chunks is not None:
+            def feed() -> None:
+                try:
+                    for chunk in input_chunks:
+                        self._check_cancelled()
+                        process.stdin.write(chunk)
+                except (BrokenPipeError, JobCancelled):
+                    # ffmpeg 已退出或任务已取消，由下面的返回码和取消检查处理
+                    pass
+                except Exception as e:
+                    # 下载中断时结束 ffmpeg，不能把不完整的音频当作结果
+                    feed_errors.append(e)
+                    process.kill()
+                finally:
+                    try:
+                        process.stdin.close()
+                    except OSError:
+                        pass
+
+            helpers.append(threading.Thread(target=contextvars.copy_context().run, args=(feed,),
+                                            name='ffmpeg-feed', daemon=True))
+        # 错误输出在单独的线程中读取，避免输出过多时 ffmpeg 阻塞在写标准错误上
+        stderr_chunks: List[bytes] = []
+        helpers.append(threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()),
+                                        name='ffmpeg-stderr', daemon=True))
+        for helper in helpers:
+            helper.start()
+
+        pcm = bytearray()
+        # 长音频写入磁盘文件，短音频读入内存
+        pcm_file = open(pcm_path, 'wb') if pcm_path else nullcontext()
+        pcm_bytes = 0
+        started = time.monotonic()
+        # 每秒音频对应的 PCM 字节数（16位单声道）
+        bytes_per_second = WHISPER_SAMPLE_RATE * 2
+        token = self._cancel_token()
+        # 取消时结束 ffmpeg，stdout 随之关闭，下面的读取循环立即结束
+        with on_cancel(token, process.kill), pcm_file:
+            while True:
+                chunk = process.stdout.read1(1024 * 1024)
+                if not chunk:
+                    break
+                if pcm_path:
+                    pcm_file.write(chunk)
+                else:
+                    pcm += chunk
+                pcm_bytes += len(chunk)
+                if duration > 0:
+                    seconds = pcm_bytes / bytes_per_second
+                    elapsed = time.monotonic() - started
+                    speed = f"{seconds / elapsed:.0f}x" if elapsed > 0 else None
+                    fraction = min(seconds / duration, 1.0)
+                    self._report_progress(progress_start + (1 - progress_start) * fraction, speed=speed)
+            process.wait()
+            for helper in helpers:
+                helper.join()
+        token.raise_if_cancelled()
+        if feed_errors:
+            raise feed_errors[0]
+
+        if process.returncode != 0 or pcm_bytes < 2:
+            stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+            self._log(f"⚠️ 解码音频失败: {stderr.strip()}", LEVEL_WARNING)
+            return None
+        self._report_progress(1.0)
+        if pcm_path:
+            return audio_buffer.open_pcm(pcm_path)
+        return audio_buffer.to_float(np.frombuffer(pcm, np.int16, count=len(pcm) // 2))
+
+    def _emit_token(self, text: str) -> None:
+        """把流式生成的文本推送给 on_token 回调，并作为事件发布"""
+        if not text:
+            return
+        if self.on_token:
+            self.on_token(text)
+        self._publish(EVENT_TOKEN, payload=text)
+
+    def _reset_tokens(self) -> None:
+        """通知调用方丢弃已推送的流式文本，之后重新生成的内容不会与之重复显示"""
+        if self.on_token_reset:
+            self.on_token_reset()
+        self._publish(EVENT_TOKEN_RESET)
+
+    def _complete_with_streaming(self, messages: List[Dict],
+                                 on_delta: Optional[Callable[[str], None]] = None,
+                                 stage: str = 'chat', prompt_key: str = '', **kwargs) -> str:
+        """流式获取完整回复，并把增量文本推送给 on_delta（默认为 on_token 回调）
+        
+        如果流式请求在收到任何内容之前就失败了（部分模型或代理不支持流式），
+        会退回到普通的一次性请求。
+        """
+        on_delta = on_delta or self._emit_token
+        parts = []
+        try:
+            for delta in self.stream_chat_completion(messages, stage, prompt_key, **kwargs):
+                parts.append(delta)
+                on_delta(delta)
+        except Exception as e:
+            if parts:
+                raise
+            self._log(f"⚠️ 流式请求失败，改用普通请求: {str(e)}", LEVEL_WARNING)
             response = client.chat.completions.create(
                 model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
+                messages=messages,
+                **kwargs
             )
-            
+            self._record_usage(stage, response.usage, prompt_key)
             if not response.choices:
-                raise Exception("API 返回结果为空")
+                return ""
+            content = response.choices[0].message.content or ""
+            if content:
+                on_delta(content)
+            return content.strip()
+        
+        return "".join(parts).strip()
 
-            # 处理返回的内容
-            xiaohongshu_content = response.choices[0].message.content.strip()
-            print(f"\n📝 API返回内容：\n{xiaohongshu_content}\n")
-            
-            # 提取标题（第一行）
-            content_lines = xiaohongshu_content.split('\n')
-            titles = []
-            for line in content_lines:
-                line = line.strip()
-                if line and not line.startswith('#') and '：' not in line and '。' not in line:
-                    titles = [line]
-                    break
-            
-            if not titles:
-                print("⚠️ 未找到标题，尝试其他方式提取...")
-                # 尝试其他方式提取标题
-                title_match = re.search(r'^[^#\n]+', xiaohongshu_content)
-                if title_match:
-                    titles = [title_match.group(0).strip()]
+    def convert_to_xiaohongshu(self, content: str) -> Tuple[str, List[str], List[str], List[str]]:
+        """将博客文章转换为小红书风格的笔记，并生成标题和标签"""
+        note = self.generate_xiaohongshu_note(content)
+        titles = [note['title']] if note['title'] else []
+        return note['content'], titles, note['tags'], note['images']
+
+    def generate_xiaohongshu_note(self, content: str, fetch_images: bool = True,
+                                  on_image_keywords: Optional[Callable[[List[str]], None]] = None) -> Dict:
+        """将博客文章转换为小红书风格的笔记
+        
+        优先使用结构化输出（JSON）一次性获取标题、正文、分组标签和配图关键词；
+        模型不支持或返回内容无法解析时，退回到纯文本模式并按行解析。
+        
+        Args:
+            content: 整理后的博客文章
+            fetch_images: 是否在返回前搜索配图；为 False 时由调用方自行获取
+            on_image_keywords: 结构化输出流式返回配图关键词后立即调用，便于提前开始获取配图
             
-            if titles:
-                print(f"✅ 提取到标题: {titles[0]}")
+        Returns:
+            Dict: 包含 title、content、tags、tag_groups、image_keywords、images 的笔记数据
+        """
+        note = {
+            'title': '',
+            'content': content,
+            'tags': [],
+            'tag_groups': {},
+            'image_keywords': [],
+            'images': []
+        }
+        try:
+            if not self.openrouter_available:
+                self._log("⚠️ OpenRouter API 未配置，将返回原始内容", LEVEL_WARNING)
+                return note
+
+            generated = None
+            if self.structured_output:
+                generated = self._generate_structured_note(content, on_image_keywords)
+            if generated is None:
+                generated = self._generate_text_note(content)
+            note.update(generated)
+
+            if note['title']:
+                self._log(f"✅ 提取到标题: {note['title']}", LEVEL_SUCCESS)
             else:
-                print("⚠️ 未能提取到标题")
-            
-            # 提取标签（查找所有#开头的标签）
-            tags = []
-            tag_matches = re.findall(r'#([^\s#]+)', xiaohongshu_content)
-            if tag_matches:
-                tags = tag_matches
-                print(f"✅ 提取到{len(tags)}个标签")
+                self._log("⚠️ 未能提取到标题", LEVEL_WARNING)
+            if note['tags']:
+                self._log(f"✅ 提取到{len(note['tags'])}个标签", LEVEL_SUCCESS)
             else:
-                print("⚠️ 未找到标签")
+                self._log("⚠️ 未找到标签", LEVEL_WARNING)
             
+            if not note['image_keywords']:
+                # 模型没有给出配图关键词时，先查本地对照表
+                note['image_keywords'] = keywords_from_dictionary(
+                    ([note['title']] if note['title'] else []) + note['tags']
+                )
+
             # 获取相关图片
-            images = []
-            if self.unsplash_client:
-                # 使用标题和标签作为搜索关键词
-                search_terms = titles + tags[:2] if tags else titles
-                search_query = ' '.join(search_terms)
+            if fetch_images and self.unsplash_client:
                 try:
-                    images = self._get_unsplash_images(search_query, count=4)
+                    query, translate = self._image_search_query(note)
+                    images = self._get_unsplash_images(query, count=4, translate=translate)
+                    note['images'] = images
                     if images:
-                        print(f"✅ 成功获取{len(images)}张配图")
+                        self._log(f"✅ 成功获取{len(images)}张配图", LEVEL_SUCCESS)
                     else:
-                        print("⚠️ 未找到相关配图")
+                        self._log("⚠️ 未找到相关配图", LEVEL_WARNING)
                 except Exception as e:
-                    print(f"⚠️ 获取配图失败: {str(e)}")
+                    self._log(f"⚠️ 获取配图失败: {str(e)}", LEVEL_WARNING)
             
-            return xiaohongshu_content, titles, tags, images
+            return note
 
         except Exception as e:
-            print(f"⚠️ 转换小红书笔记失败: {str(e)}")
-            return content, [], [], []
+            self._log(f"⚠️ 转换小红书笔记失败: {str(e)}", LEVEL_WARNING)
+            return note
+
+    def _image_search_query(self, note: Dict) -> Tuple[str, bool]:
+        """根据笔记生成配图搜索词，返回 (搜索词, 是否需要翻译)"""
+        if note['image_keywords']:
+            # 已有英文关键词，无需再翻译
+            return ','.join(note['image_keywords']), False
+        # 对照表也未命中时，使用标题和标签作为搜索关键词并翻译
+        search_terms = ([note['title']] if note['title'] else []) + note['tags'][:2]
+        return ' '.join(search_terms), True
+
+    def _generate_structured_note(self, content: str,
+                                  on_image_keywords: Optional[Callable[[List[str]], None]] = None) -> Optional[Dict]:
+        """以JSON结构化输出生成小红书笔记，失败时返回 None"""
+        prompt = get_prompt('xiaohongshu_structured')
+
+        # 流式返回的是JSON文本，只把 body 字段的内容实时推送出去
+        body_streamer = JsonFieldStreamer('body')
+        received = []
+        keywords_sent = on_image_keywords is None
+        body_streamed = False
+
+        def on_delta(delta: str) -> None:
+            nonlocal keywords_sent, body_streamed
+            text = body_streamer.feed(delta)
+            if text:
+                body_streamed = True
+                self._emit_token(text)
+            if keywords_sent:
+                return
+            # image_keywords 排在 body 之前，完整出现后立即通知调用方
+            received.append(delta)
+            match = re.search(r'"image_keywords"\s*:\s*(\[[^\]]*\])', ''.join(received))
+            if match:
+                keywords_sent = True
+                try:
+                    keywords = [str(k).strip() for k in json.loads(match.group(1)) if str(k).strip()]
+                except (json.JSONDecodeError, TypeError):
+                    return
+                if keywords:
+                    on_image_keywords(keywords)
+
+        try:
+            raw = self._complete_with_streaming(
+                prompt.messages(cache_control=self.prompt_cache, content=content),
+                on_delta=on_delta,
+                stage='xiaohongshu',
+                prompt_key=prompt.key,
+                temperature=0.7,
+                max_tokens=3000,
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "xiaohongshu_note",
+                        "strict": True,
+                        "schema": XIAOHONGSHU_NOTE_SCHEMA
+                    }
+                }
+            )
+        except Exception as e:
+            self._log(f"⚠️ 结构化输出请求失败，改用文本模式: {str(e)}", LEVEL_WARNING)
+            note = raw = None
+        else:
+            print(f"\n📝 API返回内容：\n{raw}\n")
+            note = parse_structured_note(raw)
+            if note is None:
+                self._log("⚠️ 结构化输出解析失败，改用文本模式", LEVEL_WARNING)
+        if note is None and body_streamed:
+            # 文本模式会重新推送整篇笔记，先让调用方清掉已显示的部分
+            self._reset_tokens()
+        return note
+
+    def _generate_text_note(self, content: str) -> Dict:
+        """以纯文本格式生成小红书笔记，并按行解析标题和标签"""
+        prompt = get_prompt('xiaohongshu_text')
+
+        # 流式调用API，生成的文本实时交给 on_token 回调
+        xiaohongshu_content = self._complete_with_streaming(
+            prompt.messages(cache_control=self.prompt_cache, content=content),
+            stage='xiaohongshu',
+            prompt_key=prompt.key,
+            temperature=0.7,
+            max_tokens=2000
+        )
+        
+        if not xiaohongshu_content:
+            raise Exception("API 返回结果为空")
+
+        # 处理返回的内容
+        print(f"\n📝 API返回内容：\n{xiaohongshu_content}\n")
+        
+        # 提取标题（第一行）
+        content_lines = xiaohongshu_content.split('\n')
+        title = ''
+        for line in content_lines:
+            line = line.strip()
+            if line and not line.startswith('#') and '：' not in line and '。' not in line:
+                title = line
+                break
+        
+        if not title:
+            self._log("⚠️ 未找到标题，尝试其他方式提取...", LEVEL_WARNING)
+            # 尝试其他方式提取标题
+            title_match = re.search(r'^[^#\n]+', xiaohongshu_content)
+            if title_match:
+                title = title_match.group(0).strip()
+        
+        # 提取配图关键词，并从正文中去掉这一行
+        image_keywords = []
+        keyword_match = re.search(r'^\s*配图关键词[:：]\s*(.+?)\s*$', xiaohongshu_content, re.MULTILINE)
+        if keyword_match:
+            image_keywords = [k.strip() for k in re.split(r'[,，]', keyword_match.group(1)) if k.strip()]
+            xiaohongshu_content = (xiaohongshu_content[:keyword_match.start()]
+                                   + xiaohongshu_content[keyword_match.end():]).strip()
+        
+        # 提取标签（查找所有#开头的标签）
+        tags = re.findall(r'#([^\s#]+)', xiaohongshu_content)
+        
+        return {
+            'title': title,
+            'content': xiaohongshu_content,
+            'tags': tags,
+            'tag_groups': {},
+            'image_keywords': image_keywords
+        }
 
-    def _get_unsplash_images(self, query: str, count: int = 3) -> List[str]:
-        """从Unsplash获取相关图片"""
+    def _get_unsplash_images(self, query: str, count: int = 3, translate: bool = True) -> List[str]:
+        """从Unsplash获取相关图片
+        
+        Args:
+            query: 搜索关键词，多个关键词用逗号分隔
+            count: 需要的图片数量
+            translate: 是否先把关键词翻译成英文；关键词已是英文时应传 False
+        """
         if not self.unsplash_client:
-            print("⚠️ Unsplash客户端未初始化")
+            self._log("⚠️ Unsplash客户端未初始化", LEVEL_WARNING)
             return []
             
         try:
             # 将查询词翻译成英文以获得更好的结果
-            if self.openrouter_available:
+            if translate and self.openrouter_available:
+                self._check_cancelled()
                 try:
+                    prompt = get_prompt('image_keyword_translation')
                     response = client.chat.completions.create(
                         model=AI_MODEL,
-                        messages=[
-                            {"role": "system", "content": "你是一个翻译助手。请将输入的中文关键词翻译成最相关的1-3个英文关键词，用逗号分隔。直接返回翻译结果，不要加任何解释。例如：\n输入：'保险理财知识'\n输出：insurance,finance,investment"},
-                            {"role": "user", "content": query}
-                        ],
+                        messages=prompt.messages(content=query),
                         temperature=0.3,
                         max_tokens=50
                     )
+                    self._record_usage('image_keywords', response.usage, prompt.key)
                     if response.choices:
                         query = response.choices[0].message.content.strip()
                 except Exception as e:
-                    print(f"⚠️ 翻译关键词失败: {str(e)}")
+                    self._log(f"⚠️ 翻译关键词失败: {str(e)}", LEVEL_WARNING)
             
             # 使用httpx直接调用Unsplash API
             headers = {
@@ -772,6 +1640,7 @@ Markdown格式要求：
             # 对每个关键词分别搜索
             all_photos = []
             for keyword in query.split(','):
+                self._check_cancelled()
                 response = httpx.get(
                     'https://api.unsplash.com/search/photos',
                     params={
@@ -794,6 +1663,7 @@ Markdown格式要求：
             
             # 如果收集到的图片不够，用最后一个关键词继续搜索
             while len(all_photos) < count and query:
+                self._check_cancelled()
                 response = httpx.get(
                     'https://api.unsplash.com/search/photos',
                     params={
@@ -822,16 +1692,106 @@ Markdown格式要求：
             return all_photos[:count]
             
         except Exception as e:
-            print(f"⚠️ 获取图片失败: {str(e)}")
+            self._log(f"⚠️ 获取图片失败: {str(e)}", LEVEL_WARNING)
             return []
 
+    def _fetch_note_images(self, query: str, translate: bool = True, count: int = 4) -> List[Dict[str, str]]:
+        """搜索配图并下载到本地图片目录
+        
+        Args:
+            query: 搜索关键词，多个关键词用逗号分隔
+            translate: 是否需要先把关键词翻译成英文
+            count: 需要的图片数量
+            
+        Returns:
+            List[Dict[str, str]]: 每张图片的 url 和本地路径 path（下载失败时 path 为空）
+        """
+        self._set_stage(STAGE_IMAGES)
+        urls = self._get_unsplash_images(query, count=count, translate=translate)
+        if not urls:
+            return []
+
+        token = self._cancel_token()
+        with httpx.Client(verify=False, timeout=30, follow_redirects=True) as http_client:
+            # 取消时关闭连接池，进行中的下载立即中断
+            with on_cancel(token, http_client.close):
+                # 每个下载线程使用当前上下文的副本，以便检查本任务的取消令牌
+                contexts = [contextvars.copy_context() for _ in urls]
+                with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+                    paths = list(executor.map(
+                        lambda context, url: context.run(self._download_image, http_client, url),
+                        contexts, urls
+                    ))
+        token.raise_if_cancelled()
+        return [{'url': url, 'path': path or ''} for url, path in zip(urls, paths)]
+
+    def _download_image(self, http_client: httpx.Client, url: str) -> Optional[str]:
+        """下载单张图片，同一URL已下载过时直接复用本地文件"""
+        file_path = os.path.join(self.image_dir, image_cache_name(url))
+        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            return file_path
+        # 每次下载使用独立的临时文件，多个任务同时下载同一张图片时互不覆盖，完成后原子替换
+        partial_path = f"{file_path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            with http_client.stream('GET', url) as response:
+                response.raise_for_status()
+                with open(partial_path, 'wb') as f:
+                    for chunk in response.iter_bytes(chunk_size=65536):
+                        self._check_cancelled()
+                        f.write(chunk)
+            os.replace(partial_path, file_path)
+            return file_path
+        except Exception as e:
+            if not self._cancel_token().cancelled:
+                self._log(f"⚠️ 下载配图失败: {str(e)}", LEVEL_WARNING)
+            return None
+        finally:
+            # 下载失败或被取消时删除不完整的文件
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def _write_xiaohongshu_note(self, xiaohongshu_file: str, note: Dict, title: str,
+                                images: List[Dict[str, str]]) -> None:
+        """写入小红书笔记及其结构化数据文件"""
+        image_urls = [image['url'] for image in images]
+        tags = note['tags']
+
+        with open(xiaohongshu_file, "w", encoding="utf-8") as f:
+            # 写入标题
+            f.write(f"# {title}\n\n")
+            
+            # 如果有图片，先写入第一张作为封面
+            if image_urls:
+                f.write(f"![封面图]({image_urls[0]})\n\n")
+            
+            # 写入正文内容
+            f.write(note['content'])
+            
+            # 如果有额外的图片，在文章中间和末尾插入
+            if len(image_urls) > 1:
+                f.write(f"\n\n![配图]({image_urls[1]})")
+            if len(image_urls) > 2:
+                f.write(f"\n\n![配图]({image_urls[2]})")
+            
+            # 写入标签
+            if tags:
+                f.write("\n\n---\n")
+                f.write("\n".join([f"#{tag}" for tag in tags]))
+
+        # 同时保存结构化数据，GUI 可以直接读取而无需再解析 markdown，也可以复用已下载的图片
+        # image_files 与 images 一一对应，下载失败的图片为空字符串
+        note_data = dict(note, title=title, images=image_urls,
+                         image_files=[image['path'] for image in images])
+        with open(note_data_path(xiaohongshu_file), "w", encoding="utf-8") as f:
+            json.dump(note_data, f, ensure_ascii=False, indent=2)
+
     def _is_local_file(self, path: str) -> bool:
         """判断是否为本地文件路径"""
         if path.startswith('file:///'):
             path = path[8:]  # 移除 file:/// 前缀
         return os.path.exists(path)
 
-    def _copy_local_file(self, file_path: str, temp_dir: str) -> Tuple[str, Dict[str, str]]:
+    def _copy_local_file(self, file_path: str, temp_dir: str) -> Tuple[AudioInput, Dict[str, str]]:
         """处理本地视频文件"""
         try:
             # 如果路径以 file:/// 开头,移除该前缀
@@ -850,61 +1810,107 @@ Markdown格式要求：
                 'title': os.path.splitext(file_name)[0],
                 'uploader': '本地文件',
                 'description': '',
-                'duration': 0,  # 可以用ffmpeg获取实际时长
+                'duration': int(self._probe_duration(target_path)),
                 'platform': 'local'
             }
             
-            print(f"✅ 本地视频文件已复制: {file_name}")
-            return target_path, video_info
+            self._log(f"✅ 本地视频文件已复制: {file_name}", LEVEL_SUCCESS)
+
+            return self._load_audio(target_path, video_info['duration']), video_info
             
         except Exception as e:
-            print(f"⚠️ 处理本地文件失败: {str(e)}")
+            self._log(f"⚠️ 处理本地文件失败: {str(e)}", LEVEL_WARNING)
             return None, None
 
-    def process_video(self, source: str) -> List[str]:
+    def process_video(self, source: str, job_id: Optional[str] = None,
+                      cancel_token: Optional[CancellationToken] = None) -> List[str]:
         """处理视频源(URL或本地文件),生成笔记
         
+        处理过程中的日志、进度和流式文本会以 ProgressEvent 发布到 self.events，
+        结束时发布一条 EVENT_RESULT 事件，payload 为生成的文件列表。
+        
         Args:
             source: 视频URL或本地文件路径
+            job_id: 任务标识，事件中携带该标识以区分同时进行的多个任务，默认自动生成
+            cancel_token: 取消令牌，在其他线程调用 cancel() 后任务会尽快停止：
+                结束 ffmpeg 等子进程、断开进行中的下载和API请求，并删除本任务的临时文件和半成品笔记
         
         Returns:
-            List[str]: 生成的笔记文件路径列表
+            List[str]: 生成的笔记文件路径列表，任务被取消时为空列表
         """
-        print("\n📹 正在处理视频...")
+        job_token = _current_job.set(job_id or uuid.uuid4().hex[:8])
+        stage_token = _current_stage.set(STAGE_JOB)
+        progress_token = _current_progress.set(ProgressTracker())
+        cancel_context = _current_cancel.set(cancel_token or CancellationToken())
+        files = []
+        try:
+            files = self._process_video(source)
+            if files:
+                self._finish_progress()
+            return files
+        except JobCancelled:
+            self._log("⏹️ 任务已取消", LEVEL_WARNING)
+            return files
+        finally:
+            self._publish(EVENT_RESULT, level=LEVEL_SUCCESS if files else LEVEL_ERROR, payload=files)
+            _current_cancel.reset(cancel_context)
+            _current_progress.reset(progress_token)
+            _current_stage.reset(stage_token)
+            _current_job.reset(job_token)
+
+    def _process_video(self, source: str) -> List[str]:
+        """处理单个视频源的完整流程，见 process_video"""
+        self._log("\n📹 正在处理视频...")
         
         # 创建临时目录
-        temp_dir = os.path.join(self.output_dir, 'temp')
+        # 每个任务使用独立的临时目录，多个任务可以同时进行
+        temp_dir = os.path.join(self.output_dir, 'temp', _current_job.get() or uuid.uuid4().hex[:8])
         os.makedirs(temp_dir, exist_ok=True)
+
+        # 统计本任务各阶段的 Token 用量
+        usage_report = TokenUsageReport()
+        usage_token = _current_usage.set(usage_report)
+        timestamp = None
+        written_files = []
+        audio = None
         
         try:
+            self._set_stage(STAGE_DOWNLOAD)
             # 判断是否为本地文件
             if self._is_local_file(source):
-                print("⬇️ 正在处理本地视频文件...")
+                self._log("⬇️ 正在处理本地视频文件...")
                 result = self._copy_local_file(source, temp_dir)
             else:
                 # 处理URL
-                print("⬇️ 正在下载视频...")
+                self._log("⬇️ 正在下载视频...")
                 result = self._download_video(source, temp_dir)
                 
             if not result:
                 return []
                 
-            video_path, video_info = result
-            if not video_path or not video_info:
+            audio, video_info = result
+            # 只保留 audio 一个引用，转录后关闭即可释放长音频的文件映射
+            del result
+            if audio is None or not video_info:
                 return []
                 
-            print(f"✅ 视频下载成功: {video_info['title']}")
+            self._log(f"✅ 视频下载成功: {video_info['title']}", LEVEL_SUCCESS)
+            audio = self._trim_silence(audio)
             
             # 转录音频
-            print("\n🎙️ 正在转录音频...")
-            print("正在转录音频（这可能需要几分钟）...")
-            transcript = self._transcribe_audio(video_path)
+            self._set_stage(STAGE_TRANSCRIBE)
+            self._log("\n🎙️ 正在转录音频...")
+            transcript, segments = self._transcribe_audio(audio)
+            # 关闭长音频的文件映射，临时目录中的 PCM 文件才能被删除
+            self._release_audio(audio)
+            audio = None
             if not transcript:
                 return []
 
             # 保存原始转录内容
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = self._reserve_note_prefix()
             original_file = os.path.join(self.output_dir, f"{timestamp}_original.md")
+            written_files.append(original_file)
             with open(original_file, 'w', encoding='utf-8') as f:
                 f.write(f"# {video_info['title']}\n\n")
                 f.write(f"## 视频信息\n")
@@ -914,11 +1920,18 @@ Markdown格式要求：
                 f.write(f"- 链接：{source}\n\n")
                 f.write(f"## 原始转录内容\n\n")
                 f.write(transcript)
+                if segments:
+                    # 时间为原视频中的位置，去掉的非语音片段不影响对应关系
+                    f.write(f"\n\n## 时间轴\n\n")
+                    for segment in segments:
+                        f.write(f"- [{_format_timestamp(segment['start'])}] {segment['text']}\n")
 
             # 整理长文版本
-            print("\n📝 正在整理长文版本...")
+            self._set_stage(STAGE_ORGANIZE)
+            self._log("\n📝 正在整理长文版本...")
             organized_content = self._organize_long_content(transcript, video_info['duration'])
             organized_file = os.path.join(self.output_dir, f"{timestamp}_organized.md")
+            written_files.append(organized_file)
             with open(organized_file, 'w', encoding='utf-8') as f:
                 f.write(f"# {video_info['title']} - 整理版\n\n")
                 f.write(f"## 视频信息\n")
@@ -930,57 +1943,96 @@ Markdown格式要求：
                 f.write(organized_content)
             
             # 生成小红书版本
-            print("\n📱 正在生成小红书版本...")
+            self._set_stage(STAGE_XIAOHONGSHU)
+            self._log("\n📱 正在生成小红书版本...")
             try:
-                xiaohongshu_content, titles, tags, images = self.convert_to_xiaohongshu(organized_content)
+                # 一拿到配图关键词就在后台开始搜索和下载配图
+                image_future: Optional[Future] = None
+
+                def start_image_fetch(query: str, translate: bool = False) -> None:
+                    nonlocal image_future
+                    if image_future is None and self.unsplash_client and query.strip():
+                        # 复制当前上下文，后台线程中的API调用也计入本任务的用量统计
+                        image_future = self._image_executor.submit(
+                            contextvars.copy_context().run, self._fetch_note_images, query, translate
+                        )
+
+                note = self.generate_xiaohongshu_note(
+                    organized_content,
+                    fetch_images=False,
+                    on_image_keywords=lambda keywords: start_image_fetch(','.join(keywords))
+                )
+                start_image_fetch(*self._image_search_query(note))
+
+                # 如果没有生成的标题就使用视频原标题
+                title = note['title'] or video_info['title']
                 
-                # 保存小红书版本
+                # 先写入不含配图的笔记，配图完成后再补充
                 xiaohongshu_file = os.path.join(self.output_dir, f"{timestamp}_xiaohongshu.md")
-                
-                # 写入文件
-                with open(xiaohongshu_file, "w", encoding="utf-8") as f:
-                    # 写入标题 - 如果没有生成的标题就使用视频原标题
-                    title = titles[0] if titles else video_info['title']
-                    f.write(f"# {title}\n\n")
-                    
-                    # 如果有图片，先写入第一张作为封面
-                    if images:
-                        f.write(f"![封面图]({images[0]})\n\n")
-                    
-                    # 写入正文内容
-                    f.write(xiaohongshu_content)
-                    
-                    # 如果有额外的图片，在文章中间和末尾插入
-                    if len(images) > 1:
-                        f.write(f"\n\n![配图]({images[1]})")
-                    if len(images) > 2:
-                        f.write(f"\n\n![配图]({images[2]})")
-                    
-                    # 写入标签
-                    if tags:
-                        f.write("\n\n---\n")
-                        f.write("\n".join([f"#{tag}" for tag in tags]))
+                written_files.extend([xiaohongshu_file, note_data_path(xiaohongshu_file)])
+                self._write_xiaohongshu_note(xiaohongshu_file, note, title, [])
+
+                if image_future is not None:
+                    # 取消时尚未开始的配图任务直接撤销，已开始的会因连接关闭而中断
+                    try:
+                        with on_cancel(self._cancel_token(), image_future.cancel):
+                            images = image_future.result(timeout=120)
+                        if images:
+                            self._log(f"✅ 成功获取{len(images)}张配图", LEVEL_SUCCESS)
+                            self._write_xiaohongshu_note(xiaohongshu_file, note, title, images)
+                        else:
+                            self._log("⚠️ 未找到相关配图", LEVEL_WARNING)
+                    except Exception as e:
+                        self._check_cancelled()
+                        self._log(f"⚠️ 获取配图失败: {str(e)}", LEVEL_WARNING)
                         
-                print(f"\n✅ 小红书版本已保存至: {xiaohongshu_file}")
+                self._log(f"\n✅ 小红书版本已保存至: {xiaohongshu_file}", LEVEL_SUCCESS)
                 return [original_file, organized_file, xiaohongshu_file]
                 
             except Exception as e:
-                print(f"⚠️ 生成小红书版本失败: {str(e)}")
+                self._log(f"⚠️ 生成小红书版本失败: {str(e)}", LEVEL_WARNING)
                 import traceback
-                print(f"错误详情:\n{traceback.format_exc()}")
+                self._log(f"错误详情:\n{traceback.format_exc()}", LEVEL_ERROR)
             
-            print(f"\n✅ 笔记已保存至: {original_file}")
-            print(f"✅ 整理版内容已保存至: {organized_file}")
+            self._log(f"\n✅ 笔记已保存至: {original_file}", LEVEL_SUCCESS)
+            self._log(f"✅ 整理版内容已保存至: {organized_file}", LEVEL_SUCCESS)
             return [original_file, organized_file]
             
         except Exception as e:
-            print(f"⚠️ 处理视频时出错: {str(e)}")
+            self._log(f"⚠️ 处理视频时出错: {str(e)}", LEVEL_WARNING)
             return []
+
+        except JobCancelled:
+            # 删除已写入的半成品笔记，不留下不完整的结果
+            for file_path in written_files:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            raise
         
         finally:
-            # 清理临时文件
+            _current_usage.reset(usage_token)
+            if timestamp and usage_report.stages:
+                self._write_usage_report(timestamp, usage_report)
+
+            # 清理临时文件；出错或取消时音频可能还没有释放
+            if audio is not None:
+                self._release_audio(audio)
+                audio = None
             if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                if os.path.exists(temp_dir):
+                    # 文件仍被占用时只提示，不影响任务结果
+                    self._log(f"⚠️ 无法完全删除临时目录（文件仍被占用）: {temp_dir}", LEVEL_WARNING)
+
+    def _write_usage_report(self, timestamp: str, usage_report: TokenUsageReport) -> None:
+        """打印并保存本任务的 Token 用量报告"""
+        self._log(f"🧾 Token 用量: {usage_report.summary()}")
+        usage_file = os.path.join(self.log_dir, f"{timestamp}_usage.json")
+        try:
+            with open(usage_file, 'w', encoding='utf-8') as f:
+                json.dump(usage_report.to_dict(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self._log(f"⚠️ 保存 Token 用量报告失败: {str(e)}", LEVEL_WARNING)
 
     def process_markdown_file(self, input_file: str) -> None:
         """处理markdown文件，生成优化后的笔记
@@ -989,111 +2041,450 @@ Markdown格式要求：
             input_file (str): 输入的markdown文件路径
         """
         try:
-            # 读取markdown文件
-            with open(input_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 提取视频链接
-            video_links = re.findall(r'https?://(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/|bilibili\.com/video/|douyin\.com/video/)[^\s\)]+', content)
+            # 逐行读取并提取视频链接，与批量处理使用同一套提取和去重规则
+            video_links = dedupe_sources(iter_urls(_iter_text_lines(input_file)), ShortLinkResolver())
             
             if not video_links:
-                print("未在markdown文件中找到视频链接")
+                self._log("未在markdown文件中找到视频链接")
                 return
                 
-            print(f"找到 {len(video_links)} 个视频链接，开始处理...\n")
+            self._log(f"找到 {len(video_links)} 个视频链接，开始处理...\n")
             
             # 处理每个视频链接
             for i, url in enumerate(video_links, 1):
-                print(f"处理第 {i}/{len(video_links)} 个视频: {url}\n")
+                self._log(f"处理第 {i}/{len(video_links)} 个视频: {url}\n")
                 self.process_video(url)
                 
         except Exception as e:
-            print(f"处理markdown文件时出错: {str(e)}")
+            self._log(f"处理markdown文件时出错: {str(e)}", LEVEL_ERROR)
             raise
 
+def image_cache_name(url: str) -> str:
+    """根据图片URL生成稳定的本地文件名，跨进程、跨运行保持一致"""
+    return f"image_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.jpg"
+
+
+def note_data_path(xiaohongshu_file: str) -> str:
+    """返回小红书笔记对应的结构化数据文件路径"""
+    return os.path.splitext(xiaohongshu_file)[0] + '.json'
+
+
 def extract_urls_from_text(text: str) -> list:
     """
     从文本中提取所有有效的URL
     支持的URL格式：
     - 视频平台URL (YouTube, Bilibili, 抖音等)
     - 包含http://或https://的标准URL
-    - 短链接URL (如t.co等)
+    - 单独的BV号和省略协议的抖音短链接
+    
+    大文件请直接用 video_urls.iter_urls 逐行提取。
     
     Args:
         text: 输入文本
         
     Returns:
-        list: 提取到的有效URL列表
+        list: 提取到的有效URL列表，按字符串去重并保持顺序
     """
-    # URL正则模式
-    url_patterns = [
-        # 标准URL
-        r'https?://[^\s<>\[\]"\']+[^\s<>\[\]"\'.,]',
-        # 短链接
-        r'https?://[a-zA-Z0-9]+\.[a-zA-Z]{2,3}/[^\s<>\[\]"\']+',
-        # Bilibili
-        r'BV[a-zA-Z0-9]{10}',
-        # 抖音分享链接
-        r'v\.douyin\.com/[a-zA-Z0-9]+',
-    ]
+    seen = set()
+    return [url for url in iter_urls(text.splitlines()) if not (url in seen or seen.add(url))]
+
+
+# 批量处理命令行的退出码
+EXIT_OK = 0            # 所有任务都已成功
+EXIT_FAILED = 1        # 至少一个任务失败
+EXIT_USAGE = 2         # 参数错误或没有可处理的视频源
+EXIT_PARTIAL = 3       # 没有任务失败，但部分任务未生成小红书笔记
+EXIT_INTERRUPTED = 130
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.flv')
+SHORT_LINK_CACHE_FILE = '.short_links.json'
+
+
+def _iter_text_lines(path: str) -> Iterator[str]:
+    """逐行读取文本文件，每行先按 UTF-8 解码，失败时按 GBK 解码"""
+    with open(path, 'rb') as f:
+        for raw_line in f:
+            try:
+                yield raw_line.decode('utf-8')
+            except UnicodeDecodeError:
+                yield raw_line.decode('gbk', errors='replace')
+
+
+def collect_sources(inputs: List[str], resolver: Optional[ShortLinkResolver] = None) -> List[str]:
+    """把命令行输入展开为视频源列表
     
-    urls = []
-    for pattern in url_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            url = match.group()
-            # 对于不完整的BV号，添加完整的bilibili前缀
-            if url.startswith('BV'):
-                url = f'https://www.bilibili.com/video/{url}'
-            urls.append(url)
+    - 本地视频文件：直接处理
+    - 目录：处理其中的所有视频文件
+    - 其他文件（链接列表、Markdown 等）：提取其中的视频链接
+    - "-"：从标准输入读取文本并提取链接
+    - 其余输入视为视频链接
     
-    # 去重并保持顺序
-    seen = set()
-    return [url for url in urls if not (url in seen or seen.add(url))]
+    视频链接会被规范化，同一视频的不同写法（短链接、youtu.be、带时间戳或分P参数等）只保留一个。
+    
+    Args:
+        inputs: 命令行输入
+        resolver: 短链接解析器，默认新建一个仅在内存中缓存的解析器
+    
+    Returns:
+        List[str]: 去重后的视频源，保持输入顺序
+    """
+    return dedupe_sources(_iter_input_sources(inputs), resolver or ShortLinkResolver())
+
+
+def _iter_input_sources(inputs: List[str]) -> Iterator[str]:
+    """按 collect_sources 的规则逐个产出视频源，文本输入逐行读取，不整体载入内存"""
+    for item in inputs:
+        if item == '-':
+            yield from iter_urls(sys.stdin)
+        elif os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(item, name))
+        elif os.path.isfile(item):
+            if item.lower().endswith(VIDEO_EXTENSIONS):
+                yield os.path.abspath(item)
+            else:
+                yield from iter_urls(_iter_text_lines(item))
+        else:
+            yield item
+
+
+class BatchJobRecord:
+    """批量处理中一个任务的结果，由该任务的进度事件汇总而来"""
+
+    def __init__(self, source: str):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.source = source
+        self.worker = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stages: Dict[str, float] = {}
+        self.files: List[str] = []
+        self.error = None
+        self.finished = False
+        # 预检结果（见 preflight.py），未预检时为 None
+        self.probe: Optional[ProbeResult] = None
+        self.skipped = False
+        self._stage = None
+        self._stage_started = None
+
+    def add_event(self, event: ProgressEvent) -> None:
+        """按事件的阶段和时间戳累计各阶段耗时"""
+        if event.stage != self._stage:
+            self._close_stage(event.timestamp)
+            self._stage = event.stage
+            self._stage_started = event.timestamp
+        if event.kind == EVENT_LOG and event.level in (LEVEL_WARNING, LEVEL_ERROR):
+            self.error = event.message
+        elif event.kind == EVENT_RESULT:
+            self._close_stage(event.timestamp)
+            self.files = list(event.payload or [])
+            self.finished_at = event.timestamp
+            self.finished = True
+
+    def fail(self, error: str) -> None:
+        """任务未能正常结束（进程崩溃等）"""
+        self._close_stage(time.time())
+        self.error = error
+        self.finished_at = time.time()
+        self.finished = True
+
+    def skip(self, reason: str) -> None:
+        """任务未执行，按用户设置跳过（如超过时长上限）"""
+        self.fail(reason)
+        self.skipped = True
+
+    def _close_stage(self, timestamp: float) -> None:
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + timestamp - self._stage_started
+            self._stage = None
+
+    @property
+    def status(self) -> str:
+        if self.skipped:
+            return 'skipped'
+        if any(path.endswith('_xiaohongshu.md') for path in self.files):
+            return 'succeeded'
+        return 'partial' if self.files else 'failed'
+
+    def to_dict(self) -> Dict:
+        finished_at = self.finished_at or time.time()
+        return {
+            'job_id': self.job_id,
+            'source': self.source,
+            'status': self.status,
+            'worker': self.worker,
+            'started_at': self.started_at,
+            'finished_at': finished_at,
+            'duration': round(finished_at - self.started_at, 2),
+            'stages': {stage: round(seconds, 2) for stage, seconds in self.stages.items()},
+            'artifacts': self.files,
+            'error': None if self.status == 'succeeded' else self.error,
+            'probe': self.probe.to_dict() if self.probe else None,
+        }
 
 
-if __name__ == '__main__':
-    generator = VideoNoteGenerator()
-    generator.process_video(f"file:////Users/bd/Downloads/01e6d.MP4")
-
-
-    # import sys, os, re
-    # import argparse
-    #
-    # parser = argparse.ArgumentParser(description='视频笔记生成器')
-    # parser.add_argument('input', help='输入源：视频URL、本地视频文件、包含URL的文件或markdown文件')
-    # parser.add_argument('--xiaohongshu', action='store_true', help='生成小红书风格的笔记')
-    # args = parser.parse_args()
-    #
-    # generator = VideoNoteGenerator()
-    #
-    # if os.path.exists(args.input):
-    #     # 检查是否是视频文件
-    #     if args.input.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.flv')):
-    #         print(f"🎥 处理本地视频文件: {args.input}")
-    #         generator.process_video(f"file:///{os.path.abspath(args.input)}")
-    #     # 处理markdown文件
-    #     elif args.input.endswith('.md'):
-    #         print(f"📝 处理Markdown文件: {args.input}")
-    #         generator.process_markdown_file(args.input)
-    #     else:
-    #         # 从文件内容中提取URL
-    #         try:
-    #             with open(args.input, 'r', encoding='utf-8') as f:
-    #                 content = f.read()
-    #         except UnicodeDecodeError:
-    #             with open(args.input, 'r', encoding='gbk') as f:
-    #                 content = f.read()
-    #
-    #         urls = extract_urls_from_text(content)
-    #
-    #         if not urls:
-    #             print("⚠️ 未在文件中找到有效的URL")
-    #             sys.exit(1)
-    #
-    #         for url in urls:
-    #             generator.process_video(url)
-    # else:
-    #     # 直接处理URL
-    #     generator.process_video(args.input)
+def _run_batch_in_process(sources: List[str], output_dir: str, emit: Callable[[BatchJobRecord], None],
+                          quiet: bool = False) -> List[BatchJobRecord]:
+    """在当前进程中依次处理所有视频源"""
+    generator = VideoNoteGenerator(output_dir=output_dir)
+    if not quiet:
+        generator.events.subscribe(ConsoleProgressPrinter())
+    records: Dict[str, BatchJobRecord] = {}
+
+    def on_event(event: ProgressEvent) -> None:
+        record = records.get(event.job_id)
+        if record is not None:
+            record.add_event(event)
+
+    generator.events.subscribe(on_event)
+    for source in sources:
+        record = BatchJobRecord(source)
+        record.worker = os.getpid()
+        records[record.job_id] = record
+        try:
+            generator.process_video(source, job_id=record.job_id)
+        except Exception as e:
+            record.fail(str(e))
+        if not record.finished:
+            record.fail("任务未返回结果")
+        emit(record)
+    return list(records.values())
+
+
+class _BatchWorker:
+    """批量处理使用的 worker 进程（见 worker.py），每次只处理一个任务"""
+
+    def __init__(self, output_dir: str, messages: 'queue.Queue', quiet: bool = False):
+        self.process = subprocess.Popen(
+            [sys.executable, '-u', WORKER_SCRIPT, '--output-dir', output_dir, '--max-jobs', '1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL if quiet else None,
+            text=True, encoding='utf-8'
+        )
+        self.record: Optional[BatchJobRecord] = None
+        # 当前任务还在下载阶段时为其所属平台，见 _run_batch_workers
+        self.downloading: Optional[str] = None
+        threading.Thread(target=self._read, args=(messages,), daemon=True).start()
+
+    def _read(self, messages: 'queue.Queue') -> None:
+        for line in self.process.stdout:
+            try:
+                messages.put((self, json.loads(line)))
+            except json.JSONDecodeError:
+                continue
+        # 标准输出关闭说明进程已退出
+        messages.put((self, None))
+
+    def submit(self, record: BatchJobRecord) -> None:
+        self.record = record
+        record.worker = self.process.pid
+        record.started_at = time.time()
+        self.process.stdin.write(json.dumps({'type': 'submit', 'job_id': record.job_id,
+                                             'source': record.source}, ensure_ascii=False) + '\n')
+        self.process.stdin.flush()
+
+    def close(self, timeout: float = 30) -> None:
+        """关闭标准输入通知 worker 退出，超时则强制结束"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def _run_batch_workers(sources: List[str], workers: int, output_dir: str,
+                       emit: Callable[[BatchJobRecord], None], quiet: bool = False) -> List[BatchJobRecord]:
+    """启动多个 worker 进程并行处理，空闲的 worker 依次领取下一个视频源
 
+    分配任务时遵守各平台的并发下载上限：某个平台还在下载的任务已达上限时，
+    空闲的 worker 先领取其他平台的视频源或本地文件，没有可领取的就等待有任务下载完成。
+    """
+    messages: 'queue.Queue' = queue.Queue()
+    pending = list(reversed(sources))
+    records: List[BatchJobRecord] = []
+    printer = None if quiet else ConsoleProgressPrinter()
+    limits = platform_limits()
+    # 各平台还在下载阶段的任务数
+    downloading: Dict[str, int] = {}
+
+    def next_source() -> Optional[int]:
+        """按顺序找到第一个所属平台还有下载名额的视频源，返回其在 pending 中的位置"""
+        for index in range(len(pending) - 1, -1, -1):
+            key = video_key(pending[index])
+            if key is None or downloading.get(key[0], 0) < limits.get(key[0], DEFAULT_LIMIT):
+                return index
+        return None
+
+    def dispatch(worker: _BatchWorker) -> None:
+        index = next_source() if pending else None
+        if index is None:
+            return
+        record = BatchJobRecord(pending.pop(index))
+        records.append(record)
+        key = video_key(record.source)
+        if key is not None:
+            worker.downloading = key[0]
+            downloading[key[0]] = downloading.get(key[0], 0) + 1
+        try:
+            worker.submit(record)
+        except OSError as e:
+            # worker 已退出，稍后会收到它的退出消息
+            record.fail(f"提交任务失败: {str(e)}")
+
+    def download_finished(worker: _BatchWorker) -> None:
+        """worker 的任务离开下载阶段，归还平台名额并把等待中的视频源分给空闲的 worker"""
+        if worker.downloading is None:
+            return
+        downloading[worker.downloading] -= 1
+        worker.downloading = None
+        for idle in pool:
+            if idle.record is None and idle.process.poll() is None:
+                dispatch(idle)
+
+    pool = [_BatchWorker(output_dir, messages, quiet) for _ in range(min(workers, len(sources)))]
+    try:
+        for worker in pool:
+            dispatch(worker)
+        while any(worker.record is not None for worker in pool):
+            worker, message = messages.get()
+            if message is None:
+                # worker 意外退出：当前任务记为失败，换一个新的 worker 继续
+                pool.remove(worker)
+                if worker.record is not None:
+                    worker.record.fail(f"worker进程意外退出（退出码 {worker.process.wait()}）")
+                    emit(worker.record)
+                    worker.record = None
+                download_finished(worker)
+                if pending:
+                    replacement = _BatchWorker(output_dir, messages, quiet)
+                    pool.append(replacement)
+                    dispatch(replacement)
+                continue
+            if message.get('type') != 'event':
+                continue
+            event = ProgressEvent.from_dict(message['event'])
+            record = worker.record
+            if record is None or event.job_id != record.job_id:
+                continue
+            if printer is not None:
+                printer(event)
+            record.add_event(event)
+            if event.kind == EVENT_RESULT:
+                emit(record)
+                worker.record = None
+                if worker.downloading is not None:
+                    download_finished(worker)
+                else:
+                    dispatch(worker)
+            elif event.stage not in (None, STAGE_JOB, STAGE_DOWNLOAD):
+                download_finished(worker)
+    finally:
+        for worker in pool:
+            worker.close()
+    return records
+
+
+def _preflight_sources(sources: List[str], args: argparse.Namespace, probes: Dict[str, ProbeResult],
+                       emit: Callable[[BatchJobRecord], None], records: List[BatchJobRecord]) -> List[str]:
+    """预检所有视频源：失效链接和超过时长上限的视频直接记为失败或跳过，其余按时长从长到短排序"""
+    print(f"🔎 正在预检 {len(sources)} 个视频源...", file=sys.stderr)
+    results = probe_sources(sources, workers=args.probe_workers)
+    max_seconds = args.max_duration * 60 if args.max_duration else None
+    runnable = []
+    for result in results:
+        probes[result.source] = result
+        if result.available and not (max_seconds and result.duration and result.duration > max_seconds):
+            runnable.append(result)
+            continue
+        record = BatchJobRecord(result.source)
+        if not result.available:
+            print(f"⚠️ 跳过不可用的视频: {result.source}（{result.error}）", file=sys.stderr)
+            record.fail(f"预检失败: {result.error}")
+        else:
+            print(f"⏭️ 跳过时长 {format_duration(result.duration)} 的视频: {result.source}", file=sys.stderr)
+            record.skip(f"视频时长超过 {args.max_duration:g} 分钟")
+        records.append(record)
+        emit(record)
+    return [result.source for result in longest_first(runnable)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """批量处理命令行入口，返回退出码
+    
+    标准输出上每个任务输出一行 JSON 记录（NDJSON），处理日志和进度输出到标准错误。
+    """
+    parser = argparse.ArgumentParser(description='视频笔记生成器：批量处理视频链接、本地视频、链接列表和Markdown文件')
+    parser.add_argument('inputs', nargs='+',
+                        help='视频URL、本地视频文件或目录、包含链接的文本或Markdown文件，"-" 表示从标准输入读取链接')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='并行的worker进程数，为1时在当前进程中依次处理（默认1）')
+    parser.add_argument('-o', '--output-dir', default='temp_notes', help='笔记输出目录（默认 temp_notes）')
+    parser.add_argument('--report', help='把任务记录追加写入该文件，而不是输出到标准输出')
+    parser.add_argument('-q', '--quiet', action='store_true', help='不输出处理日志和进度')
+    parser.add_argument('--no-probe', action='store_true',
+                        help='不做预检，按输入顺序直接处理（默认先并行获取视频信息，跳过失效链接并优先处理长视频）')
+    parser.add_argument('--probe-workers', type=int, default=8, help='并行预检的线程数（默认8）')
+    parser.add_argument('--max-duration', type=float,
+                        help='跳过时长超过该值（分钟）的视频')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers 必须大于0')
+    if args.probe_workers < 1:
+        parser.error('--probe-workers 必须大于0')
+
+    # 短链接解析结果缓存在输出目录中，重复运行同一批链接时无需再次请求
+    resolver = ShortLinkResolver(os.path.join(args.output_dir, SHORT_LINK_CACHE_FILE))
+    sources = collect_sources(args.inputs, resolver)
+    if not sources:
+        print("⚠️ 未找到可处理的视频源", file=sys.stderr)
+        return EXIT_USAGE
+
+    report = open(args.report, 'a', encoding='utf-8') if args.report else sys.stdout
+    # 标准输出只用于任务记录，处理过程中的 print 输出一律转到标准错误
+    original_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8') if args.quiet else sys.stderr
+
+    probes: Dict[str, ProbeResult] = {}
+
+    def emit(record: BatchJobRecord) -> None:
+        record.probe = probes.get(record.source)
+        report.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+        report.flush()
+
+    records: List[BatchJobRecord] = []
+    try:
+        if not args.no_probe:
+            sources = _preflight_sources(sources, args, probes, emit, records)
+        print(f"📋 共 {len(sources)} 个视频源，使用 {args.workers} 个worker处理", file=sys.stderr)
+        if sources and args.workers == 1:
+            records += _run_batch_in_process(sources, args.output_dir, emit, args.quiet)
+        elif sources:
+            records += _run_batch_workers(sources, args.workers, args.output_dir, emit, args.quiet)
+    except KeyboardInterrupt:
+        print("\n⏹️ 已中断", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+        sys.stdout = original_stdout
+        if args.report:
+            report.close()
+
+    statuses = [record.status for record in records]
+    print(f"\n📊 完成 {len(records)} 个任务：成功 {statuses.count('succeeded')}，"
+          f"部分完成 {statuses.count('partial')}，失败 {statuses.count('failed')}，"
+          f"跳过 {statuses.count('skipped')}", file=sys.stderr)
+    if 'failed' in statuses:
+        return EXIT_FAILED
+    if 'partial' in statuses:
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     video_urls
+   说明：          视频链接规范化与去重
+
+   同一个视频可能以多种形式出现：youtu.be/X、youtube.com/watch?v=X&t=30、BV1xx、
+   bilibili.com/video/BV1xx?p=1、v.douyin.com 短链接……
+   这里把各平台的链接统一解析为 (平台, 视频ID, 分P) 三元组，并生成规范链接，
+   批量处理前据此去重，同一个视频在一批任务中只下载、转录一次。
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+# (平台, 视频ID, 分P)，没有分P概念的平台分P为 1
+VideoKey = Tuple[str, str, int]
+
+# 需要先请求一次、跟随跳转才能得到真实地址的短链接域名
+SHORT_LINK_HOSTS = ('v.douyin.com', 'b23.tv')
+
+_YOUTUBE_ID = r'([A-Za-z0-9_-]{11})'
+_YOUTUBE_PATH_PATTERNS = [
+    re.compile(r'^/(?:shorts|embed|live|v)/' + _YOUTUBE_ID),
+]
+_BILIBILI_ID = re.compile(r'(BV[A-Za-z0-9]{10}|av\d+)', re.IGNORECASE)
+_DOUYIN_ID = re.compile(r'/(?:video|note|share/video)/(\d+)')
+
+# 从文本中提取链接的单一正则，按顺序尝试：
+# 1. 带协议的链接，只匹配 ASCII 字符，分享文案中紧跟的中文不会被并入链接
+# 2. 单独出现的 BV 号
+# 3. 省略协议的抖音短链接
+URL_PATTERN = re.compile(
+    r"(?P<url>(?i:https?)://[A-Za-z0-9\-._~:/?#@!$&*+,;=%()]+)"
+    r"|(?<![A-Za-z0-9])(?P<bvid>BV[A-Za-z0-9]{10})(?![A-Za-z0-9])"
+    r"|(?<![\w./])(?P<short>(?i:v\.douyin\.com)/[A-Za-z0-9]+/?)"
+)
+_TRAILING_PUNCTUATION = '.,;:!?*'
+
+
+def _host(parts) -> str:
+    host = (parts.hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def video_key(url: str) -> Optional[VideoKey]:
+    """解析视频链接，返回 (平台, 视频ID, 分P)；无法识别的链接返回 None
+
+    短链接需要先用 ShortLinkResolver 解析为真实地址。
+    """
+    url = url.strip()
+    if re.fullmatch(r'BV[A-Za-z0-9]{10}', url):
+        return 'bilibili', url, 1
+    if not re.match(r'https?://', url, re.IGNORECASE):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    host = _host(parts)
+    query = parse_qs(parts.query)
+
+    if host in ('youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com'):
+        video_id = (query.get('v') or [''])[0]
+        if not re.fullmatch(_YOUTUBE_ID, video_id):
+            video_id = next((match.group(1) for pattern in _YOUTUBE_PATH_PATTERNS
+                             if (match := pattern.match(parts.path))), '')
+        return ('youtube', video_id, 1) if video_id else None
+    if host == 'youtu.be':
+        match = re.match('^/' + _YOUTUBE_ID, parts.path)
+        return ('youtube', match.group(1), 1) if match else None
+
+    if host in ('bilibili.com', 'm.bilibili.com'):
+        match = _BILIBILI_ID.search(parts.path)
+        if not match:
+            return None
+        video_id = match.group(1)
+        # BV号区分大小写，只有前缀统一为大写；av号统一为小写
+        video_id = 'BV' + video_id[2:] if video_id[:2].upper() == 'BV' else video_id.lower()
+        try:
+            part = max(int((query.get('p') or ['1'])[0]), 1)
+        except ValueError:
+            part = 1
+        return 'bilibili', video_id, part
+
+    if host in ('douyin.com', 'iesdouyin.com', 'm.douyin.com'):
+        match = _DOUYIN_ID.search(parts.path)
+        if match:
+            return 'douyin', match.group(1), 1
+        # 精选页等以 modal_id 参数指定视频
+        modal_id = (query.get('modal_id') or [''])[0]
+        return ('douyin', modal_id, 1) if modal_id.isdigit() else None
+
+    return None
+
+
+def canonical_url(key: VideoKey) -> str:
+    """根据 (平台, 视频ID, 分P) 生成规范链接"""
+    platform, video_id, part = key
+    if platform == 'youtube':
+        return f"https://www.youtube.com/watch?v={video_id}"
+    if platform == 'bilibili':
+        url = f"https://www.bilibili.com/video/{video_id}"
+        return f"{url}?p={part}" if part > 1 else url
+    if platform == 'douyin':
+        return f"https://www.douyin.com/video/{video_id}"
+    raise ValueError(f"未知的平台: {platform}")
+
+
+def is_short_link(url: str) -> bool:
+    if not re.match(r'https?://', url, re.IGNORECASE):
+        url = 'https://' + url
+    return _host(urlsplit(url)) in SHORT_LINK_HOSTS
+
+
+def _normalize_short_link(url: str) -> str:
+    """统一短链接的写法（协议、大小写、末尾斜杠），未解析时也能按字符串去重"""
+    if not re.match(r'https?://', url, re.IGNORECASE):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    return f"https://{_host(parts)}{parts.path.rstrip('/')}/"
+
+
+class ShortLinkResolver:
+    """解析 v.douyin.com、b23.tv 等短链接，结果缓存在内存中，可选持久化到 JSON 文件
+
+    同一短链接在进程内（以及指定缓存文件时跨运行）只请求一次。
+    """
+
+    def __init__(self, cache_file: Optional[str] = None, timeout: float = 10):
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._cache: Dict[str, str] = {}
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                self._cache = {}
+
+    def resolve(self, url: str) -> str:
+        """返回短链接跳转后的地址，请求失败时原样返回"""
+        url = _normalize_short_link(url)
+        with self._lock:
+            if url in self._cache:
+                return self._cache[url]
+        resolved = self._follow(url)
+        if resolved == url:
+            return url
+        with self._lock:
+            self._cache[url] = resolved
+            self._save()
+        return resolved
+
+    def _follow(self, url: str) -> str:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_2_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.0.3 Mobile/15E148 Safari/604.1'
+        }
+        try:
+            with httpx.Client(follow_redirects=True, timeout=self.timeout, headers=headers, verify=False) as client:
+                # 只需要跳转后的地址，用流式请求避免下载页面内容
+                with client.stream('GET', url) as response:
+                    return str(response.url)
+        except httpx.HTTPError:
+            return url
+
+    def _save(self) -> None:
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            partial_path = self.cache_file + '.part'
+            with open(partial_path, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, ensure_ascii=False, indent=2)
+            os.replace(partial_path, self.cache_file)
+        except OSError:
+            pass
+
+
+def canonicalize(url: str, resolver: Optional[ShortLinkResolver] = None) -> str:
+    """把视频链接转换为规范链接；短链接仅在提供 resolver 时解析，无法识别的链接原样返回"""
+    if is_short_link(url):
+        url = resolver.resolve(url) if resolver is not None else _normalize_short_link(url)
+    key = video_key(url)
+    return canonical_url(key) if key else url
+
+
+def _trim_url(url: str) -> str:
+    """去掉链接末尾的标点和不成对的右括号（如 Markdown 的 [标题](链接)）"""
+    while url:
+        if url[-1] in _TRAILING_PUNCTUATION:
+            url = url[:-1]
+        elif url[-1] == ')' and url.count(')') > url.count('('):
+            url = url[:-1]
+        else:
+            break
+    return url
+
+
+def iter_urls(lines: Iterable[str]) -> Iterator[str]:
+    """逐行提取链接，按出现顺序产出，不做去重
+
+    输入可以是打开的文件对象等任意行迭代器，内存占用与输入大小无关。
+    """
+    for line in lines:
+        for match in URL_PATTERN.finditer(line):
+            if match.group('url'):
+                url = _trim_url(match.group('url'))
+                if '://' in url and not url.endswith('://'):
+                    yield url
+            elif match.group('bvid'):
+                yield f"https://www.bilibili.com/video/{match.group('bvid')}"
+            else:
+                yield 'https://' + match.group('short')
+
+
+def iter_unique_sources(sources: Iterable[str],
+                        resolver: Optional[ShortLinkResolver] = None) -> Iterator[str]:
+    """规范化并去重视频源，边读边产出，保持首次出现的顺序
+
+    本地文件按真实路径去重，视频链接按 (平台, 视频ID, 分P) 去重并替换为规范链接。
+    只记录已出现的键，内存占用与不同来源的数量成正比，与输入大小无关。
+    """
+    seen = set()
+    # 原样重复出现的字符串直接跳过，不再解析和访问文件系统
+    seen_raw = set()
+    for source in sources:
+        source = source.strip()
+        if not source or source in seen_raw:
+            continue
+        seen_raw.add(source)
+        if '://' not in source and os.path.exists(source):
+            key = ('file', os.path.realpath(source))
+        else:
+            source = canonicalize(source, resolver)
+            key = video_key(source) or ('url', source)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield source
+
+
+def dedupe_sources(sources: Iterable[str], resolver: Optional[ShortLinkResolver] = None) -> List[str]:
+    """规范化并去重视频源，返回列表"""
+    return list(iter_unique_sources(sources, resolver))
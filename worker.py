@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+   File Name：     worker
+   说明：          独立的笔记处理进程
+
+   GUI 可以把任务交给独立的 worker 进程处理：转录占用的 CPU 和 GIL 不再影响界面线程，
+   Whisper 模型在多个任务之间保持加载，worker 崩溃也不会带走窗口。
+
+   协议：标准输入和标准输出上逐行传递 UTF-8 编码的 JSON。
+   命令（标准输入）：
+       {"type": "submit", "job_id": "...", "source": "..."}
+       {"type": "cancel", "job_id": "..."}
+       {"type": "shutdown"}
+   消息（标准输出）：
+       {"type": "ready", "pid": 1234}
+       {"type": "event", "event": ProgressEvent.to_dict() 的结果}
+   任务结束时会收到 kind 为 result 的事件，payload 为生成的文件列表。
+   标准输入关闭等同于 shutdown；处理过程中的 print 输出一律转到标准错误。
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from cancellation import CancellationToken
+from events import ProgressEvent
+
+# 启动 worker 进程的命令行，供 GUI 等调用方使用
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+class WorkerServer:
+    """读取命令、执行任务并把事件写回调用方"""
+
+    def __init__(self, generator, output, max_jobs: int = 4):
+        self.generator = generator
+        self._output = output
+        self._write_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='worker-job')
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._tokens_lock = threading.Lock()
+        generator.events.subscribe(self._send_event)
+
+    def send(self, message: Dict) -> None:
+        """写出一行消息，调用方已退出时静默忽略"""
+        line = json.dumps(message, ensure_ascii=False) + '\n'
+        with self._write_lock:
+            try:
+                self._output.write(line)
+                self._output.flush()
+            except (BrokenPipeError, ValueError):
+                pass
+
+    def _send_event(self, event: ProgressEvent) -> None:
+        self.send({'type': 'event', 'event': event.to_dict()})
+
+    def submit(self, job_id: str, source: str) -> None:
+        """在后台线程中处理一个视频源"""
+        token = CancellationToken()
+        with self._tokens_lock:
+            self._tokens[job_id] = token
+        self._executor.submit(self._run_job, job_id, source, token)
+
+    def _run_job(self, job_id: str, source: str, token: CancellationToken) -> None:
+        try:
+            # 结束时 process_video 会发布 result 事件，无需另行通知
+            self.generator.process_video(source, job_id=job_id, cancel_token=token)
+        except Exception as e:
+            print(f"❌ 任务 {job_id} 出错: {str(e)}", file=sys.stderr)
+        finally:
+            with self._tokens_lock:
+                self._tokens.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> None:
+        """取消一个任务"""
+        with self._tokens_lock:
+            token = self._tokens.get(job_id)
+        if token is not None:
+            token.cancel()
+
+    def cancel_all(self) -> None:
+        """取消所有进行中的任务"""
+        with self._tokens_lock:
+            tokens = list(self._tokens.values())
+        for token in tokens:
+            token.cancel()
+
+    def serve(self, input_stream) -> None:
+        """逐行处理命令，直到收到 shutdown 或输入关闭"""
+        self.send({'type': 'ready', 'pid': os.getpid()})
+        for line in input_stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                command = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ 无法解析的命令: {line}", file=sys.stderr)
+                continue
+            command_type = command.get('type')
+            if command_type == 'submit':
+                self.submit(command['job_id'], command['source'])
+            elif command_type == 'cancel':
+                self.cancel(command['job_id'])
+            elif command_type == 'shutdown':
+                break
+        self.cancel_all()
+        self._executor.shutdown(wait=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='视频笔记处理进程，通过标准输入输出与调用方通信')
+    parser.add_argument('--output-dir', default='temp_notes', help='笔记输出目录')
+    parser.add_argument('--max-jobs', type=int, default=4, help='同时处理的任务数上限')
+    args = parser.parse_args()
+
+    # 标准输出只用于协议消息，处理过程中的 print 输出转到标准错误
+    protocol_output = sys.stdout
+    protocol_output.reconfigure(encoding='utf-8')
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout = sys.stderr
+
+    from video_note_generator import VideoNoteGenerator
+    generator = VideoNoteGenerator(output_dir=args.output_dir)
+    WorkerServer(generator, protocol_output, max_jobs=args.max_jobs).serve(sys.stdin)
+
+
+if __name__ == '__main__':
+    main()